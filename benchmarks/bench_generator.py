@@ -0,0 +1,126 @@
+"""Overhead of the generated send_* and on_* wrappers of the charge points
+
+The call to the CSMS is replaced by a canned response, so the time measured is
+the time spent in the wrappers of ``generate_protocol`` for each message. Each
+wrapper is measured against ``previous_*``, the wrappers as generated before
+the dispatch was resolved once per action, which computed the names of the
+get_* methods with a regex and rebuilt the request from asdict on every
+message::
+
+    python benchmarks/bench_generator.py
+"""
+
+import asyncio
+import re
+import time
+from dataclasses import asdict
+from typing import Coroutine
+
+from ocpp.v16 import call, call_result
+
+from elu.twin.charge_point.charge_point.v16.charge_point import ChargePointBase
+from elu.twin.charge_point.metrics import OCPP_MESSAGES
+
+MESSAGES = 50_000
+
+METER_VALUE = [
+    {
+        "timestamp": "2024-01-01T00:00:00+00:00",
+        "sampled_value": [
+            {"value": "1000", "measurand": "Energy.Active.Import.Register"},
+            {"value": "11000", "measurand": "Power.Active.Import"},
+            {"value": "50", "measurand": "SoC"},
+        ],
+    }
+]
+
+
+DATA_TRANSFER_RESULT = call_result.DataTransferPayload(status="Accepted")
+
+
+class BenchChargePoint(ChargePointBase):
+    def get_connection_processes(self) -> list[Coroutine]:
+        return []
+
+    def get_session_processes(self) -> list[Coroutine]:
+        return []
+
+    async def call(self, payload, suppress=True, unique_id=None):
+        return getattr(call_result, type(payload).__name__)
+
+    async def get_on_data_transfer(self, **kwargs):
+        return DATA_TRANSFER_RESULT
+
+
+def previous_camel_to_snake(camel_case_string: str) -> str:
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", camel_case_string).lower()
+
+
+def previous_send_action(_action: str):
+    async def send_action(self, **kwargs):
+        obj = await getattr(self, f"get_send_{previous_camel_to_snake(_action)}")(
+            **kwargs
+        )
+        request = getattr(call, f"{_action}Payload")(**asdict(obj))
+        if self.latency_recorder is None:
+            response = await self.call(request)
+        else:
+            response = await self.latency_recorder.measure(_action, self.call(request))
+        return await getattr(self, f"get_after_{previous_camel_to_snake(_action)}")(
+            response=response
+        )
+
+    return send_action
+
+
+def previous_on_action(_action: str):
+    async def on_action(self, **kwargs):
+        self.log.debug("received {}: {}", _action, kwargs)
+        OCPP_MESSAGES.labels(_action, "received").inc()
+        return await getattr(self, f"get_on_{previous_camel_to_snake(_action)}")(
+            **kwargs
+        )
+
+    return on_action
+
+
+async def measure(message) -> float:
+    """
+    :param message: coroutine function sending or handling one message
+    :return: time per message in us
+    """
+    start = time.perf_counter()
+    for _ in range(MESSAGES):
+        await message()
+    return (time.perf_counter() - start) / MESSAGES * 1e6
+
+
+async def compare(name: str, previous, current):
+    before = await measure(previous)
+    after = await measure(current)
+    print(f"{name:<20} {before:8.2f} us {after:8.2f} us {before / after:6.1f}x")
+
+
+async def main():
+    cp = BenchChargePoint("bench", connection=None)
+    send_heartbeat = previous_send_action("Heartbeat")
+    send_meter_values = previous_send_action("MeterValues")
+    on_data_transfer = previous_on_action("DataTransfer")
+    print(f"{'':<20} {'previous':>11} {'current':>11} {'speedup':>7}")
+    await compare("send_heartbeat", lambda: send_heartbeat(cp), cp.send_heartbeat)
+    meter_values = dict(connector_id=1, transaction_id=1, meter_value=METER_VALUE)
+    await compare(
+        "send_meter_values",
+        lambda: send_meter_values(cp, **meter_values),
+        lambda: cp.send_meter_values(**meter_values),
+    )
+    data_transfer = dict(vendor_id="elu", message_id="bench")
+    await compare(
+        "on_data_transfer",
+        lambda: on_data_transfer(cp, **data_transfer),
+        lambda: cp.on_data_transfer(**data_transfer),
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,11 +1,12 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 
-from elu.twin.backend.db.database import create_db_and_tables
+from elu.twin.backend.db.database import create_db_and_tables, async_engine
 from elu.twin.backend.routes.v1.private.vehicle import router as vehicle_router
 from elu.twin.backend.routes.v1.private.charge_point_ocpp import router as ocpp_router
 from elu.twin.backend.routes.v1.private.quota import router as quota_router
 from elu.twin.backend import __version__
+from elu.twin.backend.metrics import MetricsMiddleware, router as metrics_router
 from elu.twin.backend.routes.v1.private.user import router as user_router
 from elu.twin.backend.routes.v1.private.ocpp_transaction import (
     router as transaction_router,
@@ -19,6 +20,7 @@ from elu.twin.backend.routes.v1.private.charge_point_actions import (
 async def lifespan(app: FastAPI):
     create_db_and_tables()
     yield
+    await async_engine.dispose()
 
 
 app = FastAPI(
@@ -26,8 +28,10 @@ app = FastAPI(
     version=__version__,
     lifespan=lifespan,
 )
+app.add_middleware(MetricsMiddleware)
 
 routers = [
+    metrics_router,
     user_router,
     vehicle_router,
     ocpp_router,
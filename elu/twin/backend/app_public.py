@@ -12,7 +12,13 @@ from elu.twin.backend.routes.v1.public.charge_point_actions import (
 from elu.twin.backend.routes.v1.public.ocpp_transaction import (
     router as transaction_router,
 )
+from elu.twin.backend.routes.v1.public.fleet import router as fleet_router
+from elu.twin.backend.routes.v1.public.meter_value import router as meter_value_router
+from elu.twin.backend.routes.v1.public.telemetry import router as telemetry_router
 from elu.twin.backend import __version__
+from elu.twin.backend.metrics import MetricsMiddleware, start_metrics_server
+from elu.twin.backend.security.token_cache import start_invalidation_listener
+from elu.twin.backend.telemetry import close_telemetry_hub
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 from fastapi.responses import FileResponse, HTMLResponse
@@ -21,7 +27,12 @@ from fastapi.responses import FileResponse, HTMLResponse
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     create_db_and_tables()
+    start_metrics_server()
+    invalidation_listener = start_invalidation_listener()
     yield
+    await close_telemetry_hub()
+    if invalidation_listener is not None:
+        invalidation_listener.stop()
 
 
 app = FastAPI(
@@ -31,6 +42,7 @@ app = FastAPI(
     #    docs_url=None,
     redoc_url=None,
 )
+app.add_middleware(MetricsMiddleware)
 
 app.mount("/static", StaticFiles(directory="./elu/twin/backend/static"), name="static")
 
@@ -70,6 +82,9 @@ routers = [
     vehicle_router,
     charge_point_actions_router,
     transaction_router,
+    fleet_router,
+    meter_value_router,
+    telemetry_router,
 ]
 
 for router in routers:
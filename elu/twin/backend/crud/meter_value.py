@@ -0,0 +1,148 @@
+"""History of the meter values of the twins
+
+The twin hosts send the meter values of their twins in batches, copied to the
+metervalue table with COPY. Time range queries copy the rows out as CSV,
+parsed by pandas into a DataFrame without building a Python object per row.
+"""
+
+import io
+from datetime import datetime, timezone
+
+import pandas as pd
+from sqlalchemy import insert, select
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from elu.twin.backend.db.database import engine
+from elu.twin.data.schemas.common import Index
+from elu.twin.data.schemas.meter_value import METER_VALUE_COLUMNS, MeterValueBatch
+from elu.twin.data.tables import MeterValue
+
+DTYPES = {
+    "user_id": "string",
+    "charge_point_id": "string",
+    "connector_id": "string",
+    "transaction_id": "string",
+    "power": "float64",
+    "current": "float64",
+    "voltage": "float64",
+    "energy": "float64",
+    "total_energy": "float64",
+    "soc": "Int64",
+}
+
+
+def _to_utc(value: float | datetime) -> datetime:
+    # the column is without time zone, in UTC
+    if not isinstance(value, datetime):
+        value = datetime.fromtimestamp(value, timezone.utc)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+async def add_meter_values(session: AsyncSession, batch: MeterValueBatch) -> int:
+    """Append a batch of meter values
+
+    :param session:
+    :param batch:
+    :return: number of meter values inserted
+    """
+    if not len(batch):
+        return 0
+    columns = [getattr(batch, column) for column in METER_VALUE_COLUMNS]
+    columns[0] = [_to_utc(timestamp) for timestamp in batch.timestamp]
+    connection = await session.connection()
+    if connection.dialect.name == "postgresql":
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            MeterValue.__tablename__,
+            records=zip(*columns),
+            columns=METER_VALUE_COLUMNS,
+        )
+    else:
+        await session.execute(
+            insert(MeterValue),
+            [dict(zip(METER_VALUE_COLUMNS, row)) for row in zip(*columns)],
+        )
+    await session.commit()
+    return len(batch)
+
+
+def read_meter_values(
+    start: datetime,
+    end: datetime,
+    *,
+    user_id: Index | None = None,
+    charge_point_ids: list[Index] | None = None,
+    transaction_ids: list[Index] | None = None,
+) -> pd.DataFrame:
+    """Meter values of a time range, ordered by time
+
+    :param start: included, naive datetimes are in UTC
+    :param end: excluded
+    :param user_id: only the meter values of the charge points of the user
+    :param charge_point_ids: only the meter values of these charge points
+    :param transaction_ids: only the meter values of these transactions
+    :return: a row per meter value, the columns of METER_VALUE_COLUMNS
+    """
+    query = (
+        select(*[getattr(MeterValue, column) for column in METER_VALUE_COLUMNS])
+        .where(MeterValue.timestamp >= _to_utc(start))
+        .where(MeterValue.timestamp < _to_utc(end))
+        .order_by(MeterValue.timestamp)
+    )
+    if user_id is not None:
+        query = query.where(MeterValue.user_id == user_id)
+    if charge_point_ids:
+        query = query.where(MeterValue.charge_point_id.in_(charge_point_ids))
+    if transaction_ids:
+        query = query.where(MeterValue.transaction_id.in_(transaction_ids))
+
+    if engine.dialect.name != "postgresql":
+        with Session(engine) as session:
+            frame = pd.DataFrame(
+                session.execute(query).all(), columns=list(METER_VALUE_COLUMNS)
+            )
+        return frame.astype(DTYPES)
+
+    compiled = query.compile(
+        dialect=engine.dialect, compile_kwargs={"render_postcompile": True}
+    )
+    buffer = io.StringIO()
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            sql = cursor.mogrify(compiled.string, compiled.params).decode()
+            cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH CSV HEADER", buffer)
+    finally:
+        connection.close()
+    buffer.seek(0)
+    return pd.read_csv(buffer, dtype=DTYPES, parse_dates=["timestamp"])
+
+
+def summarize_sessions(meter_values: pd.DataFrame) -> pd.DataFrame:
+    """History of the charging sessions of meter values
+
+    :param meter_values: as returned by read_meter_values
+    :return: a row per transaction, with its start and end, number of meter
+        values, energy, mean and maximum power and first and last state of
+        charge
+    """
+    sessions = meter_values.dropna(subset=["transaction_id"]).groupby(
+        "transaction_id", sort=False
+    )
+    summary = sessions.agg(
+        charge_point_id=("charge_point_id", "first"),
+        connector_id=("connector_id", "first"),
+        start=("timestamp", "min"),
+        end=("timestamp", "max"),
+        meter_values=("timestamp", "size"),
+        energy=("energy", "max"),
+        mean_power=("power", "mean"),
+        max_power=("power", "max"),
+        initial_soc=("soc", "first"),
+        final_soc=("soc", "last"),
+    )
+    summary["duration_s"] = (summary["end"] - summary["start"]).dt.total_seconds()
+    return summary.sort_values("start")
@@ -0,0 +1,137 @@
+"""Keyset pagination and sparse fields of the list endpoints
+
+Pages are ordered by a timestamp and the id. The cursor of the next page is
+the key of the last row, returned in the ``X-Next-Cursor`` header, so a page
+is read from the index of the key instead of skipping the previous rows.
+Without a limit or a cursor, all the rows are returned in a single response.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+from functools import cache
+
+from fastapi import HTTPException, Response
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import tuple_
+from sqlmodel import Session, SQLModel
+
+from elu.twin.data.schemas.common import Index
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# Rows per page when a cursor is given without a limit
+DEFAULT_LIMIT = 100
+
+
+def encode_cursor(timestamp: datetime, index: Index) -> str:
+    key = json.dumps([timestamp.isoformat(), index])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, Index]:
+    """Key of the last row of the previous page
+
+    :param cursor: as returned in the X-Next-Cursor header
+    :return: timestamp and id
+    """
+    try:
+        timestamp, index = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(timestamp), index
+    except (binascii.Error, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def paginate(
+    session: Session, query, key: tuple, cursor: str | None, limit: int | None
+) -> tuple[list, str | None]:
+    """Read a page of a query
+
+    :param session:
+    :param query: select of a table
+    :param key: timestamp and id columns of the table, the order of the pages
+    :param cursor: None for the first page
+    :param limit: rows per page, None for all the rows when there is no cursor
+        and DEFAULT_LIMIT otherwise
+    :return: rows of the page and cursor of the next page, None if it is the
+        last page
+    """
+    timestamp_column, id_column = key
+    if limit is None and cursor is None:
+        return session.exec(query.order_by(timestamp_column, id_column)).all(), None
+    if limit is None:
+        limit = DEFAULT_LIMIT
+    if cursor is not None:
+        query = query.where(tuple_(*key) > tuple_(*decode_cursor(cursor)))
+    rows = session.exec(
+        query.order_by(timestamp_column, id_column).limit(limit + 1)
+    ).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(
+        getattr(last, timestamp_column.key), getattr(last, id_column.key)
+    )
+
+
+def get_fields(model: type[SQLModel], fields: list[str] | None) -> set[str] | None:
+    """Check the fields requested of a model, the id is always included
+
+    :param model: output model
+    :param fields: None for all the fields
+    :return: names of the fields
+    """
+    if not fields:
+        return None
+    names = {name.strip() for field in fields for name in field.split(",")}
+    names.discard("")
+    unknown = names - set(model.model_fields)
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+        )
+    return names | {"id"}
+
+
+@cache
+def _get_adapter(model: type[SQLModel], name: str) -> TypeAdapter:
+    return TypeAdapter(model.model_fields[name].annotation)
+
+
+def get_page_response(
+    response: Response,
+    rows: list,
+    next_cursor: str | None,
+    model: type[SQLModel],
+    fields: set[str] | None,
+):
+    """Response of a page, with only the requested fields of each row
+
+    :param response: response of the route, when all the fields are returned
+    :param rows:
+    :param next_cursor:
+    :param model: output model of the rows
+    :param fields: as returned by get_fields
+    :return: the rows for the response model of the route, or a JSON response
+        with the requested fields
+    """
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+    if fields is None:
+        response.headers.update(headers)
+        return rows
+    content = []
+    for row in rows:
+        item = {}
+        for name in fields:
+            adapter = _get_adapter(model, name)
+            if hasattr(row, name):
+                value = adapter.validate_python(
+                    getattr(row, name), from_attributes=True
+                )
+            else:
+                value = model.model_fields[name].get_default(call_default_factory=True)
+            item[name] = adapter.dump_python(value, mode="json")
+        content.append(item)
+    return JSONResponse(content, headers=headers)
@@ -0,0 +1,144 @@
+"""Bulk provisioning of charge points and vehicles
+
+The rows of a whole fleet are built in memory, with their uuid keys assigned
+client side, and inserted table by table with multi-row INSERTs in a single
+transaction. The quota is reserved in the same transaction with a conditional
+UPDATE, so two concurrent requests can not exceed it.
+"""
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import selectinload
+from sqlmodel import Session, select
+
+from elu.twin.data.helpers import get_token_price
+from elu.twin.data.schemas.charge_point import InputChargePoint
+from elu.twin.data.schemas.common import Index
+from elu.twin.data.schemas.vehicle import InputVehicle
+from elu.twin.data.tables import (
+    ChargePoint,
+    Connector,
+    Evse,
+    OcppConfigurationV16,
+    Quota,
+    Vehicle,
+)
+
+
+def reserve_quota(
+    session: Session, quota_id: Index, current, maximum, count: int
+) -> bool:
+    """Add count to a quota counter if it stays within its maximum
+
+    The row is locked until the transaction ends, the caller commits.
+
+    :param session:
+    :param quota_id:
+    :param current: counter column, e.g. Quota.current_number_of_vehicles
+    :param maximum: maximum column, e.g. Quota.max_number_of_vehicles
+    :param count:
+    :return: false if the quota is not found or would be exceeded
+    """
+    result = session.execute(
+        update(Quota)
+        .where(Quota.id == quota_id)
+        .where(current + count <= maximum)
+        .values({current: current + count})
+        .returning(Quota.id)
+    )
+    return result.first() is not None
+
+
+def _row(obj) -> dict:
+    # the timestamps are still the ISO strings of get_now, converted on insert
+    return obj.model_dump(warnings=False)
+
+
+def _build_charge_point(
+    charge_point: InputChargePoint, user_id: Index, quota_id: Index, rows: dict
+):
+    number_connectors = 0
+    db_charge_point = ChargePoint(
+        user_id=user_id,
+        name=charge_point.name,
+        cid=charge_point.cid,
+        csms_url=charge_point.csms_url,
+        maximum_dc_power=charge_point.maximum_dc_power,
+        maximum_ac_power=charge_point.maximum_ac_power,
+        quota_id=quota_id,
+        token_cost_per_minute=len(charge_point.evses) * get_token_price(),
+        ocpp_protocol=charge_point.ocpp_protocol,
+    )
+    for evseid, evse in enumerate(charge_point.evses):
+        db_evse = Evse(charge_point_id=db_charge_point.id, evseid=evseid + 1)
+        rows[Evse].append(_row(db_evse))
+        for connector in evse.connectors:
+            number_connectors += 1
+            db_connector = Connector(
+                evse_id=db_evse.id,
+                connectorid=number_connectors,
+                **connector.model_dump(),
+            )
+            rows[Connector].append(_row(db_connector))
+    configuration = OcppConfigurationV16(NumberOfConnectors=number_connectors)
+    db_charge_point.ocpp_configuration_v16_id = configuration.id
+    rows[OcppConfigurationV16].append(_row(configuration))
+    rows[ChargePoint].append(_row(db_charge_point))
+    return db_charge_point.id
+
+
+def add_charge_points(
+    session: Session,
+    charge_points: list[InputChargePoint],
+    user_id: Index,
+    quota_id: Index,
+) -> list[ChargePoint]:
+    """Insert charge points with their evses, connectors and configurations
+
+    :param session:
+    :param charge_points:
+    :param user_id:
+    :param quota_id:
+    :return: charge points with their evses and connectors loaded
+    """
+    # in the order of the foreign keys
+    rows = {OcppConfigurationV16: [], ChargePoint: [], Evse: [], Connector: []}
+    ids = [
+        _build_charge_point(charge_point, user_id, quota_id, rows)
+        for charge_point in charge_points
+    ]
+    for table, values in rows.items():
+        if values:
+            session.execute(insert(table), values)
+    session.commit()
+    objs = session.exec(
+        select(ChargePoint)
+        .where(ChargePoint.id.in_(ids))
+        .options(
+            selectinload(ChargePoint.evses).selectinload(Evse.connectors),
+            selectinload(ChargePoint.charging_profiles),
+        )
+    ).all()
+    objs_by_id = {obj.id: obj for obj in objs}
+    return [objs_by_id[charge_point_id] for charge_point_id in ids]
+
+
+def add_vehicles(
+    session: Session, vehicles: list[InputVehicle], user_id: Index
+) -> list[Vehicle]:
+    """Insert vehicles
+
+    :param session:
+    :param vehicles:
+    :param user_id:
+    :return: vehicles
+    """
+    rows = [
+        _row(Vehicle(user_id=user_id, **vehicle.model_dump())) for vehicle in vehicles
+    ]
+    if rows:
+        session.execute(insert(Vehicle), rows)
+    session.commit()
+    ids = [row["id"] for row in rows]
+    objs = session.exec(select(Vehicle).where(Vehicle.id.in_(ids))).all()
+    objs_by_id = {obj.id: obj for obj in objs}
+    return [objs_by_id[vehicle_id] for vehicle_id in ids]
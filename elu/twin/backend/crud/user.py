@@ -4,12 +4,14 @@ from typing import Annotated
 from fastapi import Depends, HTTPException
 from jose import JWTError, jwt
 from pydantic import ValidationError
+from sqlalchemy import update
 from sqlmodel import Session, select
 from starlette import status
 
 from elu.twin.backend.db.database import engine
 from elu.twin.backend.env import SECRET_KEY
 from elu.twin.data.tables import User, AppToken
+from elu.twin.data.schemas.common import Index
 from elu.twin.data.schemas.user import InputUser
 from elu.twin.data.schemas.token import TokenData
 from elu.twin.backend.security.security import (
@@ -17,7 +19,55 @@ from elu.twin.backend.security.security import (
     verify_password,
     ALGORITHM,
     get_password_hash,
+    get_token_fingerprint,
 )
+from elu.twin.backend.security.token_cache import get_token_cache
+
+
+def get_app_token_id(
+    session: Session, user_id: Index, app_token: str, fingerprint: str | None = None
+) -> Index | None:
+    """Find an app token of a user by its fingerprint
+
+    The tokens created before the fingerprints are checked against their
+    bcrypt hash, and get their fingerprint the first time they are used. As
+    bcrypt only reads the first 72 bytes, that the app tokens of a user share,
+    their hint must match too.
+
+    :param session:
+    :param user_id:
+    :param app_token:
+    :param fingerprint: fingerprint of app_token, computed if None
+    :return: id of the app token, None if it is not a token of the user
+    """
+    if fingerprint is None:
+        fingerprint = get_token_fingerprint(app_token)
+    token = session.exec(
+        select(AppToken).where(AppToken.fingerprint == fingerprint)
+    ).first()
+    if token is not None:
+        return token.id if token.user_id == user_id else None
+    tokens = session.exec(
+        select(AppToken)
+        .where(AppToken.user_id == user_id)
+        .where(AppToken.fingerprint.is_(None))
+        .where(AppToken.token_hint == app_token[-4:])
+    ).all()
+    token = next(
+        (token for token in tokens if verify_password(app_token, token.hashed_token)),
+        None,
+    )
+    if token is None:
+        return None
+    # in a session of its own, the commit would expire the user of the caller
+    with Session(engine) as backfill_session:
+        backfill_session.execute(
+            update(AppToken)
+            .where(AppToken.id == token.id)
+            .values(fingerprint=fingerprint)
+        )
+        backfill_session.commit()
+    return token.id
 
 
 def get_user_by_username(username: str, app_token: str | None = None) -> User | None:
@@ -25,20 +75,8 @@ def get_user_by_username(username: str, app_token: str | None = None) -> User |
         user = session.exec(select(User).where(User.username == username)).first()
         if not user:
             return None
-        if app_token:
-            tokens = session.exec(
-                select(AppToken).where(AppToken.user_id == user.id)
-            ).all()
-            is_valid_token = next(
-                (
-                    True
-                    for token in tokens
-                    if verify_password(app_token, token.hashed_token)
-                ),
-                False,
-            )
-            if not is_valid_token:
-                return None
+        if app_token and get_app_token_id(session, user.id, app_token) is None:
+            return None
         return user
 
 
@@ -65,6 +103,10 @@ async def get_current_user(
     # security_scopes: SecurityScopes,
     token: Annotated[str, Depends(oauth2_scheme)]
 ):
+    fingerprint = get_token_fingerprint(token)
+    user = get_token_cache().get(fingerprint)
+    if user is not None:
+        return user
     authenticate_value = "Bearer"
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -80,10 +122,18 @@ async def get_current_user(
         token_data = TokenData(scopes=token_scopes, username=username)
     except (JWTError, ValidationError):
         raise credentials_exception
-    app_token = token if "mode" in payload else None
-    user = get_user_by_username(username=token_data.username, app_token=app_token)
-    if user is None:
-        raise credentials_exception
+    with Session(engine) as session:
+        user = session.exec(
+            select(User).where(User.username == token_data.username)
+        ).first()
+        if user is None:
+            raise credentials_exception
+        app_token_id = None
+        if "mode" in payload:
+            app_token_id = get_app_token_id(session, user.id, token, fingerprint)
+            if app_token_id is None:
+                raise credentials_exception
+    get_token_cache().put(fingerprint, user, app_token_id, payload.get("exp"))
     return user
 
 
@@ -1,5 +1,8 @@
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from elu.twin.backend.metrics import instrument_engine
 from elu.twin.backend.env import (
     POSTGRES_USERNAME,
     POSTGRES_PASSWORD,
@@ -14,6 +17,11 @@ if POSTGRES_HOSTNAME:
         f"{POSTGRES_PASSWORD}@{POSTGRES_HOSTNAME}:"
         f"{POSTGRES_PORT}/{POSTGRES_DB_NAME}"
     }
+    async_db_kwargs = {
+        "url": f"postgresql+asyncpg://{POSTGRES_USERNAME}:"
+        f"{POSTGRES_PASSWORD}@{POSTGRES_HOSTNAME}:"
+        f"{POSTGRES_PORT}/{POSTGRES_DB_NAME}"
+    }
 else:
     sqlite_file_name = "database.db"
     connect_args = {"check_same_thread": False}
@@ -22,15 +30,33 @@ else:
         "echo": True,
         "connect_args": connect_args,
     }
+    async_db_kwargs = {
+        "url": f"sqlite+aiosqlite:///{sqlite_file_name}",
+        "echo": True,
+    }
 
 
 engine = create_engine(**db_kwargs)
+# used by the routes called by the twins, so that a slow query does not block
+# the event loop of the worker
+async_engine = create_async_engine(**async_db_kwargs)
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
 
 
 def create_db_and_tables():
+    """Create the missing tables, the changes of the existing tables are
+    alembic migrations, run with `alembic upgrade head`
+    """
     SQLModel.metadata.create_all(engine)
 
 
 def get_session():
     with Session(engine) as session:
         yield session
+
+
+async def get_async_session():
+    # objects stay loaded after a commit, lazy loads are not possible in async
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
@@ -0,0 +1,39 @@
+"""Migrations of the tables created by an earlier version
+
+New tables are created with their indexes by create_db_and_tables when the
+backends start, the migrations only change the tables that already exist.
+"""
+
+from logging.config import fileConfig
+
+from alembic import context
+from sqlmodel import SQLModel
+
+from elu.twin.backend.db.database import engine
+import elu.twin.data.tables  # noqa: F401
+
+if context.config.config_file_name is not None:
+    fileConfig(context.config.config_file_name)
+
+
+def run_migrations_offline():
+    context.configure(
+        url=engine.url.render_as_string(hide_password=False),
+        target_metadata=SQLModel.metadata,
+        literal_binds=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    with engine.connect() as connection:
+        context.configure(connection=connection, target_metadata=SQLModel.metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
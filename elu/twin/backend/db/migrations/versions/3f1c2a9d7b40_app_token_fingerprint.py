@@ -0,0 +1,47 @@
+"""Fingerprint of the app tokens
+
+Revision ID: 3f1c2a9d7b40
+Revises:
+Create Date: 2026-10-18 02:20:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3f1c2a9d7b40"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table("apptoken"):
+        # created with the column by create_db_and_tables
+        return
+    columns = {column["name"] for column in inspector.get_columns("apptoken")}
+    if "fingerprint" not in columns:
+        op.add_column(
+            "apptoken", sa.Column("fingerprint", sqlmodel.AutoString(), nullable=True)
+        )
+    # the tokens are filled in when they are used, see get_app_token_id
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_apptoken_fingerprint",
+            "apptoken",
+            ["fingerprint"],
+            unique=True,
+            if_not_exists=True,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_apptoken_fingerprint", table_name="apptoken")
+    op.drop_column("apptoken", "fingerprint")
@@ -0,0 +1,61 @@
+"""Indexes of the paginated list endpoints
+
+Revision ID: 8b2e61c4f0d5
+Revises: 3f1c2a9d7b40
+Create Date: 2026-10-18 02:25:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8b2e61c4f0d5"
+down_revision: Union[str, None] = "3f1c2a9d7b40"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    (
+        "ix_chargepoint_user_id_created_at",
+        "chargepoint",
+        ["user_id", "created_at", "id"],
+    ),
+    ("ix_chargepoint_user_id_status", "chargepoint", ["user_id", "status"]),
+    ("ix_vehicle_user_id_created_at", "vehicle", ["user_id", "created_at", "id"]),
+    (
+        "ix_transaction_user_id_start_time",
+        "transaction",
+        ["user_id", "start_time", "id"],
+    ),
+    (
+        "ix_transaction_charge_point_id",
+        "transaction",
+        ["charge_point_id", "start_time"],
+    ),
+    ("ix_transaction_user_id_status", "transaction", ["user_id", "status"]),
+]
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # built without locking the writes of the tables, outside of a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            if not inspector.has_table(table):
+                continue
+            op.create_index(
+                name,
+                table,
+                columns,
+                if_not_exists=True,
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -7,6 +7,17 @@ REDIS_PORT = os.getenv("REDIS_PORT", "6379")
 REDIS_DB_CELERY = os.getenv("REDIS_DB_CELERY", "0")
 REDIS_DB_ACTIONS = os.getenv("REDIS_DB_ACTIONS", "1")
 
+# "celery": one celery task per charge point, "host": charge points are
+# attached to twin host processes (see elu.twin.charge_point.twin_host)
+TWIN_RUNTIME = os.getenv("TWIN_RUNTIME", "celery")
+# Seconds the progress of a fleet operation is kept
+FLEET_OPERATION_TTL = int(os.getenv("FLEET_OPERATION_TTL", "86400"))
+
+# "pubsub": actions are lost if the twin is not connected, "stream": actions
+# are kept in a redis stream per charge point until the twin acknowledges them
+ACTIONS_TRANSPORT = os.getenv("ACTIONS_TRANSPORT", "pubsub")
+ACTIONS_STREAM_MAXLEN = int(os.getenv("ACTIONS_STREAM_MAXLEN", "1000"))
+
 POSTGRES_USERNAME = os.getenv("POSTGRES_USER", "eluadmin")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "123456")
 POSTGRES_HOSTNAME = os.getenv("POSTGRES_HOSTNAME", "localhost")
@@ -14,3 +25,17 @@ POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
 POSTGRES_DB_NAME = os.getenv("POSTGRES_DB_NAME", "elumobility")
 
 ACCESS_TOKEN_EXPIRE_MINUTES = os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60)
+
+# Seconds the users of valid tokens are cached by each process of the public
+# API, and maximum number of cached tokens. Revoked app tokens and updated
+# users are invalidated over redis on TOPIC_AUTH_INVALIDATE
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+TOPIC_AUTH_INVALIDATE = os.getenv("TOPIC_AUTH_INVALIDATE", "auth_invalidate")
+
+# Seconds without telemetry events after which the streams send a keep-alive
+TELEMETRY_KEEPALIVE = float(os.getenv("TELEMETRY_KEEPALIVE", "15"))
+
+# Port of the prometheus metrics of the public API, served apart from the API
+# so that they are not public, 0 disables them
+BACKEND_METRICS_PORT = int(os.getenv("BACKEND_METRICS_PORT", "9101"))
@@ -0,0 +1,131 @@
+"""Prometheus metrics of the backends
+
+``MetricsMiddleware`` times the requests of an app by route, together with
+the time spent in database queries while handling them. The queries are timed
+by the engines passed to ``instrument_engine``. The metrics are served on
+``/metrics`` by the private API, and on ``BACKEND_METRICS_PORT`` by the public
+API, whose routes are reachable from outside.
+"""
+
+import time
+from contextvars import ContextVar
+
+from fastapi import APIRouter, Response
+from loguru import logger
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Histogram,
+    generate_latest,
+    start_http_server,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from elu.twin.backend.env import BACKEND_METRICS_PORT
+
+REQUEST_DURATION = Histogram(
+    "elu_backend_request_duration_seconds",
+    "Duration of the requests",
+    ["method", "route", "status"],
+)
+REQUEST_DB_DURATION = Histogram(
+    "elu_backend_request_db_duration_seconds",
+    "Time spent in database queries by a request",
+    ["route"],
+)
+REQUEST_DB_QUERIES = Histogram(
+    "elu_backend_request_db_queries",
+    "Database queries made by a request",
+    ["route"],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+DB_QUERY_DURATION = Histogram(
+    "elu_backend_db_query_duration_seconds", "Duration of the database queries"
+)
+
+# time and number of the database queries of the current request
+_request_queries: ContextVar[list | None] = ContextVar("request_queries", default=None)
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def start_metrics_server(port: int = BACKEND_METRICS_PORT):
+    """Serve the metrics of the process on a thread
+
+    :param port: not served if 0
+    """
+    if not port:
+        return
+    try:
+        start_http_server(port)
+    except OSError as error:
+        # e.g. another worker of the same host already serves the port
+        logger.warning(f"metrics not served on port {port}: {error}")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    duration = time.perf_counter() - conn.info["query_start"].pop()
+    DB_QUERY_DURATION.observe(duration)
+    queries = _request_queries.get()
+    if queries is not None:
+        queries[0] += duration
+        queries[1] += 1
+
+
+def _handle_error(context):
+    # the failed query is not timed
+    if context.connection is not None:
+        starts = context.connection.info.get("query_start")
+        if starts:
+            starts.pop()
+
+
+def instrument_engine(engine: Engine):
+    """Time the queries of an engine
+
+    :param engine: sync engine, async_engine.sync_engine for an async engine
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing the http requests by route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        queries = [0.0, 0]
+        token = _request_queries.set(queries)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            _request_queries.reset(token)
+            # the path of the matched route, e.g. /twin/charge_point/{cid}
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_DURATION.labels(scope["method"], route, status).observe(duration)
+            REQUEST_DB_DURATION.labels(route).observe(queries[0])
+            REQUEST_DB_QUERIES.labels(route).observe(queries[1])
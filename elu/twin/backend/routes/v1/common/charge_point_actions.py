@@ -25,9 +25,34 @@ from dataclasses import asdict
 
 from elu.twin.data.tables import User, Connector, Vehicle, Transaction
 from fastapi import HTTPException, status
-from sqlmodel import Session, select
+from sqlmodel import Session, SQLModel, select
 
-from elu.twin.backend.env import REDIS_HOSTNAME, REDIS_PORT, REDIS_DB_ACTIONS
+from elu.twin.backend.env import (
+    REDIS_HOSTNAME,
+    REDIS_PORT,
+    REDIS_DB_ACTIONS,
+    ACTIONS_TRANSPORT,
+    ACTIONS_STREAM_MAXLEN,
+)
+from elu.twin.data.schemas.common import Index
+
+
+def publish_action(charge_point_id: Index, action: SQLModel):
+    """Send an action to the twin of a charge point
+
+    :param charge_point_id:
+    :param action: action model, its name selects the twin handler
+    """
+    r = redis.Redis(host=REDIS_HOSTNAME, port=REDIS_PORT, db=REDIS_DB_ACTIONS)
+    if ACTIONS_TRANSPORT == "stream":
+        r.xadd(
+            f"actions-{charge_point_id}",
+            {"data": action.model_dump_json()},
+            maxlen=ACTIONS_STREAM_MAXLEN,
+            approximate=True,
+        )
+    else:
+        r.publish(f"actions-{charge_point_id}", action.model_dump_json())
 
 
 def _post_request_start_charging(
@@ -85,14 +110,10 @@ def _post_request_start_charging(
         session.add(transaction)
         session.commit()
         session.refresh(transaction)
-        r = redis.Redis(host=REDIS_HOSTNAME, port=REDIS_PORT, db=REDIS_DB_ACTIONS)
         redis_start_transaction = RedisRequestStartTransaction(
             transaction_id=transaction.id
         )
-        r.publish(
-            f"actions-{charger.id}",
-            redis_start_transaction.model_dump_json(),
-        )
+        publish_action(charger.id, redis_start_transaction)
         connector.status = ConnectorStatus.pending
         connector.vehicle_id = start_transaction.vehicle_id
         vehicle.status = VehicleStatus.pending
@@ -123,14 +144,10 @@ def _stop_charging(
             TransactionStatus.accepted,
             TransactionStatus.running,
         ]:
-            r = redis.Redis(host=REDIS_HOSTNAME, port=REDIS_PORT, db=REDIS_DB_ACTIONS)
             redis_stop_transaction = RedisRequestStopTransaction(
                 transaction_id=transaction.id
             )
-            r.publish(
-                f"actions-{transaction.charge_point_id}",
-                redis_stop_transaction.model_dump_json(),
-            )
+            publish_action(transaction.charge_point_id, redis_stop_transaction)
             return ActionMessageRequest(
                 message="Stop transaction sent to requested connector"
             )
@@ -189,11 +206,7 @@ def _set_charging_profile(
     )
     # return profile1
 
-    r = redis.Redis(host=REDIS_HOSTNAME, port=REDIS_PORT, db=REDIS_DB_ACTIONS)
-    r.publish(
-        f"actions-{charge_point_id}",
-        profile1.model_dump_json(),
-    )
+    publish_action(charge_point_id, profile1)
     return ActionMessageRequest(message="Charging profile sent to requested charger")
     #     raise HTTPException(status_code=400, detail="Connector not charging")
     # raise HTTPException(status_code=400, detail="Transaction not found")
@@ -5,15 +5,27 @@ import logging
 
 from elu.twin.backend.routes.v1.common.charge_point_actions import _set_charging_profile
 from elu.twin.data.schemas.auth import OutputAuthV16, InputAuthV16
-from elu.twin.data.schemas.charge_point import OutputChargePoint, UpdateChargePoint
+from elu.twin.data.schemas.charge_point import (
+    OutputChargePoint,
+    UpdateChargePoint,
+    HydrateChargePoints,
+    HydratedChargePoint,
+)
 from elu.twin.data.schemas.common import Index
 from elu.twin.data.schemas.connector import OutputConnector, UpdateConnector
 from elu.twin.data.schemas.evse import OutputEvse
+from elu.twin.data.schemas.meter_value import MeterValueBatch, OutputMeterValueBatch
+from elu.twin.data.schemas.twin_state import TwinStateDelta, OutputTwinStateDelta
 from fastapi import APIRouter, Depends, HTTPException, status
+from ocpp.v16.datatypes import AuthorizationData, IdTagInfo
 from ocpp.v16.enums import ChargePointStatus, UpdateType
+from sqlalchemy import update
+from sqlalchemy.orm import selectinload
 from sqlmodel import Session, select, delete
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from elu.twin.backend.db.database import get_session
+from elu.twin.backend.crud.meter_value import add_meter_values
+from elu.twin.backend.db.database import get_session, get_async_session
 from elu.twin.data.enums import EvseStatus, ConnectorStatus, AuthMethod
 from elu.twin.data.tables import (
     AssignedChargingProfile,
@@ -23,6 +35,8 @@ from elu.twin.data.tables import (
     Connector,
     OcppConfigurationV16,
     OcppAuthV16,
+    Transaction,
+    Vehicle,
 )
 from elu.twin.data.schemas.ocpp_configuration import (
     OutputOcppConfigurationV16,
@@ -36,10 +50,93 @@ router = APIRouter(
 )
 
 
+def select_charge_point(charge_point_id: Index):
+    """Query of a charge point with the relationships of OutputChargePoint
+
+    :param charge_point_id:
+    :return: query
+    """
+    return (
+        select(ChargePoint)
+        .where(ChargePoint.id == charge_point_id)
+        .options(
+            selectinload(ChargePoint.evses).selectinload(Evse.connectors),
+            selectinload(ChargePoint.charging_profiles).selectinload(
+                AssignedChargingProfile.charging_schedule_period
+            ),
+        )
+    )
+
+
+def _authorization_data(auth: OcppAuthV16) -> AuthorizationData:
+    id_tag_info = None
+    if auth.status:
+        id_tag_info = IdTagInfo(
+            status=auth.status,
+            parent_id_tag=auth.parent_id_tag,
+            expiry_date=auth.expiry_date.isoformat() if auth.expiry_date else None,
+        )
+    return AuthorizationData(id_tag=auth.id_tag, id_tag_info=id_tag_info)
+
+
+@router.post("/hydrate", response_model=list[HydratedChargePoint])
+async def hydrate_charge_points(
+    *,
+    session: AsyncSession = Depends(get_async_session),
+    request: HydrateChargePoints,
+):
+    """Load the charge points, with their configuration and local auth list
+
+    The number of queries does not depend on the number of charge points, so a
+    twin host boots its twins with one request per batch.
+
+    :param session:
+    :param request: ids of the charge points
+    :return: charge points found, in the order of the request
+    """
+    ids = list(dict.fromkeys(request.charge_point_ids))
+    rows = await session.exec(
+        select(ChargePoint, OcppConfigurationV16)
+        .outerjoin(
+            OcppConfigurationV16,
+            ChargePoint.ocpp_configuration_v16_id == OcppConfigurationV16.id,
+        )
+        .where(ChargePoint.id.in_(ids))
+        .options(
+            selectinload(ChargePoint.evses).selectinload(Evse.connectors),
+            selectinload(ChargePoint.charging_profiles).selectinload(
+                AssignedChargingProfile.charging_schedule_period
+            ),
+        )
+    )
+    found = {charge_point.id: (charge_point, config) for charge_point, config in rows}
+    auth_lists: dict[Index, list[AuthorizationData]] = {}
+    auths = await session.exec(
+        select(OcppAuthV16)
+        .where(OcppAuthV16.charge_point_id.in_(list(found)))
+        .where(OcppAuthV16.auth_method == AuthMethod.list)
+    )
+    for auth in auths:
+        auth_lists.setdefault(auth.charge_point_id, []).append(
+            _authorization_data(auth)
+        )
+    hydrated = []
+    for charge_point_id in ids:
+        if charge_point_id not in found:
+            continue
+        charge_point, config = found[charge_point_id]
+        output = OutputChargePoint.model_validate(charge_point)
+        output.local_auth_list = auth_lists.get(charge_point_id, [])
+        hydrated.append(
+            HydratedChargePoint(charge_point=output, ocpp_configuration=config)
+        )
+    return hydrated
+
+
 @router.get("/{charge_point_id}", response_model=OutputChargePoint)
 async def get_charge_point(
     *,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     charge_point_id: Index,
 ):
     """
@@ -48,10 +145,7 @@ async def get_charge_point(
     :param charge_point_id:
     :return:
     """
-    obj = session.exec(
-        select(ChargePoint).where(ChargePoint.id == charge_point_id)
-    ).first()
-    print("obj", obj)
+    obj = (await session.exec(select_charge_point(charge_point_id))).first()
     if obj:
         return obj
     raise HTTPException(
@@ -64,7 +158,7 @@ async def get_charge_point(
 )
 async def get_composite_schedule_charge_point(
     *,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     charge_point_id: Index,
     connector_id,
     duration,
@@ -75,9 +169,7 @@ async def get_composite_schedule_charge_point(
     :param charge_point_id:
     :return:
     """
-    obj = session.exec(
-        select(ChargePoint).where(ChargePoint.id == charge_point_id)
-    ).first()
+    obj = (await session.exec(select_charge_point(charge_point_id))).first()
     if obj:
         return obj.get_composite_schedule(connector_id=connector_id, duration=duration)
     raise HTTPException(
@@ -86,9 +178,9 @@ async def get_composite_schedule_charge_point(
 
 
 @router.put("/status/{charge_point_id}/{status}", response_model=OutputChargePoint)
-def update_charger_status(
+async def update_charger_status(
     *,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     charge_point_id: Index,
     status: ChargePointStatus,
 ):
@@ -99,22 +191,24 @@ def update_charger_status(
     :param status:
     :return:
     """
-    db_charge_point = session.exec(
-        select(ChargePoint).where(ChargePoint.id == charge_point_id)
-    ).first()
+    db_charge_point = (await session.exec(select_charge_point(charge_point_id))).first()
     if not db_charge_point:
         return {"message": "Charge point not found"}
     db_charge_point.status = status
-    session.add(db_charge_point)
-    session.commit()
-    session.refresh(db_charge_point)
-    return db_charge_point
+    await session.commit()
+    return (
+        await session.exec(
+            select_charge_point(charge_point_id).execution_options(
+                populate_existing=True
+            )
+        )
+    ).first()
 
 
 @router.patch("/{charge_point_id}", response_model=OutputChargePoint)
-def update_charger(
+async def update_charger(
     *,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     charge_point_id: Index,
     charge_point_update: UpdateChargePoint,
 ):
@@ -125,18 +219,20 @@ def update_charger(
     :param status:
     :return:
     """
-    db_charge_point = session.exec(
-        select(ChargePoint).where(ChargePoint.id == charge_point_id)
-    ).first()
+    db_charge_point = (await session.exec(select_charge_point(charge_point_id))).first()
     if not db_charge_point:
         return {"message": "Charge point not found"}
     for key, value in charge_point_update.dict().items():
         if value:
             setattr(db_charge_point, key, value)
-    session.add(db_charge_point)
-    session.commit()
-    session.refresh(db_charge_point)
-    return db_charge_point
+    await session.commit()
+    return (
+        await session.exec(
+            select_charge_point(charge_point_id).execution_options(
+                populate_existing=True
+            )
+        )
+    ).first()
 
 
 def parse_charging_profile(data: dict) -> AssignedChargingProfile:
@@ -257,9 +353,9 @@ def update_charger_profile(
 
 
 @router.put("/evse/status/{evse_id}/{status}", response_model=OutputEvse)
-def update_evse_status(
+async def update_evse_status(
     *,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     evse_id: Index,
     status: EvseStatus,
     active_connector: int | None = None,
@@ -272,22 +368,28 @@ def update_evse_status(
     :param active_connector:
     :return:
     """
-    db_evse = session.exec(select(Evse).where(Evse.id == evse_id)).first()
+    db_evse = (
+        await session.exec(
+            select(Evse)
+            .where(Evse.id == evse_id)
+            .options(selectinload(Evse.connectors))
+        )
+    ).first()
     if not db_evse:
         raise HTTPException(404, detail="Evse not found")
     # TODO: add logic to check if the combination of active_connector and status is valid
     db_evse.status = status
     db_evse.active_connector_id = active_connector
     session.add(db_evse)
-    session.commit()
-    session.refresh(db_evse)
+    await session.commit()
+    await session.refresh(db_evse, ["updated_at"])
     return db_evse
 
 
 @router.put("/connector/status/{connector_id}/{status}", response_model=OutputConnector)
-def update_connector_status(
+async def update_connector_status(
     *,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     connector_id: Index,
     status: ConnectorStatus,
 ):
@@ -298,23 +400,23 @@ def update_connector_status(
     :param status:
     :return:
     """
-    db_connector = session.exec(
-        select(Connector).where(Connector.id == connector_id)
+    db_connector = (
+        await session.exec(select(Connector).where(Connector.id == connector_id))
     ).first()
     if not db_connector:
         return {"message": "Connector not found"}
     # TODO: add logic to set other values based on status
     db_connector.status = status
     session.add(db_connector)
-    session.commit()
-    session.refresh(db_connector)
+    await session.commit()
+    await session.refresh(db_connector)
     return db_connector
 
 
 @router.put("/connector/{connector_id}", response_model=OutputConnector)
-def update_connector_state(
+async def update_connector_state(
     *,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     connector_id: Index,
     update_connector: UpdateConnector,
 ):
@@ -325,26 +427,89 @@ def update_connector_state(
     :param update_connector:
     :return:
     """
-    db_connector = session.exec(
-        select(Connector).where(Connector.id == connector_id)
+    db_connector = (
+        await session.exec(select(Connector).where(Connector.id == connector_id))
     ).first()
     if not db_connector:
         return {"message": "Connector not found"}
     for key, value in update_connector.dict().items():
         setattr(db_connector, key, value)
     session.add(db_connector)
-    session.commit()
-    session.refresh(db_connector)
+    await session.commit()
+    await session.refresh(db_connector)
     return db_connector
 
 
+async def _apply_deltas(session: AsyncSession, table, deltas: list) -> int:
+    """Apply the fields set in each delta to the rows with the same id
+
+    :param session:
+    :param table:
+    :param deltas:
+    :return: number of rows updated
+    """
+    updated = 0
+    for delta in deltas:
+        values = delta.model_dump(exclude_unset=True, exclude={"id"})
+        values["updated_at"] = delta.updated_at
+        result = await session.execute(
+            update(table).where(table.id == delta.id).values(**values)
+        )
+        if not result.rowcount:
+            logging.warning(f"{table.__name__} {delta.id} not found")
+        updated += result.rowcount
+    return updated
+
+
+@router.put("/state", response_model=OutputTwinStateDelta)
+async def update_twin_state(
+    *,
+    session: AsyncSession = Depends(get_async_session),
+    twin_state: TwinStateDelta,
+):
+    """Apply charge point, connector, EVSE, transaction and vehicle updates of
+    many twins in one database transaction
+
+    :param session:
+    :param twin_state:
+    :return: number of updated objects
+    """
+    result = OutputTwinStateDelta(
+        charge_points=await _apply_deltas(
+            session, ChargePoint, twin_state.charge_points
+        ),
+        connectors=await _apply_deltas(session, Connector, twin_state.connectors),
+        evses=await _apply_deltas(session, Evse, twin_state.evses),
+        transactions=await _apply_deltas(session, Transaction, twin_state.transactions),
+        vehicles=await _apply_deltas(session, Vehicle, twin_state.vehicles),
+    )
+    await session.commit()
+    return result
+
+
+@router.post("/meter_values", response_model=OutputMeterValueBatch)
+async def append_meter_values(
+    *,
+    session: AsyncSession = Depends(get_async_session),
+    batch: MeterValueBatch,
+):
+    """Append the meter values of many twins to the meter value history
+
+    :param session:
+    :param batch:
+    :return: number of meter values inserted
+    """
+    inserted = await add_meter_values(session, batch)
+    return OutputMeterValueBatch(inserted=inserted)
+
+
 @router.get(
     "/configuration/{configuration_id}",
     response_model=OutputOcppConfigurationV16,
 )
-def get_ocpp_configuration(
+async def get_ocpp_configuration(
     *,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     configuration_id: Index,
 ):
     """
@@ -353,8 +518,12 @@ def get_ocpp_configuration(
     :param configuration_id:
     :return:
     """
-    db_configuration = session.exec(
-        select(OcppConfigurationV16).where(OcppConfigurationV16.id == configuration_id)
+    db_configuration = (
+        await session.exec(
+            select(OcppConfigurationV16).where(
+                OcppConfigurationV16.id == configuration_id
+            )
+        )
     ).first()
     if not db_configuration:
         raise HTTPException(
@@ -367,9 +536,9 @@ def get_ocpp_configuration(
     "/configuration/{configuration_id}",
     response_model=OutputOcppConfigurationV16,
 )
-def update_ocpp_configuration(
+async def update_ocpp_configuration(
     *,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     configuration_id: Index,
     configuration_update: OcppConfigurationV16Update,
 ):
@@ -380,8 +549,12 @@ def update_ocpp_configuration(
     :param configuration_update:
     :return:
     """
-    db_configuration = session.exec(
-        select(OcppConfigurationV16).where(OcppConfigurationV16.id == configuration_id)
+    db_configuration = (
+        await session.exec(
+            select(OcppConfigurationV16).where(
+                OcppConfigurationV16.id == configuration_id
+            )
+        )
     ).first()
     if not db_configuration:
         raise HTTPException(
@@ -391,15 +564,15 @@ def update_ocpp_configuration(
         if value:
             setattr(db_configuration, key, value)
     session.add(db_configuration)
-    session.commit()
-    session.refresh(db_configuration)
+    await session.commit()
+    await session.refresh(db_configuration)
     return db_configuration
 
 
 @router.get("/charge-point/auth/{charge_point_id}", response_model=list[OutputAuthV16])
-def get_list_of_auth_objects_for_charge_point(
+async def get_list_of_auth_objects_for_charge_point(
     *,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     charge_point_id: Index,
     auth_method: AuthMethod | None = None,
 ):
@@ -413,16 +586,16 @@ def get_list_of_auth_objects_for_charge_point(
     query = select(OcppAuthV16).where(OcppAuthV16.charge_point_id == charge_point_id)
     if auth_method:
         query = query.where(OutputAuthV16.auth_method == auth_method)
-    db_auth_objects = session.exec(query).all()
+    db_auth_objects = (await session.exec(query)).all()
     return db_auth_objects
 
 
 @router.post(
     "/charge-point/auth/{charge_point_id}/cache", response_model=list[OutputAuthV16]
 )
-def create_auth_objects_for_charge_point(
+async def create_auth_objects_for_charge_point(
     *,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     charge_point_id: Index,
     auth: InputAuthV16,
 ):
@@ -433,8 +606,8 @@ def create_auth_objects_for_charge_point(
     :param auth:
     :return:
     """
-    db_auth = session.exec(
-        select(OcppAuthV16).where(OcppAuthV16.id_tag == auth.id_tag)
+    db_auth = (
+        await session.exec(select(OcppAuthV16).where(OcppAuthV16.id_tag == auth.id_tag))
     ).first()
     if db_auth:
         raise HTTPException(
@@ -442,8 +615,8 @@ def create_auth_objects_for_charge_point(
         )
     db_auth = OcppAuthV16(**auth.dict(), charge_point_id=charge_point_id)
     session.add(db_auth)
-    session.commit()
-    session.refresh(db_auth)
+    await session.commit()
+    await session.refresh(db_auth)
     return db_auth
 
 
@@ -451,9 +624,9 @@ def create_auth_objects_for_charge_point(
     "/charge-point/auth/{charge_point_id}/list/{update_list_mode}",
     response_model=list[OutputAuthV16],
 )
-def create_auth_objects_for_charge_point(
+async def create_auth_objects_for_charge_point(
     *,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     charge_point_id: Index,
     auth: list[InputAuthV16],
     update_list: UpdateType,
@@ -467,12 +640,18 @@ def create_auth_objects_for_charge_point(
     """
     db_auth_objects = []
     if update_list == UpdateType.differential:
-        db_auth = session.exec(
-            select(OcppAuthV16).where(OcppAuthV16.charge_point_id == charge_point_id)
+        db_auth = (
+            await session.exec(
+                select(OcppAuthV16).where(
+                    OcppAuthV16.charge_point_id == charge_point_id
+                )
+            )
         ).all()
         for auth_object in auth:
-            db_auth_object = session.exec(
-                select(OcppAuthV16).where(OcppAuthV16.id_tag == auth_object.id_tag)
+            db_auth_object = (
+                await session.exec(
+                    select(OcppAuthV16).where(OcppAuthV16.id_tag == auth_object.id_tag)
+                )
             ).first()
             if db_auth_object:
                 for key, value in auth_object.dict().items():
@@ -484,11 +663,13 @@ def create_auth_objects_for_charge_point(
                 )
                 session.add(db_auth_object)
             db_auth_objects.append(db_auth_object)
-        session.commit()
+        await session.commit()
     else:
         for auth_object in auth:
-            db_auth_object = session.exec(
-                select(OcppAuthV16).where(OcppAuthV16.id_tag == auth_object.id_tag)
+            db_auth_object = (
+                await session.exec(
+                    select(OcppAuthV16).where(OcppAuthV16.id_tag == auth_object.id_tag)
+                )
             ).first()
             if db_auth_object:
                 for key, value in auth_object.dict().items():
@@ -500,24 +681,25 @@ def create_auth_objects_for_charge_point(
                 )
                 session.add(db_auth_object)
             db_auth_objects.append(db_auth_object)
-        session.commit()
+        await session.commit()
     return db_auth_objects
 
 
 @router.delete("/charge-point/auth/{charge_point_id}/cache")
-def delete_auth_cache(
+async def delete_auth_cache(
     *,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     charge_point_id: Index,
 ):
     """
 
     :return:
     """
-    _ = session.exec(
+    _ = await session.exec(
         delete(OcppAuthV16)
         .where(OcppAuthV16.charge_point_id == charge_point_id)
         .where(OcppAuthV16.auth_method == AuthMethod.cache)
     )
+    await session.commit()
     logging.warning("Deleting auth cache")
     return {"message": "Auth cache deleted"}
@@ -4,8 +4,9 @@ from elu.twin.data.schemas.transaction import OutputTransaction, UpdateTransacti
 from elu.twin.data.schemas.common import Index
 from fastapi import APIRouter, Depends, HTTPException
 
-from elu.twin.backend.db.database import get_session
-from sqlmodel import select, Session
+from elu.twin.backend.db.database import get_async_session
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from fastapi import status
 from elu.twin.data.tables import Transaction
 
@@ -18,7 +19,7 @@ router = APIRouter(
 
 @router.get("/{transaction_id}", response_model=OutputTransaction)
 async def get_transaction(
-    *, session: Session = Depends(get_session), transaction_id: Index
+    *, session: AsyncSession = Depends(get_async_session), transaction_id: Index
 ):
     """Get transaction by id
 
@@ -26,8 +27,8 @@ async def get_transaction(
         session (Session, optional): [description]. Defaults to Depends(get_session).
         transaction_id (Index): [description]
     """
-    transaction = session.exec(
-        select(Transaction).where(Transaction.id == transaction_id)
+    transaction = (
+        await session.exec(select(Transaction).where(Transaction.id == transaction_id))
     ).first()
     if transaction:
         return transaction
@@ -59,20 +60,20 @@ async def get_transaction(
 @router.patch("/{transaction_id}", response_model=OutputTransaction)
 async def update_transactions(
     *,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     transaction_id: Index | None,
     update_transaction: UpdateTransaction
 ):
-    transaction = session.exec(
-        select(Transaction).where(Transaction.id == transaction_id)
+    transaction = (
+        await session.exec(select(Transaction).where(Transaction.id == transaction_id))
     ).first()
     if transaction:
         for key, value in update_transaction.dict().items():
             if value:
                 setattr(transaction, key, value)
         session.add(transaction)
-        session.commit()
-        session.refresh(transaction)
+        await session.commit()
+        await session.refresh(transaction)
         return transaction
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND, detail="Transaction not found"
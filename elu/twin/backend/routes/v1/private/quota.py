@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends
-from elu.twin.data.schemas.quota import OutputQuota
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import update
+from elu.twin.data.schemas.quota import (
+    OutputQuota,
+    OutputQuotaBalance,
+    QuotaConsumption,
+)
 from elu.twin.data.tables import Quota
-from elu.twin.backend.db.database import get_session
+from elu.twin.backend.db.database import get_async_session
 from elu.twin.data.schemas.common import Index
-from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 router = APIRouter(
     prefix="/twin/quota",
@@ -11,10 +16,51 @@ router = APIRouter(
 )
 
 
+@router.post("/consume", response_model=list[OutputQuotaBalance])
+async def consume_quotas(
+    *,
+    session: AsyncSession = Depends(get_async_session),
+    consumptions: list[QuotaConsumption],
+):
+    """Subtract the tokens consumed from many quotas in one transaction
+
+    The twin hosts send the consumption of all their twins, and stop the twins
+    of the quotas without tokens left. Each quota is an UPDATE ... RETURNING
+    by id, which Postgres and SQLite both run.
+
+    :param session:
+    :param consumptions: tokens consumed per quota
+    :return: tokens left in the quotas found
+    """
+    consumed: dict[Index, int] = {}
+    for consumption in consumptions:
+        consumed[consumption.id] = (
+            consumed.get(consumption.id, 0) + consumption.consumed
+        )
+    balances = []
+    # sorted, so that concurrent requests of several twin hosts lock the rows
+    # in the same order
+    for quota_id, tokens in sorted(consumed.items()):
+        available_tokens = (
+            await session.execute(
+                update(Quota)
+                .where(Quota.id == quota_id)
+                .values(available_tokens=Quota.available_tokens - tokens)
+                .returning(Quota.available_tokens)
+            )
+        ).scalar_one_or_none()
+        if available_tokens is not None:
+            balances.append(
+                OutputQuotaBalance(id=quota_id, available_tokens=available_tokens)
+            )
+    await session.commit()
+    return balances
+
+
 @router.patch("/{quota_id}/{consumed}", response_model=OutputQuota)
-def update_quota(
+async def update_quota(
     *,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     quota_id: Index,
     consumed: float,
 ):
@@ -25,11 +71,16 @@ def update_quota(
     :param consumed:
     :return:
     """
-    db_quota = session.exec(select(Quota).where(Quota.id == quota_id)).first()
+    # atomic, concurrent twins of the same quota do not overwrite each other
+    db_quota = (
+        await session.execute(
+            update(Quota)
+            .where(Quota.id == quota_id)
+            .values(available_tokens=Quota.available_tokens - consumed)
+            .returning(Quota)
+        )
+    ).scalar_one_or_none()
     if not db_quota:
-        return {"message": "Quota not found"}
-    db_quota.available_tokens -= consumed
-    session.add(db_quota)
-    session.commit()
-    session.refresh(db_quota)
+        raise HTTPException(status_code=400, detail="Quota not found")
+    await session.commit()
     return db_quota
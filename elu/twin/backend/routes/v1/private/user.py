@@ -1,12 +1,15 @@
 from typing import List
 
-from elu.twin.data.schemas.user import OutputUser, InputUser
+from elu.twin.data.schemas.common import Index
+from elu.twin.data.schemas.user import OutputUser, InputUser, UpdateUser
 from elu.twin.data.tables import User, Quota
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import select, Session
 
 from elu.twin.backend.crud.user import try_to_add_user
 from elu.twin.backend.db.database import get_session
+from elu.twin.backend.security.security import get_password_hash
+from elu.twin.backend.security.token_cache import invalidate_tokens
 
 router = APIRouter(
     prefix="/user",
@@ -15,7 +18,7 @@ router = APIRouter(
 
 
 @router.get("/", response_model=List[OutputUser])
-async def get_users(*, session: Session = Depends(get_session)):
+def get_users(*, session: Session = Depends(get_session)):
     users = session.exec(select(User)).all()
     return users
 
@@ -36,3 +39,29 @@ def create_user(*, session: Session = Depends(get_session), user: InputUser):
     session.commit()
     session.refresh(db_user)
     return db_user
+
+
+@router.patch("/{_id}", response_model=OutputUser)
+def update_user(
+    *, session: Session = Depends(get_session), _id: Index, user: UpdateUser
+):
+    """Update a user, e.g. disable it
+
+    The tokens of the user cached by the public API are invalidated.
+    """
+    db_user = session.exec(select(User).where(User.id == _id)).first()
+    if not db_user:
+        raise HTTPException(status_code=400, detail="User not found")
+    values = user.model_dump(exclude_unset=True, exclude_none=True)
+    if "password" in values:
+        db_user.hashed_password = get_password_hash(values.pop("password"))
+    for key, value in values.items():
+        if hasattr(User, key):
+            setattr(db_user, key, value)
+        elif db_user.quota is not None and hasattr(Quota, key):
+            setattr(db_user.quota, key, value)
+    session.add(db_user)
+    session.commit()
+    invalidate_tokens(user_id=_id)
+    session.refresh(db_user)
+    return db_user
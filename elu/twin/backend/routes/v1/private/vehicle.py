@@ -1,9 +1,10 @@
 from elu.twin.data.schemas.common import Index
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy import select
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from elu.twin.backend.db.database import get_session
+from elu.twin.backend.db.database import get_async_session
 from elu.twin.data.enums import PowerType, VehicleStatus
 from elu.twin.data.tables import Vehicle
 from elu.twin.data.schemas.vehicle import OutputVehicle, UpdateVehicle
@@ -12,43 +13,46 @@ router = APIRouter(prefix="/twin/vehicle", tags=["Vehicle"])
 
 
 @router.get("/{vehicle_id}", response_model=OutputVehicle)
-def get_vehicle(
+async def get_vehicle(
     *,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     vehicle_id: Index,
 ):
     """
     Get vehicle
     """
-    obj = session.exec(select(Vehicle).where(Vehicle.id == vehicle_id)).first()
+    obj = (await session.exec(select(Vehicle).where(Vehicle.id == vehicle_id))).first()
     if not obj:
         raise HTTPException(status_code=400, detail="Vehicle not found")
     return obj
 
 
 @router.put("/soc/{vid}", response_model=OutputVehicle)
-def update_vehicle_soc(
-    *, session: Session = Depends(get_session), vid: str, vehicle: UpdateVehicle
+async def update_vehicle_soc(
+    *,
+    session: AsyncSession = Depends(get_async_session),
+    vid: str,
+    vehicle: UpdateVehicle,
 ):
     """
     Update vehicle state of charge
     """
     if vehicle.soc is None:
         raise HTTPException(status_code=400, detail="Soc not provided")
-    db_vehicle = session.exec(select(Vehicle).where(Vehicle.id == vid)).first()
+    db_vehicle = (await session.exec(select(Vehicle).where(Vehicle.id == vid))).first()
     if not vehicle:
         raise HTTPException(status_code=400, detail="Vehicle not found")
     db_vehicle.soc = vehicle.soc
     session.add(db_vehicle)
-    session.commit()
-    session.refresh(db_vehicle)
+    await session.commit()
+    await session.refresh(db_vehicle)
     return db_vehicle
 
 
 @router.put("/charging-rate/{vid}/{power_type}/{soc}")
-def get_power_from_soc(
+async def get_power_from_soc(
     *,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     vid: str,
     power_type: PowerType,
     soc: float,
@@ -57,7 +61,7 @@ def get_power_from_soc(
     """
     Update vehicle state of charge
     """
-    db_vehicle = session.exec(select(Vehicle).where(Vehicle.id == vid)).first()
+    db_vehicle = (await session.exec(select(Vehicle).where(Vehicle.id == vid))).first()
     if not db_vehicle:
         raise HTTPException(status_code=400, detail="Vehicle not found")
     power = (
@@ -70,20 +74,20 @@ def get_power_from_soc(
 
 
 @router.put("/status/{vid}/{status}", response_model=OutputVehicle)
-def get_power_from_soc(
+async def get_power_from_soc(
     *,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
     vid: str,
     status: VehicleStatus,
 ):
     """
     Update vehicle state of charge
     """
-    db_vehicle = session.exec(select(Vehicle).where(Vehicle.id == vid)).first()
+    db_vehicle = (await session.exec(select(Vehicle).where(Vehicle.id == vid))).first()
     if not db_vehicle:
         raise HTTPException(status_code=400, detail="Vehicle not found")
     db_vehicle.status = status
     session.add(db_vehicle)
-    session.commit()
-    session.refresh(db_vehicle)
+    await session.commit()
+    await session.refresh(db_vehicle)
     return db_vehicle
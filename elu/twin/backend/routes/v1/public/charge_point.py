@@ -8,15 +8,25 @@ from elu.twin.data.schemas.charge_point import (
 from elu.twin.data.schemas.common import Index
 from elu.twin.data.schemas.connector import InputConnector, OutputConnector
 from elu.twin.data.schemas.evse import InputEvse, OutputEvse
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from ocpp.v16.enums import ChargePointStatus
 from ocpp.v201.enums import ConnectorType
+from sqlalchemy.orm import selectinload
 
 from elu.twin.backend.crud.user import get_current_active_user
 from elu.twin.backend.db.database import get_session
 from sqlmodel import select, Session
 from elu.twin.backend.crud.steve_mysql import add_charge_points_to_steve
+from elu.twin.backend.crud.provisioning import add_charge_points, reserve_quota
+from elu.twin.backend.crud.pagination import (
+    get_fields,
+    get_page_response,
+    paginate,
+)
+from elu.twin.data.enums import Protocol
 
 from elu.twin.data.tables import (
+    AssignedChargingProfile,
     User,
     ChargePoint,
     Connector,
@@ -26,7 +36,7 @@ from elu.twin.data.tables import (
     Vehicle,
 )
 
-from elu.twin.data.helpers import get_token_price, get_now
+from elu.twin.data.helpers import get_now
 
 router = APIRouter(
     prefix="/twin/charge-point",
@@ -34,20 +44,61 @@ router = APIRouter(
 )
 
 
+# loaded only when the field is returned
+RELATIONSHIPS = {
+    "evses": selectinload(ChargePoint.evses).selectinload(Evse.connectors),
+    "charging_profiles": selectinload(ChargePoint.charging_profiles).selectinload(
+        AssignedChargingProfile.charging_schedule_period
+    ),
+}
+
+
 @router.get("/", response_model=List[OutputChargePoint])
-async def get_charge_points(
+def get_charge_points(
     *,
     session: Session = Depends(get_session),
+    response: Response,
+    status: list[ChargePointStatus] | None = Query(None),
+    protocol: list[Protocol] | None = Query(None),
+    name_prefix: str | None = Query(None),
+    cursor: str | None = Query(None, description="X-Next-Cursor of the last page"),
+    limit: int | None = Query(
+        None, ge=1, le=1000, description="Default: all, or 100 with a cursor"
+    ),
+    fields: list[str] | None = Query(
+        None, description="Fields returned, e.g. id,name,status. Default: all"
+    ),
     current_user: Annotated[User, Depends(get_current_active_user)],
 ):
-    objs = session.exec(
-        select(ChargePoint).where(ChargePoint.user_id == current_user.id)
-    ).all()
-    return objs
+    """Charge points of the user, in the order they were created
+
+    All the charge points are returned when neither limit nor cursor is given.
+    Otherwise, when there are more than limit charge points, the X-Next-Cursor
+    header of the response gives the cursor of the next page.
+    """
+    names = get_fields(OutputChargePoint, fields)
+    query = select(ChargePoint).where(ChargePoint.user_id == current_user.id)
+    if status:
+        query = query.where(ChargePoint.status.in_(status))
+    if protocol:
+        query = query.where(ChargePoint.ocpp_protocol.in_(protocol))
+    if name_prefix:
+        query = query.where(ChargePoint.name.startswith(name_prefix))
+    query = query.options(
+        *[
+            option
+            for name, option in RELATIONSHIPS.items()
+            if names is None or name in names
+        ]
+    )
+    rows, next_cursor = paginate(
+        session, query, (ChargePoint.created_at, ChargePoint.id), cursor, limit
+    )
+    return get_page_response(response, rows, next_cursor, OutputChargePoint, names)
 
 
 @router.get("/{charge_point_id}", response_model=OutputChargePoint)
-async def get_charge_point(
+def get_charge_point(
     *,
     session: Session = Depends(get_session),
     charge_point_id: Index,
@@ -62,7 +113,7 @@ async def get_charge_point(
 
 
 @router.get("/evse/{evse_id}", response_model=OutputEvse)
-async def get_evse(
+def get_evse(
     *,
     session: Session = Depends(get_session),
     evse_id: Index,
@@ -78,7 +129,7 @@ async def get_evse(
 
 
 @router.get("/connector/{connector_id}", response_model=OutputConnector)
-async def get_connector(
+def get_connector(
     *,
     session: Session = Depends(get_session),
     connector_id: Index,
@@ -100,7 +151,7 @@ async def get_connector(
     "/connector/connect-vehicle/{connector_id}/{vehicle_id}",
     response_model=OutputConnector,
 )
-async def get_connector(
+def get_connector(
     *,
     session: Session = Depends(get_session),
     connector_id: Index,
@@ -131,7 +182,7 @@ async def get_connector(
 @router.put(
     "/connector/disconnect-vehicle/{connector_id}", response_model=OutputConnector
 )
-async def get_connector(
+def get_connector(
     *,
     session: Session = Depends(get_session),
     connector_id: Index,
@@ -155,46 +206,6 @@ async def get_connector(
     return connector
 
 
-def _add_charge_point(
-    session: Session, charge_point: InputChargePoint, user_id: Index, quota_id: Index
-):
-    db_charge_point = ChargePoint(
-        user_id=user_id,
-        name=charge_point.name,
-        cid=charge_point.cid,
-        csms_url=charge_point.csms_url,
-        maximum_dc_power=charge_point.maximum_dc_power,
-        maximum_ac_power=charge_point.maximum_ac_power,
-        quota_id=quota_id,
-        token_cost_per_minute=len(charge_point.evses) * get_token_price(),
-        ocpp_protocol=charge_point.ocpp_protocol,
-    )
-    session.add(db_charge_point)
-    session.commit()
-    number_connectors = 0
-    for evseid, evse in enumerate(charge_point.evses):
-        db_evse = Evse(charge_point_id=db_charge_point.id, evseid=evseid + 1)
-        session.add(db_evse)
-        session.commit()
-        for connectorid, connector in enumerate(evse.connectors):
-            number_connectors += 1
-            db_connector = Connector(
-                evse_id=db_evse.id, connectorid=number_connectors, **connector.dict()
-            )
-            session.add(db_connector)
-            session.commit()
-    ocppv16_configuration = OcppConfigurationV16(
-        NumberOfConnectors=number_connectors, charge_point_id=db_charge_point.id
-    )
-    session.add(ocppv16_configuration)
-    session.commit()
-    db_charge_point.ocpp_configuration_v16_id = ocppv16_configuration.id
-    session.add(db_charge_point)
-    session.commit()
-    session.refresh(db_charge_point)
-    return db_charge_point
-
-
 @router.post("/", response_model=OutputChargePoint)
 def create_charge_point(
     *,
@@ -207,23 +218,31 @@ def create_charge_point(
     ),
     current_user: Annotated[User, Depends(get_current_active_user)],
 ):
-    quota = session.exec(select(Quota).where(Quota.id == current_user.quota_id)).first()
-    if not quota:
+    db_charge_points = _provision_charge_points(session, [charge_point], current_user)
+    if add_to_internal_steve:
+        add_charge_points_to_steve([db_charge_points[0].cid])
+    return db_charge_points[0]
+
+
+def _provision_charge_points(
+    session: Session, charge_points: List[InputChargePoint], user: User
+) -> List[ChargePoint]:
+    if not user.quota_id:
         raise HTTPException(
             status_code=400, detail="Quota not found, not able to create charge point"
         )
-    if quota.current_number_of_charge_points >= quota.max_number_of_charge_points:
+    if not reserve_quota(
+        session,
+        user.quota_id,
+        Quota.current_number_of_charge_points,
+        Quota.max_number_of_charge_points,
+        len(charge_points),
+    ):
+        session.rollback()
         raise HTTPException(
             status_code=400, detail="Quota exceeded, not able to create charge point"
         )
-    quota.current_number_of_charge_points += 1
-    session.add(quota)
-    db_charge_point = _add_charge_point(
-        session, charge_point, current_user.id, quota.id
-    )
-    if add_to_internal_steve:
-        add_charge_points_to_steve([db_charge_point.cid])
-    return db_charge_point
+    return add_charge_points(session, charge_points, user.id, user.quota_id)
 
 
 def get_charge_points_from_str(
@@ -277,33 +296,14 @@ def create_charge_point_by_string(
     charge_points: List[InputChargePoint] = get_charge_points_from_str(
         charge_point_string
     )
-    results = []
-    quota = session.exec(select(Quota).where(Quota.id == current_user.quota_id)).first()
-    if not quota:
-        raise HTTPException(
-            status_code=400, detail="Quota not found, not able to create charge point"
-        )
-    if (
-        quota.current_number_of_charge_points + len(charge_points)
-        > quota.max_number_of_charge_points
-    ):
-        raise HTTPException(
-            status_code=400, detail="Quota exceeded, not able to create charge point"
-        )
-    for charge_point in charge_points:
-        db_charge_point = _add_charge_point(
-            session, charge_point, current_user.id, quota.id
-        )
-        results.append(db_charge_point)
-        if add_to_internal_steve:
-            add_charge_points_to_steve([charge_point.cid])
-    quota.current_number_of_charge_points += len(charge_points)
-    session.add(quota)
+    results = _provision_charge_points(session, charge_points, current_user)
+    if add_to_internal_steve:
+        add_charge_points_to_steve([charge_point.cid for charge_point in results])
     return results
 
 
 @router.delete("/{charge_point_id}", response_model=OutputChargePoint)
-async def delete_charge_point(
+def delete_charge_point(
     *,
     session: Session = Depends(get_session),
     charge_point_id: Index,
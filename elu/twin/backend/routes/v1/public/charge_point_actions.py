@@ -1,6 +1,8 @@
-import json
+import time
 from typing import Annotated
 
+import redis
+
 from fastapi import APIRouter, Depends, HTTPException
 from ocpp.v16.enums import ChargePointStatus
 from sqlmodel import Session, select
@@ -10,17 +12,39 @@ from elu.twin.backend.db.database import get_session
 from elu.twin.backend.routes.v1.common.charge_point_actions import (
     _post_request_start_charging,
     _stop_charging,
+    publish_action,
+)
+from elu.twin.backend.telemetry import publish_status
+from elu.twin.backend.env import (
+    REDIS_HOSTNAME,
+    REDIS_PORT,
+    REDIS_DB_ACTIONS,
+    TWIN_RUNTIME,
 )
 from elu.twin.charge_point.celery_factory import create_charger, app_celery
+from elu.twin.charge_point.env import (
+    TOPIC_CONNECT_CP,
+    TOPIC_CONNECT_CP_SCHEDULED,
+    TOPIC_CONNECT_CP_SCHEDULED_REQUESTS,
+)
+from elu.twin.charge_point.fleet import (
+    get_disconnect_channel,
+    get_progress_key,
+    get_request,
+)
 from elu.twin.data.enums import (
     ConnectorStatus,
     EvseStatus,
+    FleetTwinState,
 )
 from elu.twin.data.schemas.actions import (
     ActionMessageRequest,
     RequestConnectChargePoint,
     RequestDisconnectChargePoint,
+    RequestTwinDebug,
+    RedisRequestTwinDebug,
 )
+from elu.twin.data.schemas.common import Index
 from elu.twin.data.schemas.transaction import (
     OutputTransaction,
     RequestStartTransaction,
@@ -37,6 +61,108 @@ router = APIRouter(
 )
 
 
+def _get_redis() -> redis.Redis:
+    return redis.Redis(
+        host=REDIS_HOSTNAME, port=REDIS_PORT, db=REDIS_DB_ACTIONS, decode_responses=True
+    )
+
+
+def _connect_twins(
+    charge_point_ids: list[Index],
+    operation_id: str | None = None,
+    rate: float | None = None,
+) -> dict[Index, str]:
+    """Start the twins of charge points in the configured runtime
+
+    :param charge_point_ids:
+    :param operation_id: fleet operation of the twins
+    :param rate: charge points started per second, all at once if None
+    :return: task id of each twin
+    """
+    now = time.time()
+    task_ids = {}
+    r = _get_redis() if TWIN_RUNTIME == "host" else None
+    pipe = r.pipeline(transaction=False) if r is not None else None
+    for i, charge_point_id in enumerate(charge_point_ids):
+        delay = i / rate if rate else 0
+        message = get_request(charge_point_id, operation_id)
+        if pipe is not None:
+            if delay:
+                pipe.hset(TOPIC_CONNECT_CP_SCHEDULED_REQUESTS, charge_point_id, message)
+                pipe.zadd(TOPIC_CONNECT_CP_SCHEDULED, {charge_point_id: now + delay})
+            else:
+                pipe.rpush(TOPIC_CONNECT_CP, message)
+            task_ids[charge_point_id] = f"{TOPIC_CONNECT_CP}:{charge_point_id}"
+        else:
+            task = create_charger.apply_async((message,), countdown=delay)
+            task_ids[charge_point_id] = str(task)
+    if pipe is not None:
+        pipe.execute()
+    return task_ids
+
+
+def _connect_twin(charge_point_id: Index) -> str:
+    """Start the twin of a charge point in the configured runtime
+
+    :param charge_point_id:
+    :return: task id of the twin
+    """
+    return _connect_twins([charge_point_id])[charge_point_id]
+
+
+def _disconnect_twins(
+    charge_points: dict[Index, str | None],
+    operation_id: str | None = None,
+    rate: float | None = None,
+):
+    """Stop the twins of charge points, they close their websocket
+
+    The connect requests of the charge points that are still scheduled are
+    removed, their twins are never started.
+
+    :param charge_points: task id of the twin of each charge point
+    :param operation_id: fleet operation of the twins
+    :param rate: charge points stopped per second, all at once if None
+    """
+    now = time.time()
+    r = _get_redis()
+    if TWIN_RUNTIME == "host" and charge_points:
+        with r.pipeline(transaction=True) as pipe:
+            for charge_point_id in charge_points:
+                pipe.zrem(TOPIC_CONNECT_CP_SCHEDULED, charge_point_id)
+            pipe.hdel(TOPIC_CONNECT_CP_SCHEDULED_REQUESTS, *charge_points)
+            removed = pipe.execute()[:-1]
+        cancelled = [cid for cid, ok in zip(charge_points, removed) if ok]
+        if cancelled and operation_id is not None:
+            r.hset(
+                get_progress_key(operation_id),
+                mapping={cid: FleetTwinState.disconnected for cid in cancelled},
+            )
+    with r.pipeline(transaction=False) as pipe:
+        for i, charge_point_id in enumerate(charge_points):
+            not_before = now + i / rate if rate else None
+            pipe.publish(
+                get_disconnect_channel(charge_point_id),
+                get_request(charge_point_id, operation_id, not_before),
+            )
+        pipe.execute()
+    if TWIN_RUNTIME != "host":
+        # drops the twins whose countdown is not over, running twins are closed
+        # by the disconnect request
+        task_ids = [task_id for task_id in charge_points.values() if task_id]
+        if task_ids:
+            app_celery.control.revoke(task_ids)
+
+
+def _disconnect_twin(charge_point_id: Index, charge_point_task_id: str):
+    """Stop the twin of a charge point in the configured runtime
+
+    :param charge_point_id:
+    :param charge_point_task_id:
+    """
+    _disconnect_twins({charge_point_id: charge_point_task_id})
+
+
 @router.post("/start-transaction", response_model=OutputTransaction)
 def post_request_start_charging(
     *,
@@ -85,10 +211,7 @@ def connect_charger(
                 connectors = evse.connectors
                 for connector in connectors:
                     connector.status = ConnectorStatus.pending
-            charge_point_task_id = create_charger.delay(
-                json.dumps({"charge_point_id": charge_point.id})
-            )
-            charge_point.charge_point_task_id = str(charge_point_task_id)
+            charge_point.charge_point_task_id = _connect_twin(charge_point.id)
             session.commit()
             return ActionMessageRequest(message="Connect charge point requested")
         raise HTTPException(status_code=400, detail="Charge point not out of service")
@@ -119,15 +242,42 @@ def disconnect_charger(
                         connector.status = ConnectorStatus.unavailable
                     # Disconnect the charger
                     # Kill task
-                app_celery.control.revoke(
-                    charge_point.charge_point_task_id, terminate=True, signal="SIGKILL"
-                )
+                _disconnect_twin(charge_point.id, charge_point.charge_point_task_id)
                 session.commit()
+                publish_status(
+                    _get_redis(),
+                    session,
+                    current_user.id,
+                    [charge_point.id],
+                    ChargePointStatus.unavailable,
+                    EvseStatus.unavailable,
+                    ConnectorStatus.unavailable,
+                )
                 return ActionMessageRequest(message="Disconnect charge point requested")
             raise HTTPException(status_code=400, detail="Charge point not connected")
     raise HTTPException(status_code=400, detail="Charge point not found")
 
 
+@router.post("/debug", response_model=ActionMessageRequest)
+def debug_charger(
+    *,
+    session: Session = Depends(get_session),
+    twin_debug: RequestTwinDebug,
+    current_user: Annotated[User, Depends(get_current_active_user)],
+):
+    """Log the debug messages of the twin of a charge point, or stop logging
+    them, without changing the log level of the other twins"""
+    charge_point = session.exec(
+        select(ChargePoint)
+        .where(ChargePoint.id == twin_debug.charge_point_id)
+        .where(ChargePoint.user_id == current_user.id)
+    ).first()
+    if charge_point is None:
+        raise HTTPException(status_code=400, detail="Charge point not found")
+    publish_action(charge_point.id, RedisRequestTwinDebug(enabled=twin_debug.enabled))
+    return ActionMessageRequest(message="Twin debug requested")
+
+
 # @router.post("/charging-profile")
 # def set_charging_profile(
 #     *,
@@ -0,0 +1,230 @@
+from collections import Counter
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from ocpp.v16.enums import ChargePointStatus
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from elu.twin.backend.crud.user import get_current_active_user
+from elu.twin.backend.db.database import get_session
+from elu.twin.backend.env import FLEET_OPERATION_TTL
+from elu.twin.backend.telemetry import publish_status
+from elu.twin.backend.routes.v1.public.charge_point_actions import (
+    _get_redis,
+    _connect_twins,
+    _disconnect_twins,
+)
+from elu.twin.charge_point.fleet import get_operation_key, get_progress_key
+from elu.twin.data.enums import (
+    ConnectorStatus,
+    EvseStatus,
+    FleetAction,
+    FleetTwinState,
+    Protocol,
+)
+from elu.twin.data.helpers import get_now
+from elu.twin.data.schemas.common import Index, get_uuid_str
+from elu.twin.data.schemas.fleet import (
+    OutputFleetOperation,
+    RequestFleetConnect,
+    RequestFleetDisconnect,
+    RequestFleetOperation,
+)
+from elu.twin.data.tables import User, ChargePoint, Evse, Connector
+
+router = APIRouter(
+    prefix="/twin/fleet",
+    tags=["Fleet"],
+)
+
+
+def _select_fleet(request: RequestFleetOperation, user: User):
+    query = select(ChargePoint).where(ChargePoint.user_id == user.id)
+    if request.charge_point_ids is not None:
+        query = query.where(ChargePoint.id.in_(request.charge_point_ids))
+    if request.name_prefix:
+        query = query.where(ChargePoint.name.startswith(request.name_prefix))
+    query = query.order_by(ChargePoint.name, ChargePoint.id)
+    if request.limit is not None:
+        query = query.limit(request.limit)
+    return query
+
+
+def _set_status(
+    session: Session,
+    charge_point_ids: list[Index],
+    status: ChargePointStatus,
+    evse_status: EvseStatus,
+    connector_status: ConnectorStatus,
+):
+    evse_ids = select(Evse.id).where(Evse.charge_point_id.in_(charge_point_ids))
+    session.execute(
+        update(ChargePoint)
+        .where(ChargePoint.id.in_(charge_point_ids))
+        .values(status=status)
+    )
+    session.execute(
+        update(Evse)
+        .where(Evse.charge_point_id.in_(charge_point_ids))
+        .values(status=evse_status)
+    )
+    session.execute(
+        update(Connector)
+        .where(Connector.evse_id.in_(evse_ids))
+        .values(status=connector_status)
+    )
+
+
+def _create_operation(
+    action: FleetAction, charge_point_ids: list[Index], rate: float, user: User
+) -> OutputFleetOperation:
+    operation = OutputFleetOperation(
+        id=get_uuid_str(),
+        action=action,
+        total=len(charge_point_ids),
+        rate=rate,
+        created_at=get_now(as_string=False),
+        states={FleetTwinState.scheduled: len(charge_point_ids)},
+    )
+    operation_key = get_operation_key(operation.id)
+    progress_key = get_progress_key(operation.id)
+    r = _get_redis()
+    with r.pipeline() as pipe:
+        pipe.hset(
+            operation_key,
+            mapping={
+                "action": action,
+                "total": operation.total,
+                "rate": rate,
+                "created_at": operation.created_at.isoformat(),
+                "user_id": user.id,
+            },
+        )
+        pipe.hset(
+            progress_key,
+            mapping={cid: FleetTwinState.scheduled for cid in charge_point_ids},
+        )
+        pipe.expire(operation_key, FLEET_OPERATION_TTL)
+        pipe.expire(progress_key, FLEET_OPERATION_TTL)
+        pipe.execute()
+    return operation
+
+
+@router.post("/connect", response_model=OutputFleetOperation)
+def connect_fleet(
+    *,
+    session: Session = Depends(get_session),
+    request: RequestFleetConnect,
+    current_user: Annotated[User, Depends(get_current_active_user)],
+):
+    """Connect the twins of many charge points, started at the given rate so
+    that the CSMS does not receive all the BootNotifications at once
+
+    Only the charge points that are unavailable and have a CSMS are connected.
+    """
+    charge_points = session.exec(
+        _select_fleet(request, current_user)
+        .where(ChargePoint.status == ChargePointStatus.unavailable)
+        .where(ChargePoint.csms_url.is_not(None))
+    ).all()
+    if not charge_points:
+        raise HTTPException(status_code=400, detail="No charge point to connect")
+    charge_point_ids = [charge_point.id for charge_point in charge_points]
+    _set_status(
+        session,
+        charge_point_ids,
+        ChargePointStatus.preparing,
+        EvseStatus.pending,
+        ConnectorStatus.pending,
+    )
+    if request.boot_reason is not None:
+        session.execute(
+            update(ChargePoint)
+            .where(ChargePoint.id.in_(charge_point_ids))
+            .where(ChargePoint.ocpp_protocol == Protocol.v201)
+            .values(boot_reason=request.boot_reason)
+        )
+    session.commit()
+    operation = _create_operation(
+        FleetAction.connect, charge_point_ids, request.rate, current_user
+    )
+    task_ids = _connect_twins(charge_point_ids, operation.id, request.rate)
+    session.execute(
+        update(ChargePoint),
+        [
+            {"id": charge_point_id, "charge_point_task_id": task_id}
+            for charge_point_id, task_id in task_ids.items()
+        ],
+    )
+    session.commit()
+    return operation
+
+
+@router.post("/disconnect", response_model=OutputFleetOperation)
+def disconnect_fleet(
+    *,
+    session: Session = Depends(get_session),
+    request: RequestFleetDisconnect,
+    current_user: Annotated[User, Depends(get_current_active_user)],
+):
+    """Disconnect the twins of many charge points at the given rate
+
+    The twins close their websocket, the worker or host running them goes on.
+    """
+    charge_points = session.exec(
+        _select_fleet(request, current_user)
+        .where(ChargePoint.status != ChargePointStatus.unavailable)
+        .where(ChargePoint.charge_point_task_id.is_not(None))
+    ).all()
+    if not charge_points:
+        raise HTTPException(status_code=400, detail="No charge point to disconnect")
+    task_ids = {
+        charge_point.id: charge_point.charge_point_task_id
+        for charge_point in charge_points
+    }
+    _set_status(
+        session,
+        list(task_ids),
+        ChargePointStatus.unavailable,
+        EvseStatus.unavailable,
+        ConnectorStatus.unavailable,
+    )
+    session.commit()
+    operation = _create_operation(
+        FleetAction.disconnect, list(task_ids), request.rate, current_user
+    )
+    _disconnect_twins(task_ids, operation.id, request.rate)
+    publish_status(
+        _get_redis(),
+        session,
+        current_user.id,
+        list(task_ids),
+        ChargePointStatus.unavailable,
+        EvseStatus.unavailable,
+        ConnectorStatus.unavailable,
+    )
+    return operation
+
+
+@router.get("/{operation_id}", response_model=OutputFleetOperation)
+def get_fleet_operation(
+    *,
+    operation_id: str,
+    details: bool = Query(False, description="Include the state of each twin"),
+    current_user: Annotated[User, Depends(get_current_active_user)],
+):
+    r = _get_redis()
+    operation = r.hgetall(get_operation_key(operation_id))
+    if not operation or operation.get("user_id") != current_user.id:
+        raise HTTPException(status_code=400, detail="Fleet operation not found")
+    twins = r.hgetall(get_progress_key(operation_id))
+    return OutputFleetOperation(
+        id=operation_id,
+        action=operation["action"],
+        total=int(operation["total"]),
+        rate=float(operation["rate"]),
+        created_at=operation["created_at"],
+        states=Counter(twins.values()),
+        charge_points=twins if details else None,
+    )
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+from typing import Annotated
+
+import pandas as pd
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response
+
+from elu.twin.backend.crud.meter_value import read_meter_values, summarize_sessions
+from elu.twin.backend.crud.user import get_current_active_user
+from elu.twin.data.enums import FrameFormat
+from elu.twin.data.helpers import get_now
+from elu.twin.data.schemas.common import Index
+from elu.twin.data.tables import User
+
+router = APIRouter(
+    prefix="/twin/meter-value",
+    tags=["Meter values"],
+)
+
+
+def _get_response(frame: pd.DataFrame, frame_format: FrameFormat) -> Response:
+    if frame_format == FrameFormat.json:
+        # pd.read_json(..., orient="split") gives the frame back
+        content = frame.to_json(orient="split", index=False, date_format="iso")
+        return Response(content, media_type="application/json")
+    return Response(frame.to_csv(index=False), media_type="text/csv")
+
+
+def _read_meter_values(
+    user: User,
+    start: datetime | None,
+    end: datetime | None,
+    charge_point_ids: list[Index] | None,
+    transaction_ids: list[Index] | None,
+) -> pd.DataFrame:
+    end = end or get_now(as_string=False)
+    start = start or end - timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return read_meter_values(
+        start,
+        end,
+        user_id=user.id,
+        charge_point_ids=charge_point_ids,
+        transaction_ids=transaction_ids,
+    )
+
+
+@router.get("")
+def get_meter_values(
+    *,
+    start: datetime | None = Query(None, description="Default: a day before end"),
+    end: datetime | None = Query(None, description="Default: now"),
+    charge_point_id: list[Index] | None = Query(None),
+    transaction_id: list[Index] | None = Query(None),
+    format: FrameFormat = FrameFormat.csv,
+    current_user: Annotated[User, Depends(get_current_active_user)],
+):
+    """Meter values of the charge points of the user in a time range
+
+    A row per meter value, as CSV or as the JSON of a pandas DataFrame split
+    in columns and data, e.g. ``pd.read_csv(url)``.
+    """
+    frame = _read_meter_values(
+        current_user, start, end, charge_point_id, transaction_id
+    )
+    return _get_response(frame, format)
+
+
+@router.get("/sessions")
+def get_session_history(
+    *,
+    start: datetime | None = Query(None, description="Default: a day before end"),
+    end: datetime | None = Query(None, description="Default: now"),
+    charge_point_id: list[Index] | None = Query(None),
+    transaction_id: list[Index] | None = Query(None),
+    format: FrameFormat = FrameFormat.csv,
+    current_user: Annotated[User, Depends(get_current_active_user)],
+):
+    """Charging sessions of the charge points of the user in a time range
+
+    A row per transaction, with its energy, power and state of charge, from
+    the meter values of the time range.
+    """
+    frame = _read_meter_values(
+        current_user, start, end, charge_point_id, transaction_id
+    )
+    return _get_response(summarize_sessions(frame).reset_index(), format)
@@ -1,15 +1,22 @@
 """OCPP transaction routes"""
 
+from datetime import datetime
 from typing import Annotated, List
 
 from elu.twin.data.schemas.transaction import OutputTransaction
 from elu.twin.data.schemas.common import Index
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 
+from elu.twin.backend.crud.pagination import (
+    get_fields,
+    get_page_response,
+    paginate,
+)
 from elu.twin.backend.crud.user import get_current_active_user
 from elu.twin.backend.db.database import get_session
 from sqlmodel import select, Session
 from fastapi import status
+from elu.twin.data.enums import TransactionStatus
 from elu.twin.data.tables import User, Transaction
 
 router = APIRouter(
@@ -19,28 +26,55 @@ router = APIRouter(
 
 
 @router.get("/", response_model=List[OutputTransaction])
-async def get_transactions(
+def get_transactions(
     *,
     session: Session = Depends(get_session),
-    charge_point_id: Index | None = None,
+    response: Response,
+    charge_point_id: list[Index] | None = Query(None),
+    transaction_status: list[TransactionStatus] | None = Query(None, alias="status"),
+    start: datetime | None = Query(None, description="Started at or after"),
+    end: datetime | None = Query(None, description="Started before"),
+    cursor: str | None = Query(None, description="X-Next-Cursor of the last page"),
+    limit: int | None = Query(
+        None, ge=1, le=1000, description="Default: all, or 100 with a cursor"
+    ),
+    fields: list[str] | None = Query(
+        None, description="Fields returned, e.g. id,status,energy. Default: all"
+    ),
     current_user: Annotated[User, Depends(get_current_active_user)],
 ):
-    """Get transactions
+    """Get transactions, in the order they started
+
+    All the transactions are returned when neither limit nor cursor is given.
+    Otherwise, when there are more than limit transactions, the X-Next-Cursor
+    header of the response gives the cursor of the next page.
 
     Args:
         session (Session, optional): [description]. Defaults to Depends(get_session).
-        charge_point_id (Index | None, optional): [description]. Defaults to None.
+        charge_point_id (list[Index] | None, optional): [description]. Defaults to None.
+        transaction_status (list[TransactionStatus] | None, optional): [description]. Defaults to None.
+        start (datetime | None, optional): [description]. Defaults to None.
+        end (datetime | None, optional): [description]. Defaults to None.
         current_user (Annotated[User, Depends(get_current_active_user)]): [description]
     """
+    names = get_fields(OutputTransaction, fields)
     query = select(Transaction).where(Transaction.user_id == current_user.id)
     if charge_point_id:
-        query = query.where(Transaction.charge_point_id == charge_point_id)
-    transactions = session.exec(query).all()
-    return transactions
+        query = query.where(Transaction.charge_point_id.in_(charge_point_id))
+    if transaction_status:
+        query = query.where(Transaction.status.in_(transaction_status))
+    if start is not None:
+        query = query.where(Transaction.start_time >= start)
+    if end is not None:
+        query = query.where(Transaction.start_time < end)
+    rows, next_cursor = paginate(
+        session, query, (Transaction.start_time, Transaction.id), cursor, limit
+    )
+    return get_page_response(response, rows, next_cursor, OutputTransaction, names)
 
 
 @router.get("/{transaction_id}", response_model=OutputTransaction)
-async def get_transaction(
+def get_transaction(
     *,
     session: Session = Depends(get_session),
     transaction_id: Index,
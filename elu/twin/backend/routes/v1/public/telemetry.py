@@ -0,0 +1,132 @@
+import asyncio
+import json
+from typing import Annotated
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from fastapi.responses import StreamingResponse
+from redis.exceptions import RedisError
+
+from elu.twin.backend.crud.user import get_current_active_user, get_current_user
+from elu.twin.backend.env import TELEMETRY_KEEPALIVE
+from elu.twin.backend.telemetry import TelemetrySubscription, get_telemetry_hub
+from elu.twin.data.enums import TelemetryKind
+from elu.twin.data.schemas.common import Index
+from elu.twin.data.tables import User
+
+router = APIRouter(
+    prefix="/twin/telemetry",
+    tags=["Telemetry"],
+)
+
+
+async def _subscribe(user: User, subscription: TelemetrySubscription):
+    try:
+        await get_telemetry_hub().subscribe(user.id, subscription)
+    except RedisError:
+        raise HTTPException(status_code=503, detail="Telemetry not available")
+
+
+async def _get_websocket_user(websocket: WebSocket, token: str | None) -> User:
+    # browsers cannot set the headers of a websocket, the token can be a
+    # query parameter instead
+    authorization = websocket.headers.get("authorization", "")
+    if token is None and authorization.lower().startswith("bearer "):
+        token = authorization[len("bearer ") :]
+    if token is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return await get_current_active_user(await get_current_user(token))
+
+
+async def _wait_closed(websocket: WebSocket):
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+
+
+@router.get("/stream")
+async def stream_telemetry(
+    *,
+    charge_point_id: list[Index] | None = Query(None),
+    vehicle_id: list[Index] | None = Query(None),
+    kind: list[TelemetryKind] | None = Query(None),
+    interval: float = Query(1.0, ge=0.1, le=60, description="Seconds"),
+    current_user: Annotated[User, Depends(get_current_active_user)],
+):
+    """Server-sent events with the changes of status and meter of the charge
+    points and vehicles of the user
+
+    Each event is a JSON list of the latest changes of each object, since the
+    previous event and at most one event every interval. Without filters,
+    all the charge points of the user are streamed.
+    """
+    subscription = TelemetrySubscription(charge_point_id, vehicle_id, kind)
+
+    async def events():
+        # subscribed once the body is sent, so that a client gone before leaves
+        # no subscription behind
+        hub = get_telemetry_hub()
+        try:
+            await hub.subscribe(current_user.id, subscription)
+            while True:
+                batch = await subscription.get(interval, TELEMETRY_KEEPALIVE)
+                if batch:
+                    yield f"data: {json.dumps(batch)}\n\n"
+                else:
+                    yield ": keep-alive\n\n"
+        except RedisError:
+            yield "event: error\ndata: Telemetry not available\n\n"
+        finally:
+            hub.unsubscribe(current_user.id, subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/ws")
+async def websocket_telemetry(
+    websocket: WebSocket,
+    token: str | None = None,
+    charge_point_id: list[Index] | None = Query(None),
+    vehicle_id: list[Index] | None = Query(None),
+    kind: list[TelemetryKind] | None = Query(None),
+    interval: float = Query(1.0, ge=0.1, le=60),
+):
+    """Same events as /stream over a websocket, a JSON list per message
+
+    The token is given as query parameter or Authorization header.
+    """
+    try:
+        user = await _get_websocket_user(websocket, token)
+        subscription = TelemetrySubscription(charge_point_id, vehicle_id, kind)
+        await _subscribe(user, subscription)
+    except HTTPException as error:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=error.detail)
+        return
+    await websocket.accept()
+    closed = asyncio.create_task(_wait_closed(websocket))
+    try:
+        while True:
+            batch = asyncio.create_task(subscription.get(interval, TELEMETRY_KEEPALIVE))
+            await asyncio.wait({batch, closed}, return_when=asyncio.FIRST_COMPLETED)
+            if closed.done():
+                batch.cancel()
+                break
+            if batch.result():
+                await websocket.send_json(batch.result())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        closed.cancel()
+        get_telemetry_hub().unsubscribe(user.id, subscription)
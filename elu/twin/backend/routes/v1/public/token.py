@@ -2,7 +2,7 @@ import logging
 from datetime import timedelta
 from typing import Annotated
 
-from elu.twin.data.schemas.common import Index
+from elu.twin.data.schemas.common import Index, get_uuid_str
 from elu.twin.data.tables import User, AppToken
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
@@ -22,14 +22,16 @@ from elu.twin.backend.env import ACCESS_TOKEN_EXPIRE_MINUTES
 from elu.twin.backend.security.security import (
     create_access_token,
     get_password_hash,
+    get_token_fingerprint,
 )
+from elu.twin.backend.security.token_cache import invalidate_tokens
 
 router = APIRouter(prefix="", tags=["Token"], include_in_schema=True)
 
 
 @router.post("/token", response_model=Token)
 @logger.catch
-async def login_for_access_token(
+def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
 ):
     print("form_data: ", form_data)
@@ -46,7 +48,7 @@ async def login_for_access_token(
 
 @router.post("/app-token", response_model=OutputFullAppToken)
 @logger.catch
-async def create_app_token(
+def create_app_token(
     *,
     session: Session = Depends(get_session),
     input_token: InputAppToken,
@@ -57,18 +59,23 @@ async def create_app_token(
     logger.error(f"access_token_expires: {access_token_expires}")
     logger.error(f"current_user: {current_user.username}")
     logger.error(f"current_user: {current_user}")
+    app_token_id = get_uuid_str()
     access_token = create_access_token(
         data={
             "sub": current_user.username,
             "mode": "app",
+            # tokens created in the same second differ, as their fingerprints
+            "jti": app_token_id,
         },  # , "scopes": form_data.scopes},
         expires_delta=access_token_expires,
     )
     logger.error(f"access_token: {access_token}")
     hashed_token = get_password_hash(access_token)
     app_token = AppToken(
+        id=app_token_id,
         token_hint=access_token[-4:],
         hashed_token=hashed_token,
+        fingerprint=get_token_fingerprint(access_token),
         user_id=current_user.id,
         expiry_in_days=input_token.expiry_in_days,
         name=input_token.name,
@@ -88,7 +95,7 @@ async def create_app_token(
 
 @router.get("/app-token/{id}", response_model=OutputAppToken)
 @logger.catch
-async def get_app_token(
+def get_app_token(
     *,
     session: Session = Depends(get_session),
     _id: Index,
@@ -106,7 +113,7 @@ async def get_app_token(
 
 @router.get("/app-token", response_model=list[OutputAppToken])
 @logger.catch
-async def get_app_tokens(
+def get_app_tokens(
     *,
     session: Session = Depends(get_session),
     current_user: Annotated[User, Depends(get_current_active_user)],
@@ -119,7 +126,7 @@ async def get_app_tokens(
 
 @router.delete("/app-token/{id}", response_model=OutputAppToken)
 @logger.catch
-async def delete_app_token(
+def delete_app_token(
     *,
     session: Session = Depends(get_session),
     _id: Index,
@@ -134,6 +141,7 @@ async def delete_app_token(
         raise HTTPException(status_code=400, detail="Token not found")
     session.delete(token)
     session.commit()
+    invalidate_tokens(app_token_id=token.id)
     return token
 
 
@@ -15,7 +15,7 @@ router = APIRouter(
 
 
 @router.get("/me", response_model=OutputUser)
-async def get_users(
+def get_users(
     *,
     session: Session = Depends(get_session),
     current_user: Annotated[User, Depends(get_current_active_user)],
@@ -3,15 +3,22 @@ from typing import Annotated
 
 from elu.twin.data.helpers import get_now
 from elu.twin.data.schemas.common import Index
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 
+from elu.twin.backend.crud.pagination import (
+    get_fields,
+    get_page_response,
+    paginate,
+)
 from elu.twin.backend.crud.user import get_current_active_user
 from elu.twin.backend.db.database import engine, get_session
 from sqlmodel import select, Session
 
+from elu.twin.data.enums import VehicleStatus
 from elu.twin.data.tables import Vehicle, User, Quota
 from elu.twin.data.schemas.vehicle import OutputVehicle, InputVehicle
 from elu.twin.backend.crud.steve_mysql import add_ocpp_tags_to_steve
+from elu.twin.backend.crud.provisioning import add_vehicles, reserve_quota
 
 from fastapi import status
 
@@ -23,17 +30,38 @@ router = APIRouter(
 
 
 @router.get("/", response_model=list[OutputVehicle])
-async def get_vehicles(
+def get_vehicles(
     *,
     session: Session = Depends(get_session),
+    response: Response,
+    vehicle_status: list[VehicleStatus] | None = Query(None, alias="status"),
+    cursor: str | None = Query(None, description="X-Next-Cursor of the last page"),
+    limit: int | None = Query(
+        None, ge=1, le=1000, description="Default: all, or 100 with a cursor"
+    ),
+    fields: list[str] | None = Query(
+        None, description="Fields returned, e.g. id,name,soc. Default: all"
+    ),
     current_user: Annotated[User, Depends(get_current_active_user)],
 ):
-    objs = session.exec(select(Vehicle).where(Vehicle.user_id == current_user.id)).all()
-    return objs
+    """Vehicles of the user, in the order they were created
+
+    All the vehicles are returned when neither limit nor cursor is given.
+    Otherwise, when there are more than limit vehicles, the X-Next-Cursor header
+    of the response gives the cursor of the next page.
+    """
+    names = get_fields(OutputVehicle, fields)
+    query = select(Vehicle).where(Vehicle.user_id == current_user.id)
+    if vehicle_status:
+        query = query.where(Vehicle.status.in_(vehicle_status))
+    rows, next_cursor = paginate(
+        session, query, (Vehicle.created_at, Vehicle.id), cursor, limit
+    )
+    return get_page_response(response, rows, next_cursor, OutputVehicle, names)
 
 
 @router.get("/{vehicle_id}", response_model=OutputVehicle)
-async def get_vehicle(
+def get_vehicle(
     vehicle_id: Index,
     current_user: Annotated[User, Depends(get_current_active_user)],
 ):
@@ -118,36 +146,31 @@ def create_vehicle_from_string(
     ),
     current_user: Annotated[User, Depends(get_current_active_user)],
 ):
-    quota = session.exec(select(Quota).where(Quota.id == current_user.quota_id)).first()
-    if quota is None:
+    if current_user.quota_id is None:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, detail="User quota not found"
         )
 
     vehicles = get_vehicles_from_str(vehicle_str)
-    if quota.current_number_of_vehicles + len(vehicles) >= quota.max_number_of_vehicles:
+    if not reserve_quota(
+        session,
+        current_user.quota_id,
+        Quota.current_number_of_vehicles,
+        Quota.max_number_of_vehicles,
+        len(vehicles),
+    ):
+        session.rollback()
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, detail="User quota exceeded"
         )
-    quota.current_number_of_vehicles += len(vehicles)
-    result = []
-    for vehicle in vehicles:
-        db_vehicle = Vehicle(
-            user_id=current_user.id,
-            **vehicle.dict(),
-        )
-        session.add(db_vehicle)
-        session.commit()
-        result.append(db_vehicle)
-        if add_to_internal_steve:
-            add_ocpp_tags_to_steve([db_vehicle.id_tag_suffix])
-    session.add(quota)
-    session.commit()
+    result = add_vehicles(session, vehicles, current_user.id)
+    if add_to_internal_steve:
+        add_ocpp_tags_to_steve([db_vehicle.id_tag_suffix for db_vehicle in result])
     return result
 
 
 @router.delete("/{vehicle_id}", response_model=OutputVehicle)
-async def delete_vehicle(
+def delete_vehicle(
     *,
     session: Session = Depends(get_session),
     vehicle_id: Index,
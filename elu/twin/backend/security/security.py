@@ -1,3 +1,5 @@
+import hashlib
+import hmac
 from datetime import timedelta, datetime
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
@@ -26,6 +28,16 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
+def get_token_fingerprint(token: str) -> str:
+    """Keyed hash of a token, to look it up without comparing it to the bcrypt
+    hash of every token
+
+    :param token:
+    :return: hex digest
+    """
+    return hmac.new(SECRET_KEY.encode(), token.encode(), hashlib.sha256).hexdigest()
+
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     if expires_delta:
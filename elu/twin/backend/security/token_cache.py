@@ -0,0 +1,172 @@
+"""Cache of the users authenticated by a token
+
+The users of valid tokens are kept by each process for AUTH_CACHE_TTL
+seconds, at most until the token expires, keyed by the fingerprint of the
+token so that the tokens themselves are not kept in memory. Revoking an app
+token or updating a user publishes an invalidation on TOPIC_AUTH_INVALIDATE,
+that the processes of the public API apply to their cache. A process that
+misses it, e.g. while redis is down, drops the entry after AUTH_CACHE_TTL.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+import redis
+from loguru import logger
+
+from elu.twin.backend.env import (
+    AUTH_CACHE_SIZE,
+    AUTH_CACHE_TTL,
+    REDIS_DB_ACTIONS,
+    REDIS_HOSTNAME,
+    REDIS_PORT,
+    TOPIC_AUTH_INVALIDATE,
+)
+from elu.twin.data.schemas.common import Index
+from elu.twin.data.tables import User
+
+
+class CachedUser(NamedTuple):
+    user: User
+    app_token_id: Index | None
+    expires_at: float
+
+
+class TokenCache:
+    def __init__(self, maxsize: int = AUTH_CACHE_SIZE, ttl: float = AUTH_CACHE_TTL):
+        """
+        :param maxsize: the least recently used tokens are dropped beyond it
+        :param ttl: seconds a token is cached
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, CachedUser] = OrderedDict()
+        # the invalidations are applied by the thread of the redis listener
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, fingerprint: str) -> User | None:
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.time():
+                del self._entries[fingerprint]
+                return None
+            self._entries.move_to_end(fingerprint)
+            return entry.user
+
+    def put(
+        self,
+        fingerprint: str,
+        user: User,
+        app_token_id: Index | None = None,
+        expires_at: float | None = None,
+    ):
+        """Cache the user of a token
+
+        :param fingerprint: fingerprint of the token
+        :param user: user of the token, not attached to a session
+        :param app_token_id: id of the app token, None for an access token
+        :param expires_at: expiry timestamp of the token
+        """
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        ttl_expiry = time.time() + self.ttl
+        expires_at = ttl_expiry if expires_at is None else min(expires_at, ttl_expiry)
+        with self._lock:
+            self._entries[fingerprint] = CachedUser(user, app_token_id, expires_at)
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(
+        self, user_id: Index | None = None, app_token_id: Index | None = None
+    ) -> int:
+        """Drop the tokens of a user, or an app token
+
+        :param user_id:
+        :param app_token_id:
+        :return: number of tokens dropped
+        """
+        with self._lock:
+            fingerprints = [
+                fingerprint
+                for fingerprint, entry in self._entries.items()
+                if (user_id is not None and entry.user.id == user_id)
+                or (app_token_id is not None and entry.app_token_id == app_token_id)
+            ]
+            for fingerprint in fingerprints:
+                del self._entries[fingerprint]
+        return len(fingerprints)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_token_cache = TokenCache()
+
+
+def get_token_cache() -> TokenCache:
+    return _token_cache
+
+
+def _get_redis() -> redis.Redis:
+    return redis.Redis(
+        host=REDIS_HOSTNAME, port=REDIS_PORT, db=REDIS_DB_ACTIONS, decode_responses=True
+    )
+
+
+def invalidate_tokens(user_id: Index | None = None, app_token_id: Index | None = None):
+    """Drop the tokens of a user, or an app token, from the caches of all the
+    processes
+
+    :param user_id:
+    :param app_token_id:
+    """
+    get_token_cache().invalidate(user_id=user_id, app_token_id=app_token_id)
+    message = json.dumps({"user_id": user_id, "app_token_id": app_token_id})
+    try:
+        _get_redis().publish(TOPIC_AUTH_INVALIDATE, message)
+    except redis.RedisError as error:
+        logger.warning("error publishing the token invalidation: {!r}", error)
+
+
+def _on_invalidation(message: dict):
+    try:
+        request = json.loads(message["data"])
+    except (TypeError, ValueError) as error:
+        logger.error("error parsing: {} with error: {}", message, error)
+        return
+    get_token_cache().invalidate(
+        user_id=request.get("user_id"), app_token_id=request.get("app_token_id")
+    )
+
+
+def _on_listener_error(error: Exception, pubsub, thread):
+    # the pubsub subscribes again when it reconnects
+    logger.warning("error listening to the token invalidations: {!r}", error)
+    get_token_cache().clear()
+    time.sleep(1)
+
+
+def start_invalidation_listener():
+    """Apply the invalidations of the other processes to the cache of this one
+
+    :return: thread of the listener, to stop, None if redis is not reachable
+    """
+    pubsub = _get_redis().pubsub(ignore_subscribe_messages=True)
+    try:
+        pubsub.subscribe(**{TOPIC_AUTH_INVALIDATE: _on_invalidation})
+    except redis.RedisError as error:
+        logger.warning("token invalidations not received: {!r}", error)
+        return None
+    return pubsub.run_in_thread(
+        sleep_time=1, daemon=True, exception_handler=_on_listener_error
+    )
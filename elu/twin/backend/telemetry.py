@@ -0,0 +1,272 @@
+"""Telemetry streams of the public API
+
+Each process of the public API subscribes once to the redis telemetry channel
+of the users with an open stream, and dispatches the events published by the
+twins (see elu.twin.charge_point.telemetry) to the subscriptions of the user.
+A subscription keeps only the events matching its filters, merged per object
+until the stream sends them, so that a slow client receives the latest state
+of each object instead of a growing backlog.
+
+The changes made by the backend itself, e.g. the charge points marked
+unavailable on disconnect, are published on the same channels with
+``publish_status``.
+"""
+
+import asyncio
+import json
+import time
+from asyncio import AbstractEventLoop, Task
+from weakref import WeakKeyDictionary
+
+import redis
+import redis.asyncio as aioredis
+from loguru import logger
+from ocpp.v16.enums import ChargePointStatus
+from redis.exceptions import ConnectionError as RedisConnectionError, RedisError
+from sqlmodel import Session, select
+
+from elu.twin.backend.env import REDIS_DB_ACTIONS, REDIS_HOSTNAME, REDIS_PORT
+from elu.twin.charge_point.telemetry import get_telemetry_channel
+from elu.twin.data.enums import ConnectorStatus, EvseStatus, TelemetryKind
+from elu.twin.data.helpers import get_now
+from elu.twin.data.schemas.common import Index
+from elu.twin.data.tables import Connector, Evse
+
+# events per message published by publish_status
+STATUS_EVENTS_PER_MESSAGE = 1000
+
+
+class TelemetrySubscription:
+    def __init__(
+        self,
+        charge_point_ids: list[Index] | None = None,
+        vehicle_ids: list[Index] | None = None,
+        kinds: list[TelemetryKind] | None = None,
+    ):
+        """
+        :param charge_point_ids: events of these charge points, all if neither
+            charge_point_ids nor vehicle_ids are given
+        :param vehicle_ids: events of these vehicles
+        :param kinds: kinds of events, all if None
+        """
+        self.charge_point_ids = set(charge_point_ids or ())
+        self.vehicle_ids = set(vehicle_ids or ())
+        self.kinds = set(kinds or TelemetryKind)
+        # (kind, id) -> latest event
+        self.pending: dict[tuple[str, Index], dict] = {}
+        self._ready = asyncio.Event()
+        self._sent_at = 0.0
+
+    def matches(self, event: dict) -> bool:
+        if event.get("kind") not in self.kinds:
+            return False
+        if not self.charge_point_ids and not self.vehicle_ids:
+            return True
+        if event.get("charge_point_id") in self.charge_point_ids:
+            return True
+        return (
+            event["kind"] == TelemetryKind.vehicle and event["id"] in self.vehicle_ids
+        )
+
+    def push(self, events: list[dict]):
+        for event in events:
+            if self.matches(event):
+                self.pending.setdefault((event["kind"], event["id"]), {}).update(event)
+                self._ready.set()
+
+    async def get(self, interval: float, timeout: float) -> list[dict]:
+        """Wait for the next events, at most one batch every interval
+
+        :param interval: minimum seconds between two batches
+        :param timeout: seconds to wait for events
+        :return: latest event of each object, empty after timeout
+        """
+        delay = self._sent_at + interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self._ready.clear()
+        events, self.pending = list(self.pending.values()), {}
+        self._sent_at = time.monotonic()
+        return events
+
+
+class TelemetryHub:
+    def __init__(self):
+        # user id -> subscriptions of the open streams of the user
+        self.subscriptions: dict[Index, set[TelemetrySubscription]] = {}
+        self._redis: aioredis.Redis | None = None
+        self._pubsub: aioredis.client.PubSub | None = None
+        self._listen_task: Task | None = None
+        self._unsubscribe_tasks: set[Task] = set()
+
+    def _get_pubsub(self) -> aioredis.client.PubSub:
+        if self._pubsub is None:
+            self._redis = aioredis.Redis(
+                host=REDIS_HOSTNAME,
+                port=REDIS_PORT,
+                db=REDIS_DB_ACTIONS,
+                decode_responses=True,
+            )
+            self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        return self._pubsub
+
+    async def subscribe(self, user_id: Index, subscription: TelemetrySubscription):
+        """Deliver the telemetry of a user to a subscription
+
+        :param user_id:
+        :param subscription:
+        :raise RedisError: if redis is not reachable
+        """
+        subscriptions = self.subscriptions.setdefault(user_id, set())
+        subscriptions.add(subscription)
+        if len(subscriptions) == 1:
+            try:
+                await self._get_pubsub().subscribe(get_telemetry_channel(user_id))
+            except Exception:
+                self.unsubscribe(user_id, subscription)
+                raise
+        if self._listen_task is None or self._listen_task.done():
+            self._listen_task = asyncio.create_task(self._listen())
+
+    def unsubscribe(self, user_id: Index, subscription: TelemetrySubscription):
+        """Stop delivering to a subscription, without waiting, as the stream
+        may be cancelled
+
+        :param user_id:
+        :param subscription:
+        """
+        subscriptions = self.subscriptions.get(user_id, set())
+        subscriptions.discard(subscription)
+        if not subscriptions and self.subscriptions.pop(user_id, None) is not None:
+            task = asyncio.create_task(self._unsubscribe_channel(user_id))
+            self._unsubscribe_tasks.add(task)
+            task.add_done_callback(self._unsubscribe_tasks.discard)
+
+    async def _unsubscribe_channel(self, user_id: Index):
+        # a stream of the user may have been opened again since
+        if user_id in self.subscriptions or self._pubsub is None:
+            return
+        try:
+            await self._pubsub.unsubscribe(get_telemetry_channel(user_id))
+        except Exception as error:
+            logger.warning(f"telemetry of user {user_id} not unsubscribed: {error}")
+
+    def dispatch(self, message: dict):
+        user_id = message["channel"].removeprefix(get_telemetry_channel(""))
+        subscriptions = self.subscriptions.get(user_id)
+        if not subscriptions:
+            return
+        events = json.loads(message["data"])
+        for subscription in subscriptions:
+            subscription.push(events)
+
+    async def _listen(self):
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    if message["type"] == "message":
+                        self.dispatch(message)
+                # nothing subscribed anymore, started again on subscribe
+                return
+            except RedisConnectionError as error:
+                logger.error(f"telemetry listener disconnected: {error}")
+                await asyncio.sleep(1)
+
+    async def close(self):
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+            await asyncio.gather(self._listen_task, return_exceptions=True)
+            self._listen_task = None
+        await asyncio.gather(*self._unsubscribe_tasks, return_exceptions=True)
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+        self.subscriptions.clear()
+
+
+_hubs: WeakKeyDictionary[AbstractEventLoop, TelemetryHub] = WeakKeyDictionary()
+
+
+def get_telemetry_hub() -> TelemetryHub:
+    """Return the telemetry hub of the running event loop
+
+    :return: shared telemetry hub
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _hubs:
+        _hubs[loop] = TelemetryHub()
+    return _hubs[loop]
+
+
+async def close_telemetry_hub():
+    """Stop the telemetry listener, call it on shutdown"""
+    hub = _hubs.pop(asyncio.get_running_loop(), None)
+    if hub is not None:
+        await hub.close()
+
+
+def publish_status(
+    r: redis.Redis,
+    session: Session,
+    user_id: Index,
+    charge_point_ids: list[Index],
+    status: ChargePointStatus,
+    evse_status: EvseStatus,
+    connector_status: ConnectorStatus,
+):
+    """Publish the status set by the backend to the charge points, their EVSEs
+    and connectors, best effort as the telemetry of the twins
+
+    :param r: redis client
+    :param session:
+    :param user_id: owner of the charge points
+    :param charge_point_ids:
+    :param status: of the charge points
+    :param evse_status:
+    :param connector_status:
+    """
+    if not charge_point_ids:
+        return
+    evses = session.exec(
+        select(Evse.id, Evse.charge_point_id).where(
+            Evse.charge_point_id.in_(charge_point_ids)
+        )
+    ).all()
+    connectors = session.exec(
+        select(Connector.id, Evse.charge_point_id)
+        .join(Evse, Connector.evse_id == Evse.id)
+        .where(Evse.charge_point_id.in_(charge_point_ids))
+    ).all()
+    rows = [(TelemetryKind.charge_point, cid, cid, status) for cid in charge_point_ids]
+    rows += [(TelemetryKind.evse, index, cid, evse_status) for index, cid in evses]
+    rows += [
+        (TelemetryKind.connector, index, cid, connector_status)
+        for index, cid in connectors
+    ]
+    timestamp = get_now()
+    events = [
+        {
+            "kind": kind,
+            "id": index,
+            "charge_point_id": charge_point_id,
+            "status": value,
+            "timestamp": timestamp,
+        }
+        for kind, index, charge_point_id, value in rows
+    ]
+    channel = get_telemetry_channel(user_id)
+    try:
+        with r.pipeline(transaction=False) as pipe:
+            for start in range(0, len(events), STATUS_EVENTS_PER_MESSAGE):
+                chunk = events[start : start + STATUS_EVENTS_PER_MESSAGE]
+                pipe.publish(channel, json.dumps(chunk, default=str))
+            pipe.execute()
+    except RedisError as error:
+        logger.warning(f"telemetry of user {user_id} not published: {error}")
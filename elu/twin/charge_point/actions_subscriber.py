@@ -0,0 +1,308 @@
+"""Redis subscriber delivering charge point actions to the twins
+
+Actions published by the backend on the ``actions-<charge point id>`` channels
+are pushed to the ``actions_queue`` of the twin as soon as they arrive. All
+twins of an event loop share one subscriber: it subscribes to the channel of
+each registered twin or, in a twin host, to a single ``actions-*`` pattern and
+dispatches each message by channel. The queues receive ``(action, ack_id)``
+pairs, the twin passes ``ack_id`` to ``ack`` once it handled the action.
+
+With ``ACTIONS_TRANSPORT=stream`` the actions are read instead from one redis
+stream per charge point with a consumer group, so actions published while a
+twin is reconnecting are delivered once it is back.
+"""
+
+import asyncio
+import json
+import time
+from asyncio import AbstractEventLoop, Task
+from weakref import WeakKeyDictionary
+
+import redis.asyncio as aioredis
+from loguru import logger
+from redis.exceptions import ConnectionError as RedisConnectionError, ResponseError
+from sqlmodel import SQLModel
+
+from elu.twin.charge_point.charge_point.models.charge_point import actions
+from elu.twin.charge_point.env import (
+    REDIS_HOSTNAME,
+    REDIS_DB_ACTIONS,
+    REDIS_PORT,
+    ACTIONS_TRANSPORT,
+    ACTIONS_STREAM_GROUP,
+    ACTIONS_STREAM_CLAIM_IDLE,
+    ACTIONS_STREAM_BLOCK,
+    TWIN_HOST_NAME,
+)
+from elu.twin.charge_point.metrics import ActionsQueue
+
+
+def parse_action(data: str) -> SQLModel | None:
+    """Build the action model of a message published by the backend
+
+    :param data: json message, its name selects the action
+    :return: action, None if the message is not a known action
+    """
+    try:
+        obj = json.loads(data)
+        action_name = obj.get("name")
+        model: SQLModel = actions.get(action_name)
+        if model is None:
+            logger.warning(f"action not found: {data}")
+            return None
+        return model.model_validate(obj)
+    except Exception as error:
+        logger.error(f"error parsing: {data} with error: {error}")
+        return None
+
+
+class ActionsSubscriber:
+    def __init__(self, pattern: str | None = None):
+        """
+        :param pattern: channel pattern to subscribe once for all twins, None
+            to subscribe the channel of each twin
+        """
+        self.pattern = pattern
+        self.queues: dict[str, ActionsQueue] = {}
+        self._redis: aioredis.Redis | None = None
+        self._pubsub: aioredis.client.PubSub | None = None
+        self._listen_task: Task | None = None
+
+    def _get_redis(self) -> aioredis.Redis:
+        if self._redis is None:
+            self._redis = aioredis.Redis(
+                host=REDIS_HOSTNAME,
+                port=REDIS_PORT,
+                db=REDIS_DB_ACTIONS,
+                decode_responses=True,
+            )
+        return self._redis
+
+    async def _get_pubsub(self) -> aioredis.client.PubSub:
+        if self._pubsub is None:
+            self._pubsub = self._get_redis().pubsub(ignore_subscribe_messages=True)
+            if self.pattern is not None:
+                await self._pubsub.psubscribe(self.pattern)
+        return self._pubsub
+
+    async def register(self, channel: str, queue: ActionsQueue):
+        """Deliver the actions published on a channel to a queue, as
+        ``(action, ack_id)`` pairs
+
+        :param channel:
+        :param queue:
+        """
+        self.queues[channel] = queue
+        pubsub = await self._get_pubsub()
+        if self.pattern is None:
+            await pubsub.subscribe(channel)
+        if self._listen_task is None or self._listen_task.done():
+            self._listen_task = asyncio.create_task(self._listen())
+
+    async def unregister(self, channel: str):
+        self.queues.pop(channel, None)
+        if self.pattern is None and self._pubsub is not None:
+            await self._pubsub.unsubscribe(channel)
+
+    def ack(self, ack_id: tuple[str, str] | None):
+        """Confirm that the twin handled an action, nothing to do for pubsub
+
+        :param ack_id: delivered with the action in the actions queue
+        """
+
+    def dispatch(self, message: dict):
+        queue = self.queues.get(message.get("channel"))
+        if queue is None:
+            return
+        action = parse_action(message.get("data"))
+        if action is not None:
+            queue.put_nowait((action, None))
+
+    async def _listen(self):
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    self.dispatch(message)
+                # nothing subscribed anymore, started again on register
+                return
+            except RedisConnectionError as error:
+                logger.error(f"actions subscriber disconnected: {error}")
+                await asyncio.sleep(1)
+
+    async def close(self):
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+            await asyncio.gather(self._listen_task, return_exceptions=True)
+            self._listen_task = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+        self.queues.clear()
+
+
+class StreamActionsSubscriber(ActionsSubscriber):
+    """Read the actions from the ``actions-<charge point id>`` streams
+
+    The twins read their streams as the consumer ``consumer`` of the group
+    ``group``. An entry is acknowledged once the twin accepted or handled its
+    action, and entries pending for longer than ``claim_idle`` milliseconds,
+    e.g. left by a crashed twin host, are claimed again by the host now running
+    the twin. The streams of all the twins are scanned for idle entries at
+    once, with one pipeline.
+    """
+
+    def __init__(
+        self,
+        group: str = ACTIONS_STREAM_GROUP,
+        consumer: str = TWIN_HOST_NAME,
+        claim_idle: int = ACTIONS_STREAM_CLAIM_IDLE,
+        block: int = ACTIONS_STREAM_BLOCK,
+    ):
+        super().__init__()
+        self.group = group
+        self.consumer = consumer
+        self.claim_idle = claim_idle
+        self.block = block
+        # (stream, entry id) of the actions queued and not acknowledged yet
+        self._in_flight: set[tuple[str, str]] = set()
+        self._ack_tasks: set[Task] = set()
+
+    async def _create_group(self, stream: str):
+        try:
+            await self._get_redis().xgroup_create(
+                stream, self.group, id="0", mkstream=True
+            )
+        except ResponseError as error:
+            if "BUSYGROUP" not in str(error):
+                raise
+
+    async def register(self, channel: str, queue: ActionsQueue):
+        self.queues[channel] = queue
+        await self._create_group(channel)
+        await self._claim([channel])
+        if self._listen_task is None or self._listen_task.done():
+            self._listen_task = asyncio.create_task(self._listen())
+
+    async def unregister(self, channel: str):
+        # entries not acknowledged stay pending and are claimed again
+        self.queues.pop(channel, None)
+        self._in_flight = {key for key in self._in_flight if key[0] != channel}
+
+    async def _deliver(self, stream: str, entry_id: str, fields: dict | None):
+        queue = self.queues.get(stream)
+        if queue is None or (stream, entry_id) in self._in_flight:
+            return
+        action = parse_action(fields.get("data")) if fields else None
+        if action is None:
+            await self._get_redis().xack(stream, self.group, entry_id)
+            return
+        self._in_flight.add((stream, entry_id))
+        queue.put_nowait((action, (stream, entry_id)))
+
+    async def _claim(self, streams: list[str]):
+        """Claim the entries idle for longer than claim_idle
+
+        :param streams: scanned together, in one round trip per 100 entries
+            claimed from a stream
+        """
+        start_ids = {stream: "0-0" for stream in streams}
+        while start_ids:
+            pipe = self._get_redis().pipeline(transaction=False)
+            for stream, start_id in start_ids.items():
+                pipe.xautoclaim(
+                    stream,
+                    self.group,
+                    self.consumer,
+                    min_idle_time=self.claim_idle,
+                    start_id=start_id,
+                    count=100,
+                )
+            responses = await pipe.execute()
+            next_ids = {}
+            for stream, (start_id, entries, *_) in zip(start_ids, responses):
+                for entry_id, fields in entries:
+                    await self._deliver(stream, entry_id, fields)
+                if start_id != "0-0":
+                    next_ids[stream] = start_id
+            start_ids = next_ids
+
+    def ack(self, ack_id: tuple[str, str] | None):
+        """Acknowledge the entry of an action, without waiting
+
+        :param ack_id: stream and entry id delivered with the action
+        """
+        if ack_id is None:
+            return
+        self._in_flight.discard(ack_id)
+        task = asyncio.create_task(self._ack(*ack_id))
+        self._ack_tasks.add(task)
+        task.add_done_callback(self._ack_tasks.discard)
+
+    async def _ack(self, stream: str, entry_id: str):
+        try:
+            await self._get_redis().xack(stream, self.group, entry_id)
+        except Exception as error:
+            # claimed and delivered again later
+            logger.warning(f"action {entry_id} of {stream} not acknowledged: {error}")
+
+    async def close(self):
+        await asyncio.gather(*self._ack_tasks, return_exceptions=True)
+        await super().close()
+
+    async def _listen(self):
+        r = self._get_redis()
+        claimed_at = time.monotonic()
+        while self.queues:
+            try:
+                response = await r.xreadgroup(
+                    self.group,
+                    self.consumer,
+                    {stream: ">" for stream in self.queues},
+                    count=100,
+                    block=self.block,
+                )
+                for stream, entries in response or []:
+                    for entry_id, fields in entries:
+                        await self._deliver(stream, entry_id, fields)
+                if time.monotonic() - claimed_at > self.claim_idle / 1000:
+                    await self._claim(list(self.queues))
+                    claimed_at = time.monotonic()
+            except RedisConnectionError as error:
+                logger.error(f"actions subscriber disconnected: {error}")
+                await asyncio.sleep(1)
+            except ResponseError as error:
+                # a stream was deleted with its group
+                logger.error(f"error reading actions: {error}")
+                for stream in list(self.queues):
+                    await self._create_group(stream)
+                await asyncio.sleep(1)
+
+
+_subscribers: WeakKeyDictionary[AbstractEventLoop, ActionsSubscriber] = (
+    WeakKeyDictionary()
+)
+
+
+def get_actions_subscriber(pattern: str | None = None) -> ActionsSubscriber:
+    """Return the actions subscriber of the running event loop
+
+    :param pattern: channel pattern used if a pubsub subscriber is created
+    :return: shared actions subscriber
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _subscribers:
+        if ACTIONS_TRANSPORT == "stream":
+            _subscribers[loop] = StreamActionsSubscriber()
+        else:
+            _subscribers[loop] = ActionsSubscriber(pattern)
+    return _subscribers[loop]
+
+
+async def close_actions_subscriber():
+    """Stop delivering actions, call it on shutdown"""
+    subscriber = _subscribers.pop(asyncio.get_running_loop(), None)
+    if subscriber is not None:
+        await subscriber.close()
@@ -1,23 +1,46 @@
 import asyncio
 import json
-import logging
+import random
 
 import websockets
 from celery import Celery
+from celery.signals import worker_process_init
 from elu.twin.data.schemas.common import Index
-from elu.twin.data.schemas.charge_point import OutputChargePoint
+from elu.twin.data.schemas.charge_point import OutputChargePoint, HydratedChargePoint
 from loguru import logger
+from ocpp.v16.enums import ChargePointStatus
 from websockets import Subprotocol
 
 from elu.twin.charge_point import requests
+from elu.twin.charge_point.actions_subscriber import close_actions_subscriber
+from elu.twin.charge_point.fleet import (
+    close_fleet_client,
+    report_progress,
+    wait_for_disconnect,
+)
+from elu.twin.charge_point.http_client import close_session
+from elu.twin.charge_point.log import configure_logging, sampled
+from elu.twin.charge_point.metrics import TWINS, TWIN_RECONNECTIONS
+from elu.twin.charge_point.meter_history import close_meter_value_buffer
+from elu.twin.charge_point.quota import close_quota_accountant
+from elu.twin.charge_point.telemetry import close_telemetry_publisher
+from elu.twin.charge_point.state_buffer import close_state_buffer, get_state_buffer
 from elu.twin.charge_point.security import basic_auth_header
 from elu.twin.charge_point.env import (
     REDIS_HOSTNAME,
     REDIS_PORT,
     CELERY_FACTORY_NAME,
     REDIS_DB_CELERY,
+    TWIN_RECONNECT_ATTEMPTS,
+    TWIN_RECONNECT_BASE_DELAY,
+    TWIN_RECONNECT_MAX_DELAY,
+)
+from elu.twin.data.enums import (
+    ConnectorStatus,
+    EvseStatus,
+    FleetTwinState,
+    Protocol,
 )
-from elu.twin.data.enums import Protocol
 
 from elu.twin.charge_point.charge_point.v16.charge_point import (
     ChargePoint as CpV16,
@@ -33,46 +56,190 @@ app_celery = Celery(
 )
 
 
-async def create_charger_async(charge_point_id: Index):
+def get_reconnect_delay(attempt: int) -> float:
+    """Seconds before reconnecting, with exponential backoff and full jitter
+
+    The jitter spreads the reconnections of the twins dropped together, e.g.
+    by a CSMS restart, instead of synchronising them.
+
+    :param attempt: number of failed attempts since the last connection
+    :return: delay
     """
+    ceiling = min(TWIN_RECONNECT_MAX_DELAY, TWIN_RECONNECT_BASE_DELAY * 2**attempt)
+    return random.uniform(0, ceiling)
+
+
+def _create_charge_point(cpi: OutputChargePoint, ws):
+    if cpi.ocpp_protocol == Protocol.v16:
+        logger.debug("create v16 charge point {}", cpi.cid)
+        return CpV16(cpi.cid, ws)
+    elif cpi.ocpp_protocol == Protocol.v201:
+        logger.debug("create v201 charge point {}", cpi.cid)
+        return CpV201(cpi.cid, ws)
+    raise Exception(f"Invalid protocol {cpi.ocpp_protocol}")
+
+
+async def _run_connection(cp, session: list[asyncio.Task]):
+    """Run the processes of a connection until it closes
+
+    :param cp: charge point
+    :param session: tasks of the session processes, an error in them ends the
+        twin
+    """
+    tasks = [asyncio.create_task(process) for process in cp.get_connection_processes()]
+    try:
+        done, _ = await asyncio.wait(
+            tasks + session, return_when=asyncio.FIRST_EXCEPTION
+        )
+        for task in done:
+            if task.exception() is not None:
+                raise task.exception()
+    finally:
+        cp.online.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def create_charger_async(
+    charge_point_id: Index,
+    hydrated: HydratedChargePoint | None = None,
+    operation_id: str | None = None,
+):
+    """Run a charge point twin, reconnecting to the CSMS when the connection is
+    lost
+
+    The twin and its transactions survive the reconnections, transaction
+    messages are delivered once it is connected again.
 
     :param charge_point_id:
+    :param hydrated: charge point and configuration, fetched if None
+    :param operation_id: fleet operation reporting the state of the twin
     :return:
     """
-    logger.info(f"charge point id: {charge_point_id}")
-    cpi: OutputChargePoint = await requests.get_charge_point(charge_point_id)
-    logger.warning(f"cpi: {cpi}")
-    logging.info(f"Connecting to {cpi}")
-    configuration = await requests.get_charge_point_configuration(
-        cpi.ocpp_configuration_v16_id
+    logger.debug("starting twin of charge point {}", charge_point_id)
+    await report_progress(operation_id, charge_point_id, FleetTwinState.connecting)
+    state = FleetTwinState.failed
+    cp = None
+    session: list[asyncio.Task] = []
+    TWINS.inc()
+    try:
+        if hydrated is None:
+            found = await requests.hydrate_charge_points([charge_point_id])
+            if not found:
+                raise Exception(f"Charge point {charge_point_id} not found")
+            hydrated = found[0]
+        cpi: OutputChargePoint = hydrated.charge_point
+        configuration = hydrated.ocpp_configuration
+        logger.debug("cpi: {}", cpi)
+        logger.info("connecting {} to {}", cpi.cid, cpi.csms_url)
+        ssl_context = True if cpi.csms_url.startswith("wss") else None
+        attempt = 0
+        while True:
+            try:
+                async with websockets.connect(
+                    f"{cpi.csms_url}/{cpi.cid}",
+                    subprotocols=[Subprotocol(cpi.ocpp_protocol)],
+                    ssl=ssl_context,
+                    extra_headers=[basic_auth_header(cpi.cid, cpi.password)],
+                ) as ws:
+                    attempt = 0
+                    if cp is None:
+                        cp = _create_charge_point(cpi, ws)
+                        cp.cpi = cpi
+                        cp.ocpp_configuration = configuration
+                        session = [
+                            asyncio.create_task(process)
+                            for process in cp.get_session_processes()
+                        ]
+                    else:
+                        cp.set_connection(ws)
+                    state = FleetTwinState.connected
+                    await report_progress(operation_id, charge_point_id, state)
+                    await _run_connection(cp, session)
+            except websockets.ConnectionClosed as e:
+                logger.warning("connection closed {}: {}", cpi.cid, e)
+            except (websockets.WebSocketException, OSError, asyncio.TimeoutError) as e:
+                # all the twins of a CSMS fail while it is down
+                if sampled("connection_failed"):
+                    logger.warning("connection failed {}: {!r}", cpi.cid, e)
+            attempt += 1
+            TWIN_RECONNECTIONS.inc()
+            if TWIN_RECONNECT_ATTEMPTS and attempt > TWIN_RECONNECT_ATTEMPTS:
+                raise Exception(f"Charge point {cpi.cid} could not reconnect")
+            if state == FleetTwinState.connected:
+                state = FleetTwinState.reconnecting
+                await report_progress(operation_id, charge_point_id, state)
+            await asyncio.sleep(get_reconnect_delay(attempt))
+    finally:
+        TWINS.dec()
+        if cp is not None:
+            for task in session + list(cp.actions_set):
+                task.cancel()
+            await asyncio.gather(*session, return_exceptions=True)
+            cp.actions_queue.clear()
+            # as the backend when it disconnects the twin, after the pending
+            # updates of the twin so that they cannot undo it
+            cp.set_statuses(
+                ChargePointStatus.unavailable,
+                EvseStatus.unavailable,
+                ConnectorStatus.unavailable,
+            )
+            await get_state_buffer().flush()
+        if state in (FleetTwinState.connected, FleetTwinState.reconnecting):
+            state = FleetTwinState.disconnected
+        await report_progress(operation_id, charge_point_id, state)
+
+
+async def run_charger_task(charge_point_id: Index, operation_id: str | None = None):
+    """Run a twin until it ends or a disconnect request closes it
+
+    :param charge_point_id:
+    :param operation_id: fleet operation that connected the twin
+    """
+    twin = asyncio.create_task(
+        create_charger_async(charge_point_id, operation_id=operation_id)
     )
-    logging.info(f"Connecting to {cpi.csms_url}/{cpi.cid}")
-    logging.warning("Starting charge point twin")
-    ssl_context = True if cpi.csms_url.startswith("wss") else None
-    async with websockets.connect(
-        f"{cpi.csms_url}/{cpi.cid}",
-        subprotocols=[Subprotocol(cpi.ocpp_protocol)],
-        ssl=ssl_context,
-        extra_headers=[basic_auth_header(cpi.cid, cpi.password)],
-    ) as ws:
+    disconnect = asyncio.create_task(wait_for_disconnect(charge_point_id))
+    try:
+        await asyncio.wait([twin, disconnect], return_when=asyncio.FIRST_COMPLETED)
+        if twin.done():
+            return twin.result()
         try:
-            if cpi.ocpp_protocol == Protocol.v16:
-                logger.warning("Create V16 station")
-                cp = CpV16(cpi.cid, ws)
-            elif cpi.ocpp_protocol == Protocol.v201:
-                logger.warning("Create V201 station")
-                cp = CpV201(cpi.cid, ws)
-            else:
-                raise Exception(f"Invalid protocol {cpi.ocpp_protocol}")
-            cp.cpi = cpi
-            cp.ocpp_configuration = configuration
-            await asyncio.gather(*cp.get_processes())
-        except websockets.ConnectionClosed as e:
-            logging.warning(f"Connections closed {cpi.cid}", e)
+            disconnect_id = disconnect.result()
+        except Exception as error:
+            logger.error(f"error waiting for disconnect requests: {error}")
+            return await twin
+        await report_progress(
+            disconnect_id, charge_point_id, FleetTwinState.disconnecting
+        )
+        # closing the websocket instead of killing the worker process
+        twin.cancel()
+        await asyncio.gather(twin, return_exceptions=True)
+        await report_progress(
+            disconnect_id, charge_point_id, FleetTwinState.disconnected
+        )
+    finally:
+        disconnect.cancel()
+        await asyncio.gather(disconnect, return_exceptions=True)
+        await close_actions_subscriber()
+        await close_state_buffer()
+        await close_quota_accountant()
+        await close_meter_value_buffer()
+        await close_telemetry_publisher()
+        await close_fleet_client()
+        await close_session()
+
+
+@worker_process_init.connect
+def configure_worker_logging(**kwargs):
+    configure_logging()
 
 
 @app_celery.task
 def create_charger(_input: str):
-    charge_point_id = json.loads(_input).get("charge_point_id")
-    async_to_sync(create_charger_async)(charge_point_id)
+    request = json.loads(_input)
+    async_to_sync(run_charger_task)(
+        request.get("charge_point_id"), request.get("operation_id")
+    )
     return "Charger done"
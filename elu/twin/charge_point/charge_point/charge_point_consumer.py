@@ -1,15 +1,31 @@
 import asyncio
-import json
-from asyncio import Queue, Task
+from abc import ABC, abstractmethod
+from asyncio import Task
 from typing import Coroutine
 
-import redis
 from loguru import logger
-from sqlmodel import SQLModel
+from websockets import ConnectionClosed
+
 from elu.twin.charge_point import requests
-from elu.twin.charge_point.charge_point.models.charge_point import actions
-from elu.twin.charge_point.env import REDIS_HOSTNAME, REDIS_DB_ACTIONS, REDIS_PORT
-from elu.twin.data.enums import PowerType, is_dc, ConnectorStatus, EvseStatus
+from elu.twin.charge_point.actions_subscriber import (
+    ActionsSubscriber,
+    get_actions_subscriber,
+)
+from elu.twin.charge_point.env import TWIN_TELEMETRY
+from elu.twin.charge_point.latency import LatencyRecorder
+from elu.twin.charge_point.log import TwinLogger, set_twin_debug
+from elu.twin.charge_point.metrics import ActionsQueue, get_call_metrics
+from elu.twin.charge_point.state_buffer import get_state_buffer
+from elu.twin.charge_point.clock import get_clock
+from elu.twin.charge_point.telemetry import get_telemetry_publisher
+from elu.twin.data.enums import (
+    PowerType,
+    is_dc,
+    ConnectorStatus,
+    EvseStatus,
+    TelemetryKind,
+)
+from elu.twin.data.schemas.actions import RedisRequestTwinDebug
 from elu.twin.data.schemas.charge_point import OutputChargePoint as Cpi
 from elu.twin.data.schemas.charging_profile import SetChargingProfilePayload
 from elu.twin.data.schemas.common import Index
@@ -19,16 +35,133 @@ from elu.twin.data.schemas.transaction import (
 )
 
 from ocpp.v16.call import SetChargingProfilePayload as OcppSetChargingProfilePayload
+from ocpp.v16.enums import ChargePointStatus
 
 
-class ChargePointConsumer:
-    def __init__(self):
+class ChargePointConsumer(ABC):
+    def __init__(self, cid: str):
+        """
+        :param cid: id of the charge point in OCPP, bound to its logs
+        """
         self.cpi: Cpi | None = None
-        self.actions_queue: Queue = Queue()
+        self.actions_queue = ActionsQueue()
         self.actions_set: set[Task] = set()
+        # set once the CSMS accepts the BootNotification of a connection,
+        # cleared until the twin reconnects
+        self.online = asyncio.Event()
+        self.log = TwinLogger(cid)
+        # measures the round-trip time of the messages sent, e.g. in load tests
+        self.latency_recorder: LatencyRecorder | None = None
+
+    @abstractmethod
+    def get_connection_processes(self) -> list[Coroutine]:
+        """Processes started again on each connection to the CSMS"""
+
+    @abstractmethod
+    def get_session_processes(self) -> list[Coroutine]:
+        """Processes running as long as the twin, across reconnections"""
+
+    def set_connection(self, connection):
+        """Attach the twin to the websocket of a new connection to the CSMS,
+        keeping its state, queues and session processes
+
+        :param connection: websocket of the connection
+        """
+        self._connection = connection
+
+    def get_processes(self) -> list[Coroutine]:
+        return self.get_connection_processes() + self.get_session_processes()
+
+    async def measure_call(self, send, payload, **kwargs):
+        """Send a message, counted and timed in the metrics
+
+        :param send: call of the ocpp charge point
+        :param payload: call payload
+        :return: response
+        """
+        sent, duration = get_call_metrics(type(payload))
+        sent.inc()
+        with duration.time():
+            return await send(self, payload, **kwargs)
+
+    async def call_boot_notification(self, send, payload, **kwargs):
+        """Send a BootNotification, the twin is online once it is accepted
+
+        :param send: call of the ocpp charge point
+        :param payload: BootNotification payload
+        :return: response
+        """
+        response = await self.measure_call(send, payload, **kwargs)
+        if getattr(response, "status", None) == "Accepted":
+            self.online.set()
+        return response
+
+    async def call_when_online(self, send, payload, **kwargs):
+        """Send a message once the twin is online
+
+        If the connection closes before the message is sent, it is sent again
+        after the twin reconnects.
+
+        :param send: call of the ocpp charge point
+        :param payload: call payload
+        :return: response
+        """
+        while True:
+            await self.online.wait()
+            try:
+                return await self.measure_call(send, payload, **kwargs)
+            except ConnectionClosed:
+                self.online.clear()
+
+    def publish_telemetry(self, kind: TelemetryKind, index: Index, **values):
+        """Publish changes of the twin to the telemetry streams of its user
+
+        :param kind:
+        :param index: id of the charge point, EVSE, connector or vehicle
+        :param values: changed fields
+        """
+        if TWIN_TELEMETRY:
+            get_telemetry_publisher().update(
+                self.cpi.user_id, kind, index, self.cpi.id, **values
+            )
+
+    def update_charger_status(self, status: ChargePointStatus):
+        """
+
+        :param status:
+        """
+        self.cpi.status = status
+        get_state_buffer().update_charge_point(self.cpi.id, status=status)
+        self.publish_telemetry(TelemetryKind.charge_point, self.cpi.id, status=status)
+
+    def set_statuses(
+        self,
+        status: ChargePointStatus,
+        evse_status: EvseStatus,
+        connector_status: ConnectorStatus,
+    ):
+        """Set the status of the charge point, all its EVSEs and connectors
+
+        :param status:
+        :param evse_status:
+        :param connector_status:
+        """
+        self.update_charger_status(status)
+        state_buffer = get_state_buffer()
+        for evse in self.cpi.evses:
+            evse.status = evse_status
+            state_buffer.update_evse(evse.id, status=evse_status)
+            self.publish_telemetry(TelemetryKind.evse, evse.id, status=evse_status)
+            for connector in evse.connectors:
+                connector.status = connector_status
+                state_buffer.update_connector(connector.id, status=connector_status)
+                self.publish_telemetry(
+                    TelemetryKind.connector, connector.id, status=connector_status
+                )
 
     async def update_vehicle_soc(self, vid: Index, soc: float):
-        await requests.update_vehicle_soc(vid=vid, soc=soc)
+        get_state_buffer().update_vehicle(vid, soc=soc)
+        self.publish_telemetry(TelemetryKind.vehicle, vid, soc=soc)
 
     async def update_connector_status(
         self, evse: int, connector: int, status: ConnectorStatus
@@ -40,10 +173,15 @@ class ChargePointConsumer:
         :param status:
         """
         self.cpi.evses[evse].connectors[connector].status = status
-        await requests.update_connector_status(
-            self.cpi.evses[evse].connectors[connector].id, status
+        get_state_buffer().update_connector(
+            self.cpi.evses[evse].connectors[connector].id, status=status
         )
-        await asyncio.sleep(1)
+        self.publish_telemetry(
+            TelemetryKind.connector,
+            self.cpi.evses[evse].connectors[connector].id,
+            status=status,
+        )
+        await get_clock().sleep(1)
 
     async def update_evse_status(
         self, evse: int, status: EvseStatus, active_connector: int | None = None
@@ -57,10 +195,16 @@ class ChargePointConsumer:
         self.cpi.evses[evse].status = status
         self.cpi.evses[evse].active_connector_id = active_connector
         evse_id = self.cpi.evses[evse].id
-        await requests.update_evse_status(
-            evse_id=evse_id, status=status, active_connector=active_connector
+        get_state_buffer().update_evse(
+            evse_id, status=status, active_connector_id=active_connector
+        )
+        self.publish_telemetry(
+            TelemetryKind.evse,
+            evse_id,
+            status=status,
+            active_connector_id=active_connector,
         )
-        await asyncio.sleep(1)
+        await get_clock().sleep(1)
 
     def get_connector_meter_value(self, evse_id: int, connector_id: int):
         """
@@ -128,7 +272,37 @@ class ChargePointConsumer:
 
         :param obj:
         """
-        await self.actions_queue.put(obj)
+        await self.actions_queue.put((obj, None))
+
+    def _start_action(
+        self,
+        action: Coroutine,
+        subscriber: ActionsSubscriber,
+        ack_id,
+        ack_on_start: bool = False,
+    ):
+        """Run an action in a task, acknowledged once the task is done
+
+        :param action:
+        :param subscriber: subscriber that delivered the action
+        :param ack_id: delivered with the action
+        :param ack_on_start: acknowledge the action as soon as the twin accepts
+            it, for the transactions whose task lasts the whole session
+        """
+        task = asyncio.create_task(action)
+        self.actions_set.add(task)
+        task.add_done_callback(self.actions_set.discard)
+        if ack_on_start:
+            subscriber.ack(ack_id)
+            return
+
+        def ack(done: Task):
+            # actions cancelled with the twin are not acknowledged, they are
+            # delivered again with the stream transport
+            if not done.cancelled():
+                subscriber.ack(ack_id)
+
+        task.add_done_callback(ack)
 
     async def process_actions(self):
         """
@@ -136,78 +310,57 @@ class ChargePointConsumer:
         Process actions
 
         """
+        subscriber = get_actions_subscriber()
         while True:
-            obj = await self.actions_queue.get()
+            obj, ack_id = await self.actions_queue.get()
             if isinstance(obj, RedisRequestStartTransaction):
                 start_transaction: RedisRequestStartTransaction = obj
-                logger.debug("start: ", start_transaction)
+                self.log.debug("start: {}", start_transaction)
                 self.actions_queue.task_done()
-                task = asyncio.create_task(
-                    self.start_transaction(**start_transaction.dict())
+                self._start_action(
+                    self.start_transaction(**start_transaction.dict()),
+                    subscriber,
+                    ack_id,
+                    ack_on_start=True,
                 )
-                self.actions_set.add(task)
-                task.add_done_callback(self.actions_set.discard)
             elif isinstance(obj, RedisRequestStopTransaction):
                 stop_transaction: RedisRequestStopTransaction = obj
                 self.actions_queue.task_done()
-                task = asyncio.create_task(
-                    self.stop_transaction(**stop_transaction.dict())
+                self._start_action(
+                    self.stop_transaction(**stop_transaction.dict()),
+                    subscriber,
+                    ack_id,
+                    ack_on_start=True,
                 )
-                self.actions_set.add(task)
-                task.add_done_callback(self.actions_set.discard)
             elif isinstance(obj, SetChargingProfilePayload):
                 charging_profile: SetChargingProfilePayload = obj
                 cp_profile = charging_profile.dict()
                 del cp_profile["name"]
                 self.actions_queue.task_done()
-                task = asyncio.create_task(
-                    self.get_on_set_charging_profile(**cp_profile)
+                self._start_action(
+                    self.get_on_set_charging_profile(**cp_profile),
+                    subscriber,
+                    ack_id,
                 )
-                self.actions_set.add(task)
-                task.add_done_callback(self.actions_set.discard)
+            elif isinstance(obj, RedisRequestTwinDebug):
+                set_twin_debug(self.id, obj.enabled)
+                self.actions_queue.task_done()
+                subscriber.ack(ack_id)
             else:
-                logger.warning(f"unknown action: {obj}")
+                self.log.warning("unknown action: {}", obj)
+                self.actions_queue.task_done()
+                subscriber.ack(ack_id)
 
     @logger.catch
     async def consume_actions_redis(self, channel: str):
         """
+        Deliver the actions published on the channel to the actions queue
 
-        :param host:
         :param channel:
         """
-        r = redis.Redis(
-            host=REDIS_HOSTNAME,
-            port=REDIS_PORT,
-            db=REDIS_DB_ACTIONS,
-            decode_responses=True,
-        )
-        p = r.pubsub(ignore_subscribe_messages=True)
-        p.subscribe(channel)
-        while True:
-            message = p.get_message()
-            if message:
-                try:
-                    data = message.get("data")
-                    obj = json.loads(data)
-                    action_name: SQLModel = obj.get("name")
-                    # logger.debug("action: ", action_name)
-                    # logger.debug("obj ", obj)
-                    if action_name in actions:
-                        model: SQLModel = actions.get(action_name)
-                        # logger.debug("model: ", model)
-                        if model:
-                            action = model.model_validate(obj)
-                            # logger.debug("model action: ", action)
-                            await self.add_action_to_queue(action)
-                        else:
-                            logger.warning(
-                                f"model not found: {action_name} not in {actions}"
-                            )
-                    else:
-                        logger.warning(f"action not found: {data}")
-                except Exception as error:
-                    logger.error(f"error parsing: {message} with error: {error}")
-                    await asyncio.sleep(3)
-            #                    p = r.pubsub()
-            #                    p.subscribe(channel)
-            await asyncio.sleep(1)
+        subscriber = get_actions_subscriber()
+        await subscriber.register(channel, self.actions_queue)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await subscriber.unregister(channel)
@@ -5,6 +5,7 @@ from datetime import datetime
 from elu.twin.data.enums import (
     TransactionName,
 )
+from elu.twin.data.schemas.actions import RedisRequestTwinDebug
 from elu.twin.data.schemas.charging_profile import SetChargingProfilePayload
 from elu.twin.data.schemas.transaction import (
     RedisRequestStartTransaction,
@@ -33,4 +34,5 @@ actions = {
     TransactionName.start_transaction: RedisRequestStartTransaction,
     TransactionName.stop_transaction: RedisRequestStopTransaction,
     "charging_profile": SetChargingProfilePayload,
+    "twin_debug": RedisRequestTwinDebug,
 }
@@ -0,0 +1,83 @@
+"""Transaction related messages of a charge point, kept while it is offline
+
+StartTransaction, StopTransaction and MeterValues messages are delivered in
+order, once the twin is online again. A message refused by the CSMS, or left
+without response, is sent again after TransactionMessageRetryInterval times
+the number of attempts, and dropped after TransactionMessageAttempts attempts.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable
+
+from loguru import logger
+from ocpp.exceptions import OCPPError
+from websockets import ConnectionClosed
+
+from elu.twin.charge_point.clock import get_clock
+
+
+class TransactionMessageQueue:
+    def __init__(
+        self,
+        send: Callable[[Any], Awaitable[Any]],
+        online: asyncio.Event,
+        attempts: Callable[[], int] = lambda: 3,
+        retry_interval: Callable[[], int] = lambda: 30,
+    ):
+        """
+        :param send: send a message and return the response, raising on errors
+        :param online: set while the charge point is connected
+        :param attempts: TransactionMessageAttempts of the charge point
+        :param retry_interval: TransactionMessageRetryInterval in s
+        """
+        self.send = send
+        self.online = online
+        self.attempts = attempts
+        self.retry_interval = retry_interval
+        self.queue: asyncio.Queue[tuple[Any, asyncio.Future | None]] = asyncio.Queue()
+
+    def __len__(self) -> int:
+        return self.queue.qsize()
+
+    async def put(self, payload, wait: bool = True):
+        """Queue a message
+
+        :param payload: call payload
+        :param wait: wait until the message is delivered
+        :return: response, None if the message was dropped or not awaited
+        """
+        future = asyncio.get_running_loop().create_future() if wait else None
+        self.queue.put_nowait((payload, future))
+        if future is not None:
+            return await future
+
+    async def _deliver(self, payload):
+        attempt = 0
+        while True:
+            await self.online.wait()
+            try:
+                return await self.send(payload)
+            except ConnectionClosed:
+                # not an attempt, sent again on the next connection
+                self.online.clear()
+            except (OCPPError, asyncio.TimeoutError):
+                attempt += 1
+                if attempt >= self.attempts():
+                    raise
+                await get_clock().sleep(self.retry_interval() * attempt)
+
+    async def run(self):
+        """Deliver the queued messages, one at a time"""
+        while True:
+            payload, future = await self.queue.get()
+            try:
+                response = await self._deliver(payload)
+            except asyncio.CancelledError:
+                if future is not None:
+                    future.cancel()
+                raise
+            except Exception as error:
+                logger.warning(f"dropped {type(payload).__name__}: {error!r}")
+                response = None
+            if future is not None and not future.done():
+                future.set_result(response)
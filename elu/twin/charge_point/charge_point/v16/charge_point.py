@@ -1,9 +1,7 @@
 import asyncio
-import logging
 from dataclasses import asdict
 from datetime import datetime
 from typing import Coroutine, Tuple, Optional
-import copy
 
 from loguru import logger
 
@@ -14,10 +12,9 @@ from elu.twin.data.enums import (
     ConnectorStatus,
     VehicleStatus,
     TransactionStatus,
+    TelemetryKind,
 )
-from elu.twin.data.helpers import get_now
 from elu.twin.data.schemas.common import Index
-from elu.twin.data.schemas.connector import UpdateConnector
 from elu.twin.data.schemas.ocpp_configuration import (
     OutputOcppConfigurationV16,
     is_read_only,
@@ -27,7 +24,6 @@ from elu.twin.data.schemas.schedule import Schedule
 from elu.twin.data.schemas.transaction import (
     RequestStopTransaction,
     RequestStartTransaction,
-    UpdateTransaction,
 )
 from ocpp.v16 import ChargePoint as Cp, call
 from ocpp.v16 import call_result
@@ -76,16 +72,54 @@ from elu.twin.charge_point.charge_point.charge_point_consumer import (
 from elu.twin.charge_point.charge_point.models.charge_point import (
     Reservation,
 )
+from elu.twin.charge_point.charge_point.transaction_queue import (
+    TransactionMessageQueue,
+)
 
-from elu.twin.charge_point.env import VID_PREFFIX
+from elu.twin.charge_point.clock import get_clock, get_now
+from elu.twin.charge_point.env import TWIN_METER_VALUES_HISTORY, VID_PREFFIX
+from elu.twin.charge_point.meter_history import get_meter_value_buffer
+from elu.twin.charge_point.quota import QuotaExhausted, get_quota_accountant
+from elu.twin.charge_point.state_buffer import get_state_buffer
 from elu.twin.charge_point.generator import generate_protocol
 from elu.twin.data.tables import AssignedChargingProfile, ChargingSchedulePeriod
+from elu.twin.simulation import physics
+from elu.twin.simulation.fleet import get_fleet_state
+
+
+# delivered in order, even if the twin goes offline
+TRANSACTION_MESSAGES = (
+    call.StartTransactionPayload,
+    call.StopTransactionPayload,
+    call.MeterValuesPayload,
+)
 
 
 class ChargePointBase(Cp, ChargePointConsumer):
     def __init__(self, *args, **kwargs):
         Cp.__init__(self, *args, **kwargs)
-        ChargePointConsumer.__init__(self)
+        ChargePointConsumer.__init__(self, self.id)
+        self.transaction_messages = TransactionMessageQueue(
+            send=lambda payload: self.measure_call(Cp.call, payload, suppress=False),
+            online=self.online,
+            attempts=lambda: self.ocpp_configuration.TransactionMessageAttempts,
+            retry_interval=lambda: (
+                self.ocpp_configuration.TransactionMessageRetryInterval
+            ),
+        )
+
+    async def call(self, payload, suppress=True, unique_id=None):
+        if isinstance(payload, call.BootNotificationPayload):
+            return await self.call_boot_notification(
+                Cp.call, payload, suppress=suppress, unique_id=unique_id
+            )
+        if isinstance(payload, TRANSACTION_MESSAGES):
+            # meter values do not hold the charging loop while offline
+            wait = not isinstance(payload, call.MeterValuesPayload)
+            return await self.transaction_messages.put(payload, wait=wait)
+        return await self.call_when_online(
+            Cp.call, payload, suppress=suppress, unique_id=unique_id
+        )
 
 
 generate_protocol(
@@ -97,22 +131,46 @@ class ChargePoint(ChargePointBase):
     def __init__(self, *args, **kwargs):
         ChargePointBase.__init__(self, *args, **kwargs)
         self.ocpp_configuration: OutputOcppConfigurationV16 | None = None
+        # the statuses are reset on the first boot only, not on reconnections
+        self.booted = False
+        # set when a stop is queued, wakes the charging loop of the connector
+        self.stop_charging_events: dict[tuple[int, int], asyncio.Event] = {}
+        # slot of each charging connector in the fleet state
+        self.fleet_slots: dict[tuple[int, int], int] = {}
+        # cleared when the charging profiles change
+        self.profile_indexes: dict[tuple[int, int], physics.ProfileIndex] = {}
+
+    def _get_stop_charging_event(self, eix: int, cix: int) -> asyncio.Event:
+        return self.stop_charging_events.setdefault((eix, cix), asyncio.Event())
+
+    def _get_profile_index(
+        self, eix: int, cix: int, start_time: datetime
+    ) -> physics.ProfileIndex:
+        index = self.profile_indexes.get((eix, cix))
+        if index is None or index.start_time != start_time:
+            index = self.profile_indexes[(eix, cix)] = physics.ProfileIndex(
+                self.cpi.charging_profiles,
+                start_time=start_time,
+                voltage=self.cpi.voltage_dc,
+                evse_id=eix + 1,
+                connector_id=cix + 1,
+            )
+        return index
+
+    def _release_fleet_slot(self, eix: int, cix: int):
+        """Copy the final meter of a connector and free its fleet slot"""
+        slot = self.fleet_slots.pop((eix, cix), None)
+        if slot is None:
+            return
+        state = get_fleet_state().stop(slot, get_now(as_string=False).timestamp())
+        connector = self.cpi.evses[eix].connectors[cix]
+        connector.current_energy = state.current_energy
+        connector.total_energy = state.total_energy
 
     async def update_to_connect(self):
-        self.cpi.status = ChargePointStatus.available
-        await requests.update_charger_status(self.cpi.id, self.cpi.status)
-        for evse in self.cpi.evses:
-            evse.status = EvseStatus.available
-            await requests.update_evse_status(
-                evse_id=evse.id,
-                status=evse.status,
-            )
-            for connector in evse.connectors:
-                connector.status = ConnectorStatus.available
-                await requests.update_connector_status(
-                    connector_id=connector.id,
-                    status=connector.status,
-                )
+        self.set_statuses(
+            ChargePointStatus.available, EvseStatus.available, ConnectorStatus.available
+        )
 
     async def get_on_reset(self, **kwargs):
         request = call.ResetPayload(**kwargs)
@@ -186,6 +244,7 @@ class ChargePoint(ChargePointBase):
                 profiles=charging_profiles,
                 duration=duration,
                 charging_rate_unit=charging_rate_unit,
+                now=get_now(as_string=False),
             )
             return composite_schedule
         else:
@@ -213,21 +272,8 @@ class ChargePoint(ChargePointBase):
         Args:
             charging_profile (AssignedChargingProfile): _description_
         """
-        has_been_added = False
-        for i, profile in enumerate(self.cpi.charging_profiles):
-            if (
-                profile.stack_level == charging_profile.stack_level
-                or profile.chargingprofileid == charging_profile.chargingprofileid
-            ):
-                # If a charging profile with the same chargingProfileId,
-                # or the same combination of stackLevel / ChargingProfilePurpose,
-                # exists on the Charge Point, the new charging profile SHALL replace
-                # the existing charging profile,
-                self.cpi.charging_profiles[i] = charging_profile
-                has_been_added = True
-                break
-        if not has_been_added:
-            self.cpi.charging_profiles.append(charging_profile)
+        physics.add_charging_profile(self.cpi.charging_profiles, charging_profile)
+        self.profile_indexes.clear()
 
     async def get_on_set_charging_profile(self, **kwargs):
         response = call.SetChargingProfilePayload(**kwargs)
@@ -304,6 +350,8 @@ class ChargePoint(ChargePointBase):
             None,
         )
         if connector:
+            # the backend checks the state of the transaction
+            await get_state_buffer().flush()
             message = await requests.stop_transaction(
                 transaction=RequestStopTransaction(
                     transaction_id=request.transaction_id
@@ -335,7 +383,7 @@ class ChargePoint(ChargePointBase):
             (None, None),
         )
         if (evse_id is None) or (connector_id is None):
-            logging.warning(f"Connector {request.connector_id} not found")
+            self.log.warning("Connector {} not found", request.connector_id)
             return call_result.RemoteStartTransactionPayload(
                 status=RemoteStartStopStatus.rejected
             )
@@ -343,11 +391,13 @@ class ChargePoint(ChargePointBase):
             self.cpi.evses[evse_id].connectors[connector_id].status
             != ConnectorStatus.available
         ):
-            logging.warning(f"Connector {request.connector_id} not available")
+            self.log.warning("Connector {} not available", request.connector_id)
             return call_result.RemoteStartTransactionPayload(
                 status=RemoteStartStopStatus.rejected
             )
 
+        # the backend checks the state of the connector
+        await get_state_buffer().flush()
         transaction = await requests.start_transaction(
             transaction=RequestStartTransaction(
                 connector_id=self.cpi.evses[evse_id].connectors[connector_id].id
@@ -355,7 +405,7 @@ class ChargePoint(ChargePointBase):
             user_id=self.cpi.user_id,
         )
         if transaction is None:
-            logging.warning(f"Transaction not started")
+            self.log.warning("Transaction not started")
             return call_result.RemoteStartTransactionPayload(
                 status=RemoteStartStopStatus.rejected
             )
@@ -391,7 +441,7 @@ class ChargePoint(ChargePointBase):
                 status=ConfigurationStatus.accepted
             )
         except Exception as e:
-            logging.error(e)
+            self.log.error("error changing configuration: {}", e)
             return call_result.ChangeConfigurationPayload(
                 status=ConfigurationStatus.rejected
             )
@@ -528,6 +578,7 @@ class ChargePoint(ChargePointBase):
             if by_id and by_connector and by_purpose and by_stack:
                 keep_profiles.append(cp)
         self.cpi.charging_profiles = keep_profiles
+        self.profile_indexes.clear()
         #  TODO: update list in end point
         return call_result.ClearChargingProfilePayload(
             status=ClearChargingProfileStatus.accepted
@@ -554,12 +605,14 @@ class ChargePoint(ChargePointBase):
                     self.cpi.evses[eix].connectors[
                         cix
                     ].queued_action = ConnectorQueuedActions.stop_charging
+                    self._get_stop_charging_event(eix, cix).set()
                     filtered_profiles = [
                         item
                         for item in self.cpi.charging_profiles
                         if item.connector_id != connector.connectorid
                     ]
                     self.cpi.charging_profiles = filtered_profiles
+                    self.profile_indexes.clear()
 
     async def get_on_unlock_connector(self, **kwargs):
         request = call.UnlockConnectorPayload(**kwargs)
@@ -579,7 +632,10 @@ class ChargePoint(ChargePointBase):
 
         # Get vehicle info
         vehicle = await requests.get_vehicle(transaction.vehicle_id)
-        await requests.update_vehicle_status(vehicle.id, VehicleStatus.charging)
+        get_state_buffer().update_vehicle(vehicle.id, status=VehicleStatus.charging)
+        self.publish_telemetry(
+            TelemetryKind.vehicle, vehicle.id, status=VehicleStatus.charging
+        )
 
         # Get evse and connectors indexes
         eix, cix = next(
@@ -596,7 +652,7 @@ class ChargePoint(ChargePointBase):
         await self.update_evse_status(
             evse=eix, status=EvseStatus.busy, active_connector=cix
         )
-        await asyncio.sleep(delay_between_actions)
+        await get_clock().sleep(delay_between_actions)
 
         # Update connector status
         preparing = call.StatusNotificationPayload(
@@ -607,7 +663,7 @@ class ChargePoint(ChargePointBase):
         )
         await self.send_status_notification(**asdict(preparing))
         await self.update_connector_status(eix, cix, ConnectorStatus.preparing)
-        await asyncio.sleep(delay_between_actions)
+        await get_clock().sleep(delay_between_actions)
 
     async def _try_authorize(
         self, id_tag: str, ocpp_connector_id: int, delay_between_actions: int = 1
@@ -629,7 +685,7 @@ class ChargePoint(ChargePointBase):
             response: call_result.AuthorizePayload = await self.send_authorize(
                 **asdict(authorize)
             )
-            print("response", response)
+            self.log.debug("authorize response: {}", response)
         return response
 
         # TODO Implement authorization in CSMS
@@ -684,13 +740,13 @@ class ChargePoint(ChargePointBase):
         #                self.cpi.user_id, self.cpi.cid, reservation_id
         #            )
 
-        _ = await requests.update_transaction(
+        get_state_buffer().update_transaction(
             transaction_id,
-            transaction_update=UpdateTransaction(
-                status=TransactionStatus.accepted,
-                transactionid=response_start.transaction_id,
-            ),
+            status=TransactionStatus.accepted,
+            transactionid=response_start.transaction_id,
         )
+        # the backend only stops accepted or running transactions
+        await get_state_buffer().flush()
         return response_start
 
     async def _prepare_charging(
@@ -698,6 +754,7 @@ class ChargePoint(ChargePointBase):
         eix: int,
         cix: int,
         initial_soc: float,
+        battery: float,
         ocpp_connector_id: int,
         id_tag: str,
         current_scale: int,
@@ -714,7 +771,15 @@ class ChargePoint(ChargePointBase):
         self.cpi.evses[eix].connectors[cix].current_dc_voltage = self.cpi.voltage_dc
         self.cpi.evses[eix].connectors[cix].current_energy = 0
         self.cpi.evses[eix].connectors[cix].soc = initial_soc
-        connector_update = UpdateConnector(
+        self.fleet_slots[(eix, cix)] = get_fleet_state().start(
+            get_now(as_string=False).timestamp(),
+            initial_soc=initial_soc,
+            battery=battery,
+            total_energy=self.cpi.evses[eix].connectors[cix].total_energy,
+            maximum_power=self.cpi.maximum_dc_power,
+        )
+        get_state_buffer().update_connector(
+            self.cpi.evses[eix].connectors[cix].id,
             current_dc_power=self.cpi.maximum_dc_power,
             current_dc_current=int(self.cpi.maximum_dc_power / self.cpi.voltage_dc),
             current_dc_voltage=self.cpi.voltage_dc,
@@ -724,12 +789,8 @@ class ChargePoint(ChargePointBase):
             id_tag=id_tag,
             transactionid=transactionid,
         )
-        await requests.update_connector_values(
-            connector_id=self.cpi.evses[eix].connectors[cix].id,
-            connector_update=connector_update,
-        )
 
-        await asyncio.sleep(delay_between_actions)
+        await get_clock().sleep(delay_between_actions)
         charging = call.StatusNotificationPayload(
             connector_id=ocpp_connector_id,
             error_code=ChargePointErrorCode.no_error,
@@ -738,47 +799,23 @@ class ChargePoint(ChargePointBase):
         )
         await self.send_status_notification(**asdict(charging))
         await self.update_connector_status(eix, cix, ConnectorStatus.charging)
-        await asyncio.sleep(delay_between_actions)
+        await get_clock().sleep(delay_between_actions)
 
-        _ = await requests.update_transaction(
-            transaction_id,
-            transaction_update=UpdateTransaction(status=TransactionStatus.running),
+        get_state_buffer().update_transaction(
+            transaction_id, status=TransactionStatus.running
         )
+        await get_state_buffer().flush()
 
     async def get_power(
         self, evse_id: int, connector_id: int, soc: int, vid: str, start_time: datetime
     ):
-        # Todo: check datetimes are both same time-zone
-        if self.cpi.charging_profiles:
-            print("profiles: ", self.cpi.charging_profiles)
-            self.cpi.charging_profiles.sort(key=lambda x: x.stack_level, reverse=True)
-            # Todo: filter for 0 connector or specific connector
-            profile = self.cpi.charging_profiles[0]
-            start_time = profile.valid_from
-            current_time = get_now(as_string=False)
-            time_difference = current_time - start_time
-            time_difference_seconds = int(time_difference.total_seconds())
-
-            # Todo: need to get transaction id
-            schedules = [
-                p
-                for p in profile.charging_schedule_period
-                if p.start_period <= time_difference_seconds
-            ]
-            schedules.sort(key=lambda x: x.start_period, reverse=True)
-            schedule = schedules[0]
-            if profile.charging_rate_unit == ChargingRateUnitType.watts:
-                power_kw = copy.deepcopy(schedule.limit) / 1000
-            return int(power_kw)
-        else:
-            power = (
-                self.cpi.evses[evse_id].connectors[connector_id].current_dc_power
-            ) = (
-                self.cpi.maximum_dc_power
-                if self.cpi.evses[evse_id].connectors[connector_id].soc < 100
-                else 0
-            )
-            return power
+        power = self._get_profile_index(evse_id, connector_id, start_time).get_power(
+            maximum_power=self.cpi.maximum_dc_power,
+            soc=self.cpi.evses[evse_id].connectors[connector_id].soc,
+            now=get_now(as_string=False),
+        )
+        self.cpi.evses[evse_id].connectors[connector_id].current_dc_power = power
+        return power
 
     async def _charging_cycle(
         self,
@@ -811,35 +848,28 @@ class ChargePoint(ChargePointBase):
             current_scale (_type_): _description_
         """
 
-        self.cpi.evses[eix].connectors[cix].current_dc_power = await self.get_power(
+        fleet = get_fleet_state()
+        slot = self.fleet_slots[(eix, cix)]
+        now = get_now(as_string=False).timestamp()
+        fleet.sync(now)
+        connector = self.cpi.evses[eix].connectors[cix]
+        connector.soc = int(fleet.soc[slot])
+
+        connector.current_dc_power = await self.get_power(
             evse_id=eix,
             connector_id=cix,
-            soc=self.cpi.evses[eix].connectors[cix].soc,
+            soc=connector.soc,
             vid=vehicle.id,
             start_time=transaction_start_time,
         )
 
-        print("actual power: ", self.cpi.evses[eix].connectors[cix].current_dc_power)
+        self.log.debug("power of connector {}: {}", cix, connector.current_dc_power)
 
-        add_energy = (
-            self.cpi.evses[eix].connectors[cix].current_dc_power
-            * (meter_values_interval / 3600.0)
-            * 1000
-        )
-        add_energy = int(add_energy)
-        self.cpi.evses[eix].connectors[cix].current_energy += add_energy
-        int(self.cpi.evses[eix].connectors[cix].current_energy)
-        self.cpi.evses[eix].connectors[cix].soc = min(
-            100,
-            int(
-                initial_soc
-                + self.cpi.evses[eix].connectors[cix].current_energy
-                / 1000
-                * 100
-                / battery
-            ),
-        )
-        self.cpi.evses[eix].connectors[cix].total_energy += add_energy
+        fleet.set_power(slot, connector.current_dc_power, now)
+        state = fleet.read(slot)
+        connector.current_energy = state.current_energy
+        connector.total_energy = state.total_energy
+        connector.soc = int(state.soc)
         list_meter_value = await self.get_meter_value_event(
             self.cpi.evses[eix].connectors[cix].current_dc_power,
             int(self.cpi.evses[eix].connectors[cix].total_energy),
@@ -851,13 +881,13 @@ class ChargePoint(ChargePointBase):
             meter_value=list_meter_value,
         )
         await self.send_meter_values(**asdict(meter_value))
-        _ = await requests.update_transaction(
+        state_buffer = get_state_buffer()
+        state_buffer.update_transaction(
             transaction_id,
-            transaction_update=UpdateTransaction(
-                energy=int(self.cpi.evses[eix].connectors[cix].current_energy),
-            ),
+            energy=int(self.cpi.evses[eix].connectors[cix].current_energy),
         )
-        connector_update = UpdateConnector(
+        state_buffer.update_connector(
+            self.cpi.evses[eix].connectors[cix].id,
             current_dc_power=self.cpi.evses[eix].connectors[cix].current_dc_power,
             current_dc_current=int(
                 current_scale
@@ -871,22 +901,50 @@ class ChargePoint(ChargePointBase):
             id_tag=id_tag,
             transactionid=response_start.transaction_id,
         )
-        await requests.update_connector_values(
-            self.cpi.evses[eix].connectors[cix].id, connector_update
+        state_buffer.update_vehicle(
+            vehicle.id, soc=self.cpi.evses[eix].connectors[cix].soc
         )
-        await requests.update_vehicle_soc(
-            vehicle.id, self.cpi.evses[eix].connectors[cix].soc
+        if TWIN_METER_VALUES_HISTORY:
+            get_meter_value_buffer().append(
+                now,
+                self.cpi.id,
+                connector.id,
+                user_id=self.cpi.user_id,
+                transaction_id=transaction_id,
+                power=connector.current_dc_power,
+                current=current_scale
+                * connector.current_dc_power
+                / self.cpi.voltage_dc,
+                voltage=self.cpi.voltage_dc,
+                energy=connector.current_energy,
+                total_energy=connector.total_energy,
+                soc=connector.soc,
+            )
+        self.publish_telemetry(
+            TelemetryKind.connector,
+            connector.id,
+            transaction_id=transaction_id,
+            power=connector.current_dc_power,
+            energy=connector.current_energy,
+            total_energy=connector.total_energy,
+            soc=connector.soc,
         )
+        self.publish_telemetry(TelemetryKind.vehicle, vehicle.id, soc=connector.soc)
 
     async def _continue_charging(self, eix, cix, meter_values_interval) -> bool:
-        for i in range(meter_values_interval):
-            if (
-                self.cpi.evses[eix].connectors[cix].queued_action
-                == ConnectorQueuedActions.stop_charging
-            ):
-                return False
-            await asyncio.sleep(1)
-        return True
+        """Wait until the next meter value sample or a stop request
+
+        :return: false if the charging has to stop
+        """
+        if (
+            self.cpi.evses[eix].connectors[cix].queued_action
+            == ConnectorQueuedActions.stop_charging
+        ):
+            return False
+        stopped = await get_clock().wait(
+            self._get_stop_charging_event(eix, cix), meter_values_interval
+        )
+        return not stopped
 
     async def _finish_transaction(
         self,
@@ -900,7 +958,9 @@ class ChargePoint(ChargePointBase):
         transaction_id: Index,
     ):
         self.cpi.evses[eix].connectors[cix].queued_action = None
-        await asyncio.sleep(delay_between_actions)
+        self._get_stop_charging_event(eix, cix).clear()
+        self._release_fleet_slot(eix, cix)
+        await get_clock().sleep(delay_between_actions)
 
         stop = call.StopTransactionPayload(
             meter_stop=int(self.cpi.evses[eix].connectors[cix].total_energy),
@@ -911,7 +971,7 @@ class ChargePoint(ChargePointBase):
         )
         _ = await self.send_stop_transaction(**asdict(stop))
 
-        _ = await asyncio.sleep(delay_between_actions)
+        _ = await get_clock().sleep(delay_between_actions)
         finishing = call.StatusNotificationPayload(
             connector_id=ocpp_connector_id,
             error_code=ChargePointErrorCode.no_error,
@@ -920,7 +980,7 @@ class ChargePoint(ChargePointBase):
         )
         _ = await self.send_status_notification(**asdict(finishing))
         _ = await self.update_connector_status(eix, cix, ConnectorStatus.finishing)
-        _ = await asyncio.sleep(delay_between_actions)
+        _ = await get_clock().sleep(delay_between_actions)
         available = call.StatusNotificationPayload(
             connector_id=ocpp_connector_id,
             error_code=ChargePointErrorCode.no_error,
@@ -933,7 +993,9 @@ class ChargePoint(ChargePointBase):
         self.cpi.evses[eix].connectors[cix].transactionid = None
         self.cpi.evses[eix].connectors[cix].id_tag = None
 
-        connector_update = UpdateConnector(
+        state_buffer = get_state_buffer()
+        state_buffer.update_connector(
+            self.cpi.evses[eix].connectors[cix].id,
             current_dc_power=0,
             current_dc_current=0,
             current_dc_voltage=self.cpi.voltage_dc,
@@ -942,22 +1004,27 @@ class ChargePoint(ChargePointBase):
             soc=None,
             id_tag=None,
             transactionid=None,
-            transaction_id=None,
         )
-        _ = await requests.update_connector_values(
-            self.cpi.evses[eix].connectors[cix].id, connector_update
+
+        self.publish_telemetry(
+            TelemetryKind.connector,
+            self.cpi.evses[eix].connectors[cix].id,
+            transaction_id=None,
+            power=0,
+            energy=0,
+            total_energy=self.cpi.evses[eix].connectors[cix].total_energy,
+            soc=None,
         )
 
         _ = await self.update_evse_status(eix, status=EvseStatus.available)
-        _ = await requests.update_vehicle_status(
-            vehicle_id, VehicleStatus.ready_to_charge
+        state_buffer.update_vehicle(vehicle_id, status=VehicleStatus.ready_to_charge)
+        self.publish_telemetry(
+            TelemetryKind.vehicle, vehicle_id, status=VehicleStatus.ready_to_charge
         )
-        _ = await requests.update_transaction(
-            transaction_id,
-            transaction_update=UpdateTransaction(
-                status=TransactionStatus.completed, end_time=get_now()
-            ),
+        state_buffer.update_transaction(
+            transaction_id, status=TransactionStatus.completed, end_time=get_now()
         )
+        await state_buffer.flush()
 
     # async def update_local_list(self, id_tag_request: AuthorizationData):
     #     is_too_long = (
@@ -981,9 +1048,10 @@ class ChargePoint(ChargePointBase):
         :param delay_between_actions:
         :return:
         """
+        eix = cix = None
         # Request access
         try:
-            await asyncio.sleep(delay_between_actions)
+            await get_clock().sleep(delay_between_actions)
             vehicle, eix, cix, transaction_start_time = (
                 await self._get_transaction_info(transaction_id)
             )
@@ -1019,6 +1087,7 @@ class ChargePoint(ChargePointBase):
                 eix,
                 cix,
                 initial_soc,
+                battery,
                 ocpp_connector_id,
                 id_tag,
                 current_scale,
@@ -1057,7 +1126,9 @@ class ChargePoint(ChargePointBase):
                 transaction_id,
             )
         except Exception as e:
-            logging.error(f"Error in transaction {transaction_id}: {e}")
+            self.log.error("Error in transaction {}: {}", transaction_id, e)
+            if eix is not None:
+                self._release_fleet_slot(eix, cix)
 
     async def connect_charger(self):
         not_connected = True
@@ -1066,14 +1137,16 @@ class ChargePoint(ChargePointBase):
                 await self.send_boot_notification()
             )
             if response.status == RegistrationStatus.accepted:
-                await self.update_to_connect()
+                if not self.booted:
+                    await self.update_to_connect()
+                    self.booted = True
                 not_connected = False
-            await asyncio.sleep(response.interval)
+            await get_clock().sleep(response.interval)
 
     async def get_on_reserve_now(self, **kwargs):
         request = call.ReserveNowPayload(**kwargs)
         exp_date = datetime.strptime(request.expiry_date, "%Y-%m-%dT%H:%M:%S.%fZ")
-        if request.expiry_date > datetime.now().isoformat():
+        if exp_date > get_now(as_string=False).replace(tzinfo=None):
             self.cpi.reservations.append(
                 Reservation(
                     connector_id=request.connector_id,
@@ -1103,26 +1176,49 @@ class ChargePoint(ChargePointBase):
 
     async def send_heartbeats_with_interval(self):
         while True:
-            await asyncio.sleep(self.ocpp_configuration.HeartbeatInterval)
+            await get_clock().sleep(self.ocpp_configuration.HeartbeatInterval)
             await self.send_heartbeat()
 
-    async def token_counter(self, interval: int = 60):
-        while True:
-            await asyncio.sleep(interval)
-            await requests.consume_quota(
-                self.cpi.quota_id, self.cpi.token_cost_per_minute
-            )
+    async def stop_all_transactions(self, timeout: float = 60):
+        """Stop the charging of all the connectors and wait until the
+        transactions are finished
 
-    def get_processes(self) -> list[Coroutine]:
+        :param timeout: in s, the transactions left are cancelled with the twin
         """
+        for eix, evse in enumerate(self.cpi.evses):
+            for cix, connector in enumerate(evse.connectors):
+                connector.queued_action = ConnectorQueuedActions.stop_charging
+                self._get_stop_charging_event(eix, cix).set()
+        if self.actions_set:
+            await asyncio.wait(self.actions_set, timeout=timeout)
 
-        :return:
+    async def token_counter(self, interval: int = 60):
+        """Consume the tokens of the quota every interval, stop the
+        transactions and the twin when the quota is exhausted
+
+        :param interval: in s
         """
+        accountant = get_quota_accountant()
+        while True:
+            await get_clock().sleep(interval)
+            accountant.consume(self.cpi.quota_id, self.cpi.token_cost_per_minute)
+            if accountant.is_exhausted(self.cpi.quota_id):
+                self.log.warning("quota {} exhausted", self.cpi.quota_id)
+                await self.stop_all_transactions()
+                self.update_charger_status(ChargePointStatus.unavailable)
+                raise QuotaExhausted(f"quota {self.cpi.quota_id} exhausted")
+
+    def get_connection_processes(self) -> list[Coroutine]:
         return [
             self.start(),
             self.connect_charger(),
+            self.send_heartbeats_with_interval(),
+        ]
+
+    def get_session_processes(self) -> list[Coroutine]:
+        return [
             self.process_actions(),
             self.consume_actions_redis(f"actions-{self.cpi.id}"),
-            self.send_heartbeats_with_interval(),
             self.token_counter(),
+            self.transaction_messages.run(),
         ]
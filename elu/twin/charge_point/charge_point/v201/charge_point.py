@@ -28,7 +28,7 @@ from elu.twin.charge_point.charge_point.charge_point_consumer import (
 )
 from elu.twin.charge_point.charge_point.helpers import update_evse_and_connectors
 from elu.twin.charge_point.env import REDIS_HOSTNAME, VID_PREFFIX
-from elu.twin.data.helpers import get_now
+from elu.twin.charge_point.clock import get_clock, get_now
 from elu.twin.charge_point.generator import generate_protocol
 
 from ocpp.v16.enums import ChargePointStatus as Cps
@@ -40,7 +40,16 @@ import inspect
 class ChargePointBase(Cp, ChargePointConsumer):
     def __init__(self, *args, **kwargs):
         Cp.__init__(self, *args, **kwargs)
-        ChargePointConsumer.__init__(self)
+        ChargePointConsumer.__init__(self, self.id)
+
+    async def call(self, payload, suppress=True, unique_id=None):
+        if isinstance(payload, call.BootNotificationPayload):
+            return await self.call_boot_notification(
+                Cp.call, payload, suppress=suppress, unique_id=unique_id
+            )
+        return await self.call_when_online(
+            Cp.call, payload, suppress=suppress, unique_id=unique_id
+        )
 
 
 generate_protocol(
@@ -56,7 +65,7 @@ class ChargePoint(ChargePointBase):
         request = call.HeartbeatPayload()
         while True:
             await self.call(request)
-            await asyncio.sleep(interval)
+            await get_clock().sleep(interval)
 
     async def get_send_boot_notification(
         self, **kwargs
@@ -192,7 +201,7 @@ class ChargePoint(ChargePointBase):
                 meter_value=self.get_meter_value_event(power=10, soc=10, energy=10),
             )
             await self.send_transaction_event(**asdict(event))
-            await asyncio.sleep(interval)
+            await get_clock().sleep(interval)
 
         stop = call.TransactionEventPayload(
             event_type=enums.TransactionEventType.ended,
@@ -205,16 +214,16 @@ class ChargePoint(ChargePointBase):
 
         await self.send_transaction_event(**asdict(stop))
 
-    def get_processes(self) -> list[Coroutine]:
-        """
-
-        :return:
-        """
+    def get_connection_processes(self) -> list[Coroutine]:
         return [
             self.start(),
             self.send_boot_notification(),
             self.send_heartbeat(),
             # self.send_status_notification(),
+        ]
+
+    def get_session_processes(self) -> list[Coroutine]:
+        return [
             self.process_actions(),
             self.consume_actions_redis(f"actions-{self.cpi.id}"),
         ]
@@ -0,0 +1,205 @@
+"""Clock used to pace the twins
+
+Twins read the time with ``get_now`` of this module and wait with
+``get_clock().sleep`` and ``get_clock().wait`` instead of ``datetime.now`` and
+``asyncio.sleep``, so a simulation can run faster than real time:
+
+- ``WallClock``: real time.
+- ``ScaledClock``: real time accelerated by a factor, e.g. 60 runs an hour of
+  charging in a minute.
+- ``VirtualClock``: no relation with real time, the clock jumps to the next
+  wake up of a twin once the event loop is idle.
+
+The clock is selected with ``TWIN_CLOCK`` and ``TWIN_TIME_SCALE``. It paces
+the twin runtime only, the backends stay on wall time (see
+elu.twin.data.helpers.get_now), e.g. for the expiry of the tokens.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import time
+from asyncio import Event, Future, Task
+from datetime import datetime, timedelta, UTC
+
+from elu.twin.charge_point.env import (
+    TWIN_CLOCK,
+    TWIN_TIME_SCALE,
+    TWIN_CLOCK_START,
+    TWIN_CLOCK_IDLE,
+)
+
+
+class Clock:
+    def now(self) -> datetime:
+        raise NotImplementedError
+
+    async def sleep(self, seconds: float):
+        raise NotImplementedError
+
+    async def wait(self, event: Event, timeout: float) -> bool:
+        """Wait until the event is set or the timeout expires
+
+        :param event:
+        :param timeout: seconds of clock time
+        :return: true if the event is set
+        """
+        raise NotImplementedError
+
+
+class WallClock(Clock):
+    def now(self) -> datetime:
+        return datetime.now(UTC)
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+    async def wait(self, event: Event, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+class ScaledClock(Clock):
+    def __init__(self, scale: float, start: datetime | None = None):
+        """
+        :param scale: clock seconds per real second
+        :param start: clock time now, real time if not set
+        """
+        if scale <= 0:
+            raise ValueError(f"time scale must be positive, got {scale}")
+        self.scale = scale
+        self.start = start or datetime.now(UTC)
+        self._started_at = time.monotonic()
+
+    def now(self) -> datetime:
+        elapsed = (time.monotonic() - self._started_at) * self.scale
+        return self.start + timedelta(seconds=elapsed)
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds / self.scale)
+
+    async def wait(self, event: Event, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout / self.scale)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+class VirtualClock(Clock):
+    def __init__(self, start: datetime | None = None, idle: float = 0.0):
+        """
+        :param start: clock time now, real time if not set
+        :param idle: real seconds given to the event loop, e.g. to receive the
+            CSMS responses, before jumping to the next wake up
+        """
+        self.start = start or datetime.now(UTC)
+        self.idle = idle
+        self.elapsed = 0.0
+        self._timers: list[tuple[float, int, Future]] = []
+        self._counter = itertools.count()
+        self._driver: Task | None = None
+
+    def now(self) -> datetime:
+        return self.start + timedelta(seconds=self.elapsed)
+
+    async def sleep(self, seconds: float):
+        if seconds <= 0:
+            await asyncio.sleep(0)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._timers, (self.elapsed + seconds, next(self._counter), future)
+        )
+        if self._driver is None or self._driver.done():
+            self._driver = asyncio.create_task(self._drive())
+        await future
+
+    async def wait(self, event: Event, timeout: float) -> bool:
+        if event.is_set():
+            return True
+        waiter = asyncio.create_task(event.wait())
+        sleeper = asyncio.create_task(self.sleep(timeout))
+        try:
+            await asyncio.wait({waiter, sleeper}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+            sleeper.cancel()
+        return event.is_set()
+
+    async def _settle(self, loop: asyncio.AbstractEventLoop):
+        """Let the woken up twins run until all of them wait again"""
+        await asyncio.sleep(self.idle)
+        # callbacks ready to run, only exposed by the default asyncio loop
+        ready = getattr(loop, "_ready", None)
+        while ready:
+            await asyncio.sleep(0)
+
+    async def _drive(self):
+        """Wake up the sleepers in order, moving the clock to their deadline"""
+        loop = asyncio.get_running_loop()
+        while self._timers:
+            await self._settle(loop)
+            # sleepers cancelled or left by a closed event loop
+            while self._timers and (
+                self._timers[0][2].done() or self._timers[0][2].get_loop() is not loop
+            ):
+                heapq.heappop(self._timers)
+            if not self._timers:
+                return
+            self.elapsed = max(self.elapsed, self._timers[0][0])
+            while self._timers and self._timers[0][0] <= self.elapsed:
+                _, _, future = heapq.heappop(self._timers)
+                if not future.done() and future.get_loop() is loop:
+                    future.set_result(None)
+
+
+def create_clock(
+    mode: str = TWIN_CLOCK,
+    scale: float = TWIN_TIME_SCALE,
+    start: str | None = TWIN_CLOCK_START,
+) -> Clock:
+    """
+    :param mode: wall, scaled or virtual
+    :param scale: clock seconds per real second, scaled mode only
+    :param start: ISO clock start time, real time if not set
+    :return: clock
+    """
+    start_time = datetime.fromisoformat(start) if start else None
+    if start_time is not None and start_time.tzinfo is None:
+        start_time = start_time.replace(tzinfo=UTC)
+    if mode == "wall":
+        return WallClock()
+    if mode == "scaled":
+        return ScaledClock(scale, start_time)
+    if mode == "virtual":
+        return VirtualClock(start_time, idle=TWIN_CLOCK_IDLE)
+    raise ValueError(f"Invalid clock {mode}")
+
+
+_clock: Clock = create_clock()
+
+
+def get_clock() -> Clock:
+    return _clock
+
+
+def set_clock(clock: Clock):
+    """Replace the clock of the process, e.g. to run a simulation
+
+    :param clock:
+    """
+    global _clock
+    _clock = clock
+
+
+def get_now(as_string: bool = True) -> datetime | str:
+    now = _clock.now()
+    if as_string:
+        return now.isoformat()
+    return now
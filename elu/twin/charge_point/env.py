@@ -1,6 +1,7 @@
 """Read configuration parameters"""
 
 from os import environ
+from socket import gethostname
 
 
 BACKEND_PRIVATE_URL = environ.get("BACKEND_PRIVATE_URL", "http://localhost:8001")
@@ -12,6 +13,113 @@ REDIS_DB_CELERY = environ.get("REDIS_DB", "1")
 CELERY_FACTORY_NAME = environ.get("CELERY_FACTORY_NAME", "celery_chargers_factory")
 
 TOPIC_CONNECT_CP = "connect-charge-point"
+# Disconnect requests are published on the TOPIC_DISCONNECT_CP-<charge point id>
+# channel of each charge point
 TOPIC_DISCONNECT_CP = "disconnect-charge-point"
+TOPIC_DISCONNECT_CP_PATTERN = f"{TOPIC_DISCONNECT_CP}-*"
+# Charge point ids scored by the time their connect request is due, for ramped
+# fleet operations, and the connect request of each charge point
+TOPIC_CONNECT_CP_SCHEDULED = "connect-charge-point-scheduled"
+TOPIC_CONNECT_CP_SCHEDULED_REQUESTS = "connect-charge-point-scheduled-requests"
+FLEET_OPERATION_PREFIX = "fleet-operation"
+TOPIC_ACTIONS_PATTERN = "actions-*"
+
+TWIN_HOST_NAME = environ.get("TWIN_HOST_NAME", gethostname())
+TWIN_HOST_MAX_TWINS = int(environ.get("TWIN_HOST_MAX_TWINS", "2000"))
+# Connect requests hydrated in a single request to the private backend
+TWIN_HOST_HYDRATE_BATCH = int(environ.get("TWIN_HOST_HYDRATE_BATCH", "100"))
+# Seconds between two checks of the scheduled connect requests
+TWIN_HOST_SCHEDULE_INTERVAL = float(environ.get("TWIN_HOST_SCHEDULE_INTERVAL", "0.5"))
+
+# Clock pacing the twins, see elu.twin.charge_point.clock. "wall": real time,
+# "scaled": real time accelerated by TWIN_TIME_SCALE, "virtual": time jumps to
+# the next twin wake up as soon as the twins are idle
+TWIN_CLOCK = environ.get("TWIN_CLOCK", "wall")
+TWIN_TIME_SCALE = float(environ.get("TWIN_TIME_SCALE", "1"))
+# ISO start time of the scaled and virtual clocks, now if not set
+TWIN_CLOCK_START = environ.get("TWIN_CLOCK_START")
+# Real seconds the virtual clock lets the event loop run before jumping ahead
+TWIN_CLOCK_IDLE = float(environ.get("TWIN_CLOCK_IDLE", "0.01"))
+
+# Logging of the twin runtime, see elu.twin.charge_point.log
+TWIN_LOG_LEVEL = environ.get("TWIN_LOG_LEVEL", "INFO")
+TWIN_LOG_JSON = environ.get("TWIN_LOG_JSON", "false").lower() == "true"
+# Log records are written by a background thread
+TWIN_LOG_ENQUEUE = environ.get("TWIN_LOG_ENQUEUE", "true").lower() == "true"
+# Comma separated cids of the twins logging their debug messages
+TWIN_LOG_DEBUG = environ.get("TWIN_LOG_DEBUG", "")
+# One in this number of the sampled messages is logged
+TWIN_LOG_SAMPLE = int(environ.get("TWIN_LOG_SAMPLE", "100"))
+
+# Port of the prometheus metrics of a twin host, 0 to disable them
+TWIN_METRICS_PORT = int(environ.get("TWIN_METRICS_PORT", "9100"))
+# Seconds between two measures of the event loop lag
+TWIN_METRICS_LOOP_LAG_INTERVAL = float(
+    environ.get("TWIN_METRICS_LOOP_LAG_INTERVAL", "0.5")
+)
+
+# Reconnection to the CSMS: exponential backoff from the base delay, capped at
+# the max delay, in s, with full jitter. 0 attempts retries forever
+TWIN_RECONNECT_BASE_DELAY = float(environ.get("TWIN_RECONNECT_BASE_DELAY", "1"))
+TWIN_RECONNECT_MAX_DELAY = float(environ.get("TWIN_RECONNECT_MAX_DELAY", "120"))
+TWIN_RECONNECT_ATTEMPTS = int(environ.get("TWIN_RECONNECT_ATTEMPTS", "0"))
+
+# Load test of a CSMS, see elu.twin.charge_point.load_test
+LOAD_TEST_CSMS_URL = environ.get("LOAD_TEST_CSMS_URL", "ws://localhost:9000")
+LOAD_TEST_PASSWORD = environ.get("LOAD_TEST_PASSWORD")
+LOAD_TEST_TWINS = int(environ.get("LOAD_TEST_TWINS", "10"))
+# Messages per second sent by all the twins, and twins connected per second
+LOAD_TEST_RATE = float(environ.get("LOAD_TEST_RATE", "10"))
+LOAD_TEST_CONNECT_RATE = float(environ.get("LOAD_TEST_CONNECT_RATE", "10"))
+LOAD_TEST_DURATION = float(environ.get("LOAD_TEST_DURATION", "60"))
+# Relative weights of the actions sent after the BootNotification
+LOAD_TEST_MIX = environ.get(
+    "LOAD_TEST_MIX",
+    "heartbeat:1,authorize:1,start_transaction:1,stop_transaction:1,meter_values:6",
+)
+LOAD_TEST_TIMEOUT = int(environ.get("LOAD_TEST_TIMEOUT", "30"))
+# Path of the report, without extension, written as .csv and .json
+LOAD_TEST_REPORT = environ.get("LOAD_TEST_REPORT", "load_test")
+
+# Connection pool shared by all twins to call the private backend
+TWIN_HTTP_LIMIT = int(environ.get("TWIN_HTTP_LIMIT", "100"))
+TWIN_HTTP_LIMIT_PER_HOST = int(environ.get("TWIN_HTTP_LIMIT_PER_HOST", "50"))
+TWIN_HTTP_KEEPALIVE_TIMEOUT = float(environ.get("TWIN_HTTP_KEEPALIVE_TIMEOUT", "30"))
+TWIN_HTTP_TIMEOUT = float(environ.get("TWIN_HTTP_TIMEOUT", "30"))
+TWIN_HTTP_CONNECT_TIMEOUT = float(environ.get("TWIN_HTTP_CONNECT_TIMEOUT", "5"))
+
+# "pubsub" or "stream", must match the backend setting
+ACTIONS_TRANSPORT = environ.get("ACTIONS_TRANSPORT", "pubsub")
+ACTIONS_STREAM_GROUP = environ.get("ACTIONS_STREAM_GROUP", "twins")
+# Milliseconds before an action pending in another consumer is claimed again
+ACTIONS_STREAM_CLAIM_IDLE = int(environ.get("ACTIONS_STREAM_CLAIM_IDLE", "60000"))
+ACTIONS_STREAM_BLOCK = int(environ.get("ACTIONS_STREAM_BLOCK", "1000"))
+
+# Seconds between flushes of the twin state updates to the private backend
+TWIN_STATE_FLUSH_INTERVAL = float(environ.get("TWIN_STATE_FLUSH_INTERVAL", "1"))
+# Seconds between flushes of the tokens consumed by the twins, per quota
+TWIN_QUOTA_FLUSH_INTERVAL = float(environ.get("TWIN_QUOTA_FLUSH_INTERVAL", "15"))
+
+# Meter values of the twins kept in the meter value history of the backend, off
+# by default as the history is never pruned. They are sent every
+# TWIN_METER_VALUES_FLUSH_INTERVAL seconds or once TWIN_METER_VALUES_BATCH are
+# waiting. Beyond TWIN_METER_VALUES_MAX_PENDING, e.g. while the backend is
+# down, the oldest are dropped
+TWIN_METER_VALUES_HISTORY = (
+    environ.get("TWIN_METER_VALUES_HISTORY", "false").lower() == "true"
+)
+TWIN_METER_VALUES_FLUSH_INTERVAL = float(
+    environ.get("TWIN_METER_VALUES_FLUSH_INTERVAL", "5")
+)
+TWIN_METER_VALUES_BATCH = int(environ.get("TWIN_METER_VALUES_BATCH", "5000"))
+TWIN_METER_VALUES_MAX_PENDING = int(
+    environ.get("TWIN_METER_VALUES_MAX_PENDING", "100000")
+)
 
 VID_PREFFIX = "VID:"
+
+# Status and meter changes of the twins published on the telemetry channel of
+# their user, coalesced per object for TWIN_TELEMETRY_INTERVAL seconds
+TWIN_TELEMETRY = environ.get("TWIN_TELEMETRY", "true").lower() == "true"
+TWIN_TELEMETRY_INTERVAL = float(environ.get("TWIN_TELEMETRY_INTERVAL", "1"))
+TOPIC_TELEMETRY_PREFIX = environ.get("TOPIC_TELEMETRY_PREFIX", "telemetry")
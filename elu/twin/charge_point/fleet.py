@@ -0,0 +1,171 @@
+"""Fleet operations on the twin side
+
+The backend connects and disconnects many charge points at a given rate. Each
+connect and disconnect request may carry the id of its fleet operation, and a
+``not_before`` timestamp for the requests that are part of a ramp:
+
+- scheduled connect requests wait in the ``TOPIC_CONNECT_CP_SCHEDULED`` sorted
+  set, keyed by charge point so that a disconnect can cancel them, until the
+  twin hosts move them to the ``TOPIC_CONNECT_CP`` list,
+- disconnect requests are published at once on the channel of the charge
+  point, and the owner of the twin waits until ``not_before`` to close it.
+
+The twins write their state in the progress hash of the fleet operation.
+"""
+
+import asyncio
+import json
+import time
+from asyncio import AbstractEventLoop
+from weakref import WeakKeyDictionary
+
+import redis.asyncio as aioredis
+from loguru import logger
+
+from elu.twin.charge_point.env import (
+    REDIS_HOSTNAME,
+    REDIS_PORT,
+    REDIS_DB_ACTIONS,
+    TOPIC_CONNECT_CP,
+    TOPIC_CONNECT_CP_SCHEDULED,
+    TOPIC_CONNECT_CP_SCHEDULED_REQUESTS,
+    TOPIC_DISCONNECT_CP,
+    FLEET_OPERATION_PREFIX,
+)
+from elu.twin.data.enums import FleetTwinState
+from elu.twin.data.schemas.common import Index
+
+
+def get_operation_key(operation_id: str) -> str:
+    return f"{FLEET_OPERATION_PREFIX}:{operation_id}"
+
+
+def get_progress_key(operation_id: str) -> str:
+    return f"{FLEET_OPERATION_PREFIX}:{operation_id}:twins"
+
+
+def get_disconnect_channel(charge_point_id: Index) -> str:
+    return f"{TOPIC_DISCONNECT_CP}-{charge_point_id}"
+
+
+def get_request(
+    charge_point_id: Index,
+    operation_id: str | None = None,
+    not_before: float | None = None,
+) -> str:
+    """Message of a connect or disconnect request
+
+    :param charge_point_id:
+    :param operation_id: fleet operation of the request
+    :param not_before: timestamp before which the request is not executed
+    :return: json message
+    """
+    request = {"charge_point_id": charge_point_id}
+    if operation_id is not None:
+        request["operation_id"] = operation_id
+    if not_before is not None:
+        request["not_before"] = not_before
+    return json.dumps(request)
+
+
+async def wait_until(not_before: float | None):
+    if not_before is not None:
+        await asyncio.sleep(max(not_before - time.time(), 0))
+
+
+_clients: WeakKeyDictionary[AbstractEventLoop, aioredis.Redis] = WeakKeyDictionary()
+
+
+def get_fleet_client() -> aioredis.Redis:
+    """Return the redis client of the running event loop
+
+    :return: shared redis client
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _clients:
+        _clients[loop] = aioredis.Redis(
+            host=REDIS_HOSTNAME,
+            port=REDIS_PORT,
+            db=REDIS_DB_ACTIONS,
+            decode_responses=True,
+        )
+    return _clients[loop]
+
+
+async def close_fleet_client():
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def report_progress(
+    operation_id: str | None, charge_point_id: Index, state: FleetTwinState
+):
+    """Write the state of a twin in the progress of its fleet operation
+
+    :param operation_id: nothing is written if None
+    :param charge_point_id:
+    :param state:
+    """
+    if operation_id is None:
+        return
+    try:
+        await get_fleet_client().hset(
+            get_progress_key(operation_id), charge_point_id, state
+        )
+    except Exception as error:
+        logger.warning(f"error reporting {state} for {charge_point_id}: {error}")
+
+
+async def promote_scheduled_requests(count: int = 1000) -> int:
+    """Move the due scheduled connect requests to the connect requests
+
+    Several twin hosts can run it concurrently, a request is moved by the host
+    that removes its charge point from the sorted set.
+
+    :param count: maximum number of requests moved
+    :return: number of requests moved
+    """
+    r = get_fleet_client()
+    due = await r.zrangebyscore(
+        TOPIC_CONNECT_CP_SCHEDULED, "-inf", time.time(), start=0, num=count
+    )
+    if not due:
+        return 0
+    # each charge point is removed with its request in a single transaction,
+    # so that a concurrent disconnect or another host cannot get in between
+    async with r.pipeline(transaction=True) as pipe:
+        for charge_point_id in due:
+            pipe.zrem(TOPIC_CONNECT_CP_SCHEDULED, charge_point_id)
+            pipe.hget(TOPIC_CONNECT_CP_SCHEDULED_REQUESTS, charge_point_id)
+            pipe.hdel(TOPIC_CONNECT_CP_SCHEDULED_REQUESTS, charge_point_id)
+        results = await pipe.execute()
+    claimed = [
+        request
+        for removed, request in zip(results[::3], results[1::3])
+        if removed and request is not None
+    ]
+    if claimed:
+        await r.rpush(TOPIC_CONNECT_CP, *claimed)
+    return len(claimed)
+
+
+async def wait_for_disconnect(charge_point_id: Index) -> str | None:
+    """Wait for a disconnect request of a charge point, and its not_before
+
+    :param charge_point_id:
+    :return: fleet operation of the request
+    """
+    pubsub = get_fleet_client().pubsub(ignore_subscribe_messages=True)
+    await pubsub.subscribe(get_disconnect_channel(charge_point_id))
+    try:
+        async for message in pubsub.listen():
+            try:
+                request = json.loads(message.get("data"))
+            except Exception as error:
+                logger.error(f"error parsing: {message} with error: {error}")
+                continue
+            await wait_until(request.get("not_before"))
+            return request.get("operation_id")
+    finally:
+        await pubsub.aclose()
@@ -2,10 +2,14 @@
 
 from dataclasses import asdict
 import re
-import logging
 
 from ocpp.routing import on, after
 
+from elu.twin.charge_point.metrics import OCPP_MESSAGES
+
+
+CAMEL_CASE_BOUNDARY = re.compile(r"(?<!^)(?=[A-Z])")
+
 
 def camel_to_snake(camel_case_string):
     """
@@ -13,8 +17,7 @@ def camel_to_snake(camel_case_string):
     :param camel_case_string:
     :return:
     """
-    regexp = r"(?<!^)(?=[A-Z])"
-    intermediate = re.sub(regexp, "_", camel_case_string)
+    intermediate = CAMEL_CASE_BOUNDARY.sub("_", camel_case_string)
     return intermediate.lower()
 
 
@@ -27,6 +30,8 @@ def generate_protocol(base: object, actions: object, call: object, call_result:
     :param call_result:
     :return:
     """
+    # names, payload classes and metrics are resolved once by the generate_*
+    # functions, the wrappers they return run on every message
     for action_enum in actions.__members__.values():
         action = action_enum.value
         if action == "CostUpdate":
@@ -38,6 +43,7 @@ def generate_protocol(base: object, actions: object, call: object, call_result:
             :param _action:
             :return:
             """
+            payload = getattr(call, f"{_action}Payload")
 
             async def get_send_action(
                 self, **kwargs
@@ -48,7 +54,7 @@ def generate_protocol(base: object, actions: object, call: object, call_result:
                 :param kwargs:
                 :return:
                 """
-                return getattr(call, f"{_action}Payload")(**kwargs)
+                return payload(**kwargs)
 
             return get_send_action
 
@@ -87,6 +93,9 @@ def generate_protocol(base: object, actions: object, call: object, call_result:
             :param _action:
             :return:
             """
+            payload = getattr(call, f"{_action}Payload")
+            get_send_name = f"get_send_{camel_to_snake(_action)}"
+            get_after_name = f"get_after_{camel_to_snake(_action)}"
 
             async def send_action(self, **kwargs):
                 """
@@ -95,16 +104,19 @@ def generate_protocol(base: object, actions: object, call: object, call_result:
                 :param kwargs:
                 :return:
                 """
-                obj = await getattr(self, f"get_send_{camel_to_snake(_action)}")(
-                    **kwargs
-                )
-                request = getattr(call, f"{_action}Payload")(**asdict(obj))
-
-                response = await self.call(request)
-
-                final_response = await getattr(
-                    self, f"get_after_{camel_to_snake(_action)}"
-                )(response=response)
+                request = await getattr(self, get_send_name)(**kwargs)
+                if type(request) is not payload:
+                    # overrides may return another dataclass with the fields
+                    request = payload(**asdict(request))
+
+                if self.latency_recorder is None:
+                    response = await self.call(request)
+                else:
+                    response = await self.latency_recorder.measure(
+                        _action, self.call(request)
+                    )
+
+                final_response = await getattr(self, get_after_name)(response=response)
                 return final_response
 
             return send_action
@@ -117,17 +129,16 @@ def generate_protocol(base: object, actions: object, call: object, call_result:
             :param _action:
             :return:
             """
+            payload = getattr(call_result, f"{_action}Payload")
 
-            async def get_on_action(
-                self, **kwargs
-            ) -> getattr(call_result, f"{_action}Payload"):
+            async def get_on_action(self, **kwargs) -> payload:
                 """
 
                 :param self:
                 :param kwargs:
                 :return:
                 """
-                return getattr(call_result, f"{_action}Payload")()
+                return payload()
 
             return get_on_action
 
@@ -141,6 +152,8 @@ def generate_protocol(base: object, actions: object, call: object, call_result:
             :param _action:
             :return:
             """
+            get_on_name = f"get_on_{camel_to_snake(_action)}"
+            received = OCPP_MESSAGES.labels(_action, "received")
 
             async def on_action(self, **kwargs):
                 """
@@ -149,10 +162,9 @@ def generate_protocol(base: object, actions: object, call: object, call_result:
                 :param kwargs:
                 :return:
                 """
-                logging.warning(f"{kwargs}")
-                result = await getattr(self, f"get_on_{camel_to_snake(_action)}")(
-                    **kwargs
-                )
+                self.log.debug("received {}: {}", _action, kwargs)
+                received.inc()
+                result = await getattr(self, get_on_name)(**kwargs)
                 return result
 
             on_action.__name__ = f"on_{camel_to_snake(action)}"
@@ -177,7 +189,7 @@ def generate_protocol(base: object, actions: object, call: object, call_result:
                 :param self:
                 :param kwargs:
                 """
-                logging.debug(f"{kwargs}")
+                self.log.debug("handled {}: {}", _action, kwargs)
 
             after_action.__name__ = f"after_{camel_to_snake(action)}"
             return after_action
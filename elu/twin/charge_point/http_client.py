@@ -0,0 +1,57 @@
+"""Shared HTTP client for the twin to backend API
+
+All twins running in the same event loop share one ``aiohttp.ClientSession``
+with a keep-alive connection pool, so a meter value tick reuses an open
+connection instead of opening a new one.
+"""
+
+import asyncio
+from asyncio import AbstractEventLoop
+from weakref import WeakKeyDictionary
+
+import aiohttp
+
+from elu.twin.charge_point.env import (
+    TWIN_HTTP_LIMIT,
+    TWIN_HTTP_LIMIT_PER_HOST,
+    TWIN_HTTP_KEEPALIVE_TIMEOUT,
+    TWIN_HTTP_TIMEOUT,
+    TWIN_HTTP_CONNECT_TIMEOUT,
+)
+from elu.twin.charge_point.metrics import get_trace_config
+
+_sessions: WeakKeyDictionary[AbstractEventLoop, aiohttp.ClientSession] = (
+    WeakKeyDictionary()
+)
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Return the session of the running event loop, creating it if needed
+
+    :return: shared client session
+    """
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=TWIN_HTTP_LIMIT,
+            limit_per_host=TWIN_HTTP_LIMIT_PER_HOST,
+            keepalive_timeout=TWIN_HTTP_KEEPALIVE_TIMEOUT,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=TWIN_HTTP_TIMEOUT, connect=TWIN_HTTP_CONNECT_TIMEOUT
+        )
+        session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            trace_configs=[get_trace_config()],
+        )
+        _sessions[loop] = session
+    return session
+
+
+async def close_session():
+    """Close the session of the running event loop, call it on shutdown"""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
@@ -0,0 +1,144 @@
+"""Round-trip time of the OCPP messages sent by the twins
+
+The generated ``send_*`` methods of a charge point measure the time between
+sending a call and receiving its result when the charge point has a
+``latency_recorder``. Latencies are kept per action, the summary gives their
+percentiles, the number of errors and timeouts, and the throughput.
+"""
+
+import json
+import time
+from array import array
+from collections import Counter, defaultdict
+from typing import Awaitable
+
+import numpy as np
+import pandas as pd
+
+from elu.twin.data.enums import CallOutcome
+
+PERCENTILES = (50, 95, 99)
+# edges of the histogram buckets in ms, from 0.1 ms to 100 s
+HISTOGRAM_EDGES = np.logspace(-1, 5, 61)
+
+
+class LatencyRecorder:
+    def __init__(self):
+        # latencies in s of the calls with a response, by action
+        self.latencies: defaultdict[str, array] = defaultdict(lambda: array("d"))
+        self.outcomes: Counter[tuple[str, CallOutcome]] = Counter()
+        self.started_at = time.perf_counter()
+        self.stopped_at: float | None = None
+
+    def record(self, action: str, latency: float, outcome: CallOutcome):
+        """
+        :param action: OCPP action, e.g. BootNotification
+        :param latency: in s
+        :param outcome:
+        """
+        self.outcomes[action, outcome] += 1
+        if outcome != CallOutcome.timeout:
+            self.latencies[action].append(latency)
+
+    async def measure(self, action: str, response: Awaitable):
+        """Await the response of a call and record its latency
+
+        A CallError suppressed by the charge point returns None and is counted
+        as an error.
+
+        :param action: OCPP action
+        :param response: call of the charge point
+        :return: response
+        """
+        start = time.perf_counter()
+        try:
+            result = await response
+        except TimeoutError:
+            self.record(action, time.perf_counter() - start, CallOutcome.timeout)
+            raise
+        except Exception:
+            self.record(action, time.perf_counter() - start, CallOutcome.error)
+            raise
+        outcome = CallOutcome.ok if result is not None else CallOutcome.error
+        self.record(action, time.perf_counter() - start, outcome)
+        return result
+
+    def stop(self):
+        self.stopped_at = time.perf_counter()
+
+    @property
+    def duration(self) -> float:
+        return (self.stopped_at or time.perf_counter()) - self.started_at
+
+    def actions(self) -> list[str]:
+        return sorted({action for action, _ in self.outcomes})
+
+    def _latencies_ms(self, action: str | None) -> np.ndarray:
+        actions = self.actions() if action is None else [action]
+        latencies = [np.frombuffer(self.latencies[name]) for name in actions]
+        return np.concatenate(latencies or [np.empty(0)]) * 1000
+
+    def histogram(self, action: str | None = None) -> list[int]:
+        """
+        :param action: all the actions if None
+        :return: number of calls in each bucket of HISTOGRAM_EDGES, the first
+            and last buckets include the faster and slower calls
+        """
+        latencies = np.clip(
+            self._latencies_ms(action), HISTOGRAM_EDGES[0], HISTOGRAM_EDGES[-1]
+        )
+        counts, _ = np.histogram(latencies, bins=HISTOGRAM_EDGES)
+        return counts.tolist()
+
+    def summary(self) -> pd.DataFrame:
+        """
+        :return: one row per action and a total row, latencies in ms,
+            throughput in responses per s
+        """
+        rows = []
+        for action in self.actions() + [None]:
+            counts = Counter()
+            for (_action, outcome), count in self.outcomes.items():
+                if action in (None, _action):
+                    counts[outcome] += count
+            latencies = self._latencies_ms(action)
+            row = {
+                "action": action or "total",
+                "count": counts.total(),
+                "ok": counts[CallOutcome.ok],
+                "errors": counts[CallOutcome.error],
+                "timeouts": counts[CallOutcome.timeout],
+                "throughput": len(latencies) / self.duration,
+            }
+            if len(latencies):
+                row["mean_ms"] = latencies.mean()
+                for percentile, value in zip(
+                    PERCENTILES, np.percentile(latencies, PERCENTILES)
+                ):
+                    row[f"p{percentile}_ms"] = value
+                row["max_ms"] = latencies.max()
+            rows.append(row)
+        return pd.DataFrame(rows).set_index("action")
+
+    def to_csv(self, path: str):
+        self.summary().to_csv(path)
+
+    def to_json(self, path: str):
+        """Write the summary and the histograms of each action
+
+        :param path:
+        """
+        summary = self.summary()
+        report = {
+            "duration": self.duration,
+            "histogram_edges_ms": HISTOGRAM_EDGES.tolist(),
+            "actions": {
+                action: {
+                    **json.loads(row.dropna().to_json()),
+                    "histogram": self.histogram(None if action == "total" else action),
+                }
+                for action, row in summary.iterrows()
+            },
+        }
+        with open(path, "w") as file:
+            json.dump(report, file, indent=2)
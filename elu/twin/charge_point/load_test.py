@@ -0,0 +1,245 @@
+"""Load test of a CSMS with OCPP 1.6 twins
+
+The twins connect at ``connect_rate`` per second, send a BootNotification and
+then a random mix of messages until the end of the test, ``rate`` messages per
+second for all the twins together. The messages of a twin are spaced with
+exponential delays and, as in OCPP, a twin waits for the response of a message
+before sending the next one, so a slow CSMS gets a lower throughput.
+
+The twins do not use the backend, their transactions only live in the test.
+The round-trip time of every message is recorded per action::
+
+    python -m elu.twin.charge_point.load_test
+
+with the ``LOAD_TEST_*`` environment variables, writes the summary in
+``LOAD_TEST_REPORT``.csv and the summary and latency histograms in
+``LOAD_TEST_REPORT``.json.
+"""
+
+import asyncio
+import random
+import time
+from typing import Coroutine
+
+import websockets
+from loguru import logger
+from ocpp.exceptions import OCPPError
+from ocpp.v16 import ChargePoint as Cp
+from websockets import Subprotocol
+
+from elu.twin.charge_point.charge_point.v16.charge_point import ChargePointBase
+from elu.twin.charge_point.env import (
+    LOAD_TEST_CSMS_URL,
+    LOAD_TEST_PASSWORD,
+    LOAD_TEST_TWINS,
+    LOAD_TEST_RATE,
+    LOAD_TEST_CONNECT_RATE,
+    LOAD_TEST_DURATION,
+    LOAD_TEST_MIX,
+    LOAD_TEST_TIMEOUT,
+    LOAD_TEST_REPORT,
+)
+from elu.twin.charge_point.latency import LatencyRecorder
+from elu.twin.charge_point.log import configure_logging
+from elu.twin.charge_point.security import basic_auth_header
+from elu.twin.data.enums import CallOutcome, Protocol
+from elu.twin.data.helpers import get_now
+
+ACTIONS = (
+    "boot_notification",
+    "heartbeat",
+    "authorize",
+    "start_transaction",
+    "stop_transaction",
+    "meter_values",
+)
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    """
+    :param mix: e.g. "heartbeat:1,meter_values:6"
+    :return: weight of each action
+    """
+    weights = {}
+    for item in mix.split(","):
+        action, _, weight = item.strip().partition(":")
+        if action not in ACTIONS:
+            raise ValueError(f"Invalid action {action}, expected one of {ACTIONS}")
+        weights[action] = float(weight or 1)
+    return weights
+
+
+class LoadTestChargePoint(ChargePointBase):
+    def __init__(self, *args, **kwargs):
+        ChargePointBase.__init__(self, *args, **kwargs)
+        self.transaction_id: int | None = None
+        self.meter = 0
+
+    def get_connection_processes(self) -> list[Coroutine]:
+        # the messages are sent by LoadTest.run_twin
+        return []
+
+    def get_session_processes(self) -> list[Coroutine]:
+        return []
+
+    async def call(self, payload, suppress=True, unique_id=None):
+        # sent at once, the latency of the CSMS is measured without the queues
+        return await Cp.call(self, payload, suppress=suppress, unique_id=unique_id)
+
+    async def send(self, action: str):
+        """Send a message of the mix
+
+        A start transaction is sent as a stop transaction while a transaction
+        is running, and the other way round.
+
+        :param action: one of ACTIONS
+        """
+        if action == "start_transaction" and self.transaction_id is not None:
+            action = "stop_transaction"
+        elif action == "stop_transaction" and self.transaction_id is None:
+            action = "start_transaction"
+        if action == "boot_notification":
+            await self.send_boot_notification(
+                charge_point_vendor="Elu Twin", charge_point_model="Load Test"
+            )
+        elif action == "heartbeat":
+            await self.send_heartbeat()
+        elif action == "authorize":
+            await self.send_authorize(id_tag=self.id)
+        elif action == "start_transaction":
+            response = await self.send_start_transaction(
+                connector_id=1,
+                id_tag=self.id,
+                meter_start=self.meter,
+                timestamp=get_now(),
+            )
+            if response is not None:
+                self.transaction_id = response.transaction_id
+        elif action == "stop_transaction":
+            await self.send_stop_transaction(
+                meter_stop=self.meter,
+                timestamp=get_now(),
+                transaction_id=self.transaction_id,
+            )
+            self.transaction_id = None
+        elif action == "meter_values":
+            self.meter += 100
+            await self.send_meter_values(
+                connector_id=1,
+                transaction_id=self.transaction_id,
+                meter_value=[
+                    {
+                        "timestamp": get_now(),
+                        "sampled_value": [{"value": str(self.meter)}],
+                    }
+                ],
+            )
+
+
+class LoadTest:
+    def __init__(
+        self,
+        csms_url: str = LOAD_TEST_CSMS_URL,
+        twins: int = LOAD_TEST_TWINS,
+        rate: float = LOAD_TEST_RATE,
+        duration: float = LOAD_TEST_DURATION,
+        mix: dict[str, float] | None = None,
+        connect_rate: float = LOAD_TEST_CONNECT_RATE,
+        timeout: int = LOAD_TEST_TIMEOUT,
+        password: str | None = LOAD_TEST_PASSWORD,
+        cid_prefix: str = "LOADTEST",
+    ):
+        """
+        :param csms_url: the twins connect to csms_url/cid
+        :param twins: number of twins
+        :param rate: messages per s sent by all the twins
+        :param duration: in s, from the start of the test
+        :param mix: weight of each action, LOAD_TEST_MIX if None
+        :param connect_rate: twins connected per s
+        :param timeout: s waited for a response
+        :param password: basic auth password of the twins
+        :param cid_prefix: the twins are cid_prefix-0, cid_prefix-1...
+        """
+        self.csms_url = csms_url
+        self.twins = twins
+        self.rate = rate
+        self.duration = duration
+        self.mix = mix if mix is not None else parse_mix(LOAD_TEST_MIX)
+        self.connect_rate = connect_rate
+        self.timeout = timeout
+        self.password = password
+        self.cid_prefix = cid_prefix
+        self.recorder = LatencyRecorder()
+
+    async def run_twin(self, index: int, deadline: float):
+        """
+        :param index:
+        :param deadline: perf_counter time of the end of the test
+        """
+        await asyncio.sleep(index / self.connect_rate)
+        cid = f"{self.cid_prefix}-{index}"
+        headers = []
+        if self.password is not None:
+            headers.append(basic_auth_header(cid, self.password))
+        start = time.perf_counter()
+        try:
+            ws = await websockets.connect(
+                f"{self.csms_url}/{cid}",
+                subprotocols=[Subprotocol(Protocol.v16)],
+                extra_headers=headers,
+                open_timeout=self.timeout,
+            )
+        except Exception as error:
+            self.recorder.record(
+                "Connect", time.perf_counter() - start, CallOutcome.error
+            )
+            logger.warning(f"{cid} could not connect: {error!r}")
+            return
+        self.recorder.record("Connect", time.perf_counter() - start, CallOutcome.ok)
+        cp = LoadTestChargePoint(cid, ws, response_timeout=self.timeout)
+        cp.latency_recorder = self.recorder
+        reader = asyncio.create_task(cp.start())
+        actions, weights = list(self.mix), list(self.mix.values())
+        # mean delay between two messages of the twin
+        interval = self.twins / self.rate
+        try:
+            action = "boot_notification"
+            next_time = time.perf_counter()
+            while next_time < deadline and not reader.done():
+                try:
+                    await cp.send(action)
+                except (OCPPError, asyncio.TimeoutError):
+                    # already recorded
+                    pass
+                next_time += random.expovariate(1 / interval)
+                await asyncio.sleep(max(next_time - time.perf_counter(), 0))
+                action = random.choices(actions, weights)[0]
+        except websockets.ConnectionClosed as error:
+            logger.warning(f"{cid} disconnected: {error}")
+        finally:
+            reader.cancel()
+            await ws.close()
+
+    async def run(self) -> LatencyRecorder:
+        """
+        :return: latencies of the messages sent
+        """
+        self.recorder = LatencyRecorder()
+        deadline = time.perf_counter() + self.duration
+        await asyncio.gather(
+            *(self.run_twin(index, deadline) for index in range(self.twins))
+        )
+        self.recorder.stop()
+        return self.recorder
+
+
+async def main():
+    recorder = await LoadTest().run()
+    recorder.to_csv(f"{LOAD_TEST_REPORT}.csv")
+    recorder.to_json(f"{LOAD_TEST_REPORT}.json")
+    logger.info(f"load test summary:\n{recorder.summary().round(2).to_string()}")
+
+
+if __name__ == "__main__":
+    configure_logging()
+    asyncio.run(main())
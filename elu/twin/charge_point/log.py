@@ -0,0 +1,154 @@
+"""Logging of the twin runtime
+
+``configure_logging`` installs a single loguru sink for the process:
+
+- gated by ``TWIN_LOG_LEVEL``. Messages logged with arguments, e.g.
+  ``logger.info("sent {}", action)``, are only formatted if they pass the
+  level, unlike f-strings,
+- written by a background thread with ``TWIN_LOG_ENQUEUE``, so the event loop
+  does not wait for stderr,
+- JSON lines with ``TWIN_LOG_JSON``, the cid of the twin in ``extra.twin``.
+
+The standard ``logging`` records, e.g. of ocpp and websockets, go to the same
+sink. Each twin logs with its ``TwinLogger``: its debug messages are logged
+only for the twins in ``TWIN_LOG_DEBUG`` or enabled at runtime with
+``set_twin_debug``, so a single charger can be traced in a host running
+thousands. Messages repeated on every tick are ``sampled``.
+"""
+
+import inspect
+import logging
+import sys
+from collections import Counter
+
+from loguru import logger
+
+from elu.twin.charge_point.env import (
+    TWIN_LOG_LEVEL,
+    TWIN_LOG_JSON,
+    TWIN_LOG_ENQUEUE,
+    TWIN_LOG_DEBUG,
+    TWIN_LOG_SAMPLE,
+)
+
+FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | "
+    "{extra[twin]} | <cyan>{name}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
+)
+
+_debug_twins: set[str] = {cid.strip() for cid in TWIN_LOG_DEBUG.split(",") if cid}
+_level = logger.level(TWIN_LOG_LEVEL).no
+_samples: Counter[str] = Counter()
+# options of the sink, the debug messages of the twins in debug go to a second
+# sink added only while there are such twins, so that loguru keeps discarding
+# the other debug messages before formatting them
+_sink_options: dict = {}
+_debug_sink: int | None = None
+
+
+def _debug_filter(record) -> bool:
+    return record["level"].no < _level and record["extra"].get("twin") in _debug_twins
+
+
+def _update_debug_sink():
+    global _debug_sink
+    if _debug_twins and _debug_sink is None and _sink_options:
+        _debug_sink = logger.add(level="DEBUG", filter=_debug_filter, **_sink_options)
+    elif not _debug_twins and _debug_sink is not None:
+        logger.remove(_debug_sink)
+        _debug_sink = None
+
+
+def set_twin_debug(cid: str, enabled: bool = True):
+    """Log the debug messages of a twin, or stop logging them
+
+    :param cid:
+    :param enabled:
+    """
+    if enabled:
+        _debug_twins.add(cid)
+    else:
+        _debug_twins.discard(cid)
+    _update_debug_sink()
+
+
+def is_twin_debug(cid: str) -> bool:
+    return _level <= logging.DEBUG or cid in _debug_twins
+
+
+def sampled(key: str, every: int = TWIN_LOG_SAMPLE) -> bool:
+    """Count a message and tell if it is logged, one in every
+
+    The count is shared by the twins of the process.
+
+    :param key: kind of message
+    :param every:
+    :return: true for the first message and then every ``every`` messages
+    """
+    count = _samples[key]
+    _samples[key] = count + 1
+    return count % every == 0
+
+
+class TwinLogger:
+    """Logger binding the cid of a twin"""
+
+    def __init__(self, cid: str):
+        self.cid = cid
+        self._logger = logger.bind(twin=cid).opt(depth=1)
+
+    def debug(self, message: str, *args, **kwargs):
+        if is_twin_debug(self.cid):
+            self._logger.debug(message, *args, **kwargs)
+
+    def info(self, message: str, *args, **kwargs):
+        self._logger.info(message, *args, **kwargs)
+
+    def warning(self, message: str, *args, **kwargs):
+        self._logger.warning(message, *args, **kwargs)
+
+    def error(self, message: str, *args, **kwargs):
+        self._logger.error(message, *args, **kwargs)
+
+
+class InterceptHandler(logging.Handler):
+    """Send the standard logging records to loguru"""
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            level = logger.level(record.levelname).name
+        except ValueError:
+            level = record.levelno
+        # the caller of the logging call, for the name and line of the record
+        frame, depth = inspect.currentframe(), 0
+        while frame and (depth == 0 or frame.f_code.co_filename == logging.__file__):
+            frame = frame.f_back
+            depth += 1
+        logger.opt(depth=depth, exception=record.exc_info).log(
+            level, record.getMessage()
+        )
+
+
+def configure_logging(
+    level: str = TWIN_LOG_LEVEL,
+    serialize: bool = TWIN_LOG_JSON,
+    enqueue: bool = TWIN_LOG_ENQUEUE,
+):
+    """Replace the sinks of the process by the twin runtime sink
+
+    :param level: minimum level, debug messages of the twins in debug aside
+    :param serialize: write JSON lines
+    :param enqueue: write from a background thread
+    """
+    global _level, _debug_sink
+    _level = logger.level(level).no
+    logger.remove()
+    _debug_sink = None
+    logger.configure(extra={"twin": "-"})
+    _sink_options.update(
+        sink=sys.stderr, format=FORMAT, serialize=serialize, enqueue=enqueue
+    )
+    logger.add(level=level, **_sink_options)
+    _update_debug_sink()
+    # standard logging keeps discarding the records below the level itself
+    logging.basicConfig(handlers=[InterceptHandler()], level=level, force=True)
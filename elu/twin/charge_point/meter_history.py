@@ -0,0 +1,171 @@
+"""Meter value history of the twins
+
+The meter values the twins send to the CSMS are also appended to the buffer of
+their event loop, a list per column, and sent to the meter value history of
+the private backend in a single request every
+``TWIN_METER_VALUES_FLUSH_INTERVAL`` seconds, or as soon as
+``TWIN_METER_VALUES_BATCH`` meter values are waiting.
+"""
+
+import asyncio
+from asyncio import AbstractEventLoop, Task
+from weakref import WeakKeyDictionary
+
+from loguru import logger
+
+from elu.twin.charge_point import requests
+from elu.twin.charge_point.env import (
+    TWIN_METER_VALUES_BATCH,
+    TWIN_METER_VALUES_FLUSH_INTERVAL,
+    TWIN_METER_VALUES_MAX_PENDING,
+)
+from elu.twin.charge_point.log import sampled
+from elu.twin.data.schemas.common import Index
+from elu.twin.data.schemas.meter_value import METER_VALUE_COLUMNS, MeterValueBatch
+
+
+class MeterValueBuffer:
+    def __init__(
+        self,
+        flush_interval: float = TWIN_METER_VALUES_FLUSH_INTERVAL,
+        batch_size: int = TWIN_METER_VALUES_BATCH,
+        max_pending: int = TWIN_METER_VALUES_MAX_PENDING,
+    ):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.columns: dict[str, list] = {column: [] for column in METER_VALUE_COLUMNS}
+        self._flush_task: Task | None = None
+        # flush of a full batch, before the next periodic flush
+        self._batch_task: Task | None = None
+        # while the backend fails, only the periodic flush tries again
+        self._failing = False
+        self._flush_lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self.columns["timestamp"])
+
+    def append(
+        self,
+        timestamp: float,
+        charge_point_id: Index,
+        connector_id: Index,
+        *,
+        user_id: Index | None = None,
+        transaction_id: Index | None = None,
+        power: float = 0.0,
+        current: float = 0.0,
+        voltage: float = 0.0,
+        energy: float = 0.0,
+        total_energy: float = 0.0,
+        soc: int | None = None,
+    ):
+        """Add a meter value
+
+        :param timestamp: in s since the epoch
+        :param charge_point_id:
+        :param connector_id:
+        :param user_id:
+        :param transaction_id:
+        :param power: in kW
+        :param current: in A
+        :param voltage: in V
+        :param energy: energy of the transaction in kWh
+        :param total_energy: meter register in kWh
+        :param soc: state of charge in %
+        """
+        values = {
+            "timestamp": timestamp,
+            "user_id": user_id,
+            "charge_point_id": charge_point_id,
+            "connector_id": connector_id,
+            "transaction_id": transaction_id,
+            "power": power,
+            "current": current,
+            "voltage": voltage,
+            "energy": energy,
+            "total_energy": total_energy,
+            "soc": soc,
+        }
+        for column in METER_VALUE_COLUMNS:
+            self.columns[column].append(values[column])
+        if (
+            len(self) >= self.batch_size
+            and not self._failing
+            and (self._batch_task is None or self._batch_task.done())
+        ):
+            self._batch_task = asyncio.create_task(self.flush())
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_periodically())
+
+    def pop_batch(self) -> MeterValueBatch | None:
+        """Take the pending meter values out of the buffer
+
+        :return: None if there are no meter values
+        """
+        if not len(self):
+            return None
+        columns = self.columns
+        self.columns = {column: [] for column in METER_VALUE_COLUMNS}
+        # the columns have the same length by construction
+        return MeterValueBatch.model_construct(**columns)
+
+    def _restore(self, batch: MeterValueBatch):
+        """Put back meter values that could not be sent, before the newer ones,
+        dropping the oldest beyond max_pending"""
+        dropped = max(len(batch) + len(self) - self.max_pending, 0)
+        for column in METER_VALUE_COLUMNS:
+            self.columns[column] = (getattr(batch, column) + self.columns[column])[
+                dropped:
+            ]
+        if dropped and sampled("meter_values_dropped"):
+            logger.warning("dropped {} meter values of the history", dropped)
+
+    async def flush(self):
+        async with self._flush_lock:
+            batch = self.pop_batch()
+            if batch is None:
+                return
+            try:
+                result = await requests.add_meter_values(batch)
+            except Exception as error:
+                logger.error("error flushing meter values: {}", error)
+                result = None
+            self._failing = result is None
+            if result is None:
+                self._restore(batch)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        if self._batch_task is not None:
+            await asyncio.gather(self._batch_task, return_exceptions=True)
+        await self.flush()
+
+
+_buffers: WeakKeyDictionary[AbstractEventLoop, MeterValueBuffer] = WeakKeyDictionary()
+
+
+def get_meter_value_buffer() -> MeterValueBuffer:
+    """Return the meter value buffer of the running event loop
+
+    :return: shared meter value buffer
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _buffers:
+        _buffers[loop] = MeterValueBuffer()
+    return _buffers[loop]
+
+
+async def close_meter_value_buffer():
+    """Send the pending meter values and stop flushing, call it on shutdown"""
+    buffer = _buffers.pop(asyncio.get_running_loop(), None)
+    if buffer is not None:
+        await buffer.close()
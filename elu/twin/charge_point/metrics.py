@@ -0,0 +1,173 @@
+"""Prometheus metrics of the twins
+
+The metrics are kept per process. Twin hosts serve them on
+``TWIN_METRICS_PORT`` and measure the lag of their event loop: the time a
+coroutine that is ready waits before it runs, which grows when the loop is
+saturated by too many twins.
+"""
+
+import asyncio
+import re
+from functools import cache
+from types import SimpleNamespace
+
+import aiohttp
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+from elu.twin.charge_point.env import (
+    TWIN_METRICS_PORT,
+    TWIN_METRICS_LOOP_LAG_INTERVAL,
+)
+
+TWINS = Gauge("elu_twin_twins", "Twins running in the process")
+TWIN_RECONNECTIONS = Counter(
+    "elu_twin_reconnections_total", "Attempts to reconnect a twin to its CSMS"
+)
+EVENT_LOOP_LAG = Histogram(
+    "elu_twin_event_loop_lag_seconds",
+    "Delay of the event loop in waking up a sleeping coroutine",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+ACTIONS_QUEUED = Gauge(
+    "elu_twin_actions_queued", "Actions waiting in the actions queues of the twins"
+)
+OCPP_MESSAGES = Counter(
+    "elu_twin_ocpp_messages_total",
+    "OCPP calls sent to and received from the CSMS",
+    ["action", "direction"],
+)
+OCPP_CALL_DURATION = Histogram(
+    "elu_twin_ocpp_call_duration_seconds",
+    "Time from sending an OCPP call to the CSMS to receiving its result",
+    ["action"],
+)
+BACKEND_REQUEST_DURATION = Histogram(
+    "elu_twin_backend_request_duration_seconds",
+    "Duration of the requests to the private backend",
+    ["method", "path", "status"],
+)
+
+
+@cache
+def get_call_metrics(payload_type: type) -> tuple[Counter, Histogram]:
+    """Children of OCPP_MESSAGES and OCPP_CALL_DURATION for a call payload,
+    resolved once per payload type rather than on every call
+
+    :param payload_type: e.g. ocpp.v16.call.HeartbeatPayload
+    :return: sent counter, duration histogram
+    """
+    action = payload_type.__name__.removesuffix("Payload")
+    return OCPP_MESSAGES.labels(action, "sent"), OCPP_CALL_DURATION.labels(action)
+
+
+# ids and numbers in the paths of the backend, replaced to keep a label per
+# endpoint, e.g. /twin/quota/{id}/{n}
+ID_PATTERN = re.compile(
+    r"/[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}(?=/|$)"
+)
+NUMBER_PATTERN = re.compile(r"/-?\d+(\.\d+)?(?=/|$)")
+
+
+def get_path_label(path: str) -> str:
+    return NUMBER_PATTERN.sub("/{n}", ID_PATTERN.sub("/{id}", path))
+
+
+class ActionsQueue:
+    """Queue of the actions of a twin, counted in ACTIONS_QUEUED
+
+    Wraps an asyncio.Queue instead of extending it, so that each action is
+    counted once whichever of put or put_nowait, get or get_nowait moves it.
+    """
+
+    def __init__(self):
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def empty(self) -> bool:
+        return self._queue.empty()
+
+    def put_nowait(self, item):
+        self._queue.put_nowait(item)
+        ACTIONS_QUEUED.inc()
+
+    async def put(self, item):
+        await self._queue.put(item)
+        ACTIONS_QUEUED.inc()
+
+    def get_nowait(self):
+        item = self._queue.get_nowait()
+        ACTIONS_QUEUED.dec()
+        return item
+
+    async def get(self):
+        item = await self._queue.get()
+        ACTIONS_QUEUED.dec()
+        return item
+
+    def task_done(self):
+        self._queue.task_done()
+
+    async def join(self):
+        await self._queue.join()
+
+    def clear(self):
+        """Drop the actions left when the twin stops"""
+        while not self.empty():
+            self.get_nowait()
+            self.task_done()
+
+
+async def _on_request_start(
+    session, context: SimpleNamespace, params: aiohttp.TraceRequestStartParams
+):
+    context.start = asyncio.get_running_loop().time()
+
+
+def _observe_request(context: SimpleNamespace, method: str, url, status: str):
+    BACKEND_REQUEST_DURATION.labels(method, get_path_label(url.path), status).observe(
+        asyncio.get_running_loop().time() - context.start
+    )
+
+
+async def _on_request_end(
+    session, context: SimpleNamespace, params: aiohttp.TraceRequestEndParams
+):
+    _observe_request(context, params.method, params.url, str(params.response.status))
+
+
+async def _on_request_exception(
+    session, context: SimpleNamespace, params: aiohttp.TraceRequestExceptionParams
+):
+    _observe_request(context, params.method, params.url, "error")
+
+
+def get_trace_config() -> aiohttp.TraceConfig:
+    """Trace config measuring the requests of a client session"""
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(_on_request_start)
+    trace_config.on_request_end.append(_on_request_end)
+    trace_config.on_request_exception.append(_on_request_exception)
+    return trace_config
+
+
+async def monitor_event_loop(interval: float = TWIN_METRICS_LOOP_LAG_INTERVAL):
+    """Measure the event loop lag, until cancelled
+
+    :param interval: s between two measures
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(loop.time() - start - interval, 0))
+
+
+def start_metrics_server(port: int = TWIN_METRICS_PORT):
+    """Serve the metrics of the process on a thread
+
+    :param port: not served if 0
+    """
+    if port:
+        start_http_server(port)
@@ -0,0 +1,116 @@
+"""Token accounting of the twins
+
+Each twin consumes the tokens of its quota every minute. The twins add their
+consumption to the accountant of their event loop, which sends the tokens
+consumed per quota to the private backend in a single request every
+``TWIN_QUOTA_FLUSH_INTERVAL`` seconds, and keeps the balances it returns. The
+twins of a quota without tokens left stop.
+"""
+
+import asyncio
+from asyncio import AbstractEventLoop, Task
+from weakref import WeakKeyDictionary
+
+from loguru import logger
+
+from elu.twin.charge_point import requests
+from elu.twin.charge_point.env import TWIN_QUOTA_FLUSH_INTERVAL
+from elu.twin.data.schemas.common import Index
+
+
+class QuotaExhausted(Exception):
+    pass
+
+
+class QuotaAccountant:
+    def __init__(self, flush_interval: float = TWIN_QUOTA_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        # tokens consumed since the last flush
+        self.consumed: dict[Index, int] = {}
+        # tokens left after the last flush
+        self.balances: dict[Index, int] = {}
+        self._flush_task: Task | None = None
+        # set on close, the periodic flush ends after the flush in progress
+        self._closing = asyncio.Event()
+
+    def consume(self, quota_id: Index | None, tokens: int):
+        if quota_id is None or tokens <= 0:
+            return
+        self.consumed[quota_id] = self.consumed.get(quota_id, 0) + tokens
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_periodically())
+
+    def get_available_tokens(self, quota_id: Index | None) -> int | None:
+        """Tokens left in a quota, including the consumption not sent yet
+
+        :param quota_id:
+        :return: None until the balance of the quota is known
+        """
+        if quota_id not in self.balances:
+            return None
+        return self.balances[quota_id] - self.consumed.get(quota_id, 0)
+
+    def is_exhausted(self, quota_id: Index | None) -> bool:
+        available_tokens = self.get_available_tokens(quota_id)
+        return available_tokens is not None and available_tokens <= 0
+
+    async def flush(self):
+        if not self.consumed:
+            return
+        consumed, self.consumed = self.consumed, {}
+        try:
+            balances = await requests.consume_quotas(consumed)
+        except asyncio.CancelledError:
+            self._restore(consumed)
+            raise
+        except Exception as error:
+            logger.error("error flushing the quota consumption: {}", error)
+            balances = None
+        if balances is None:
+            # sent with the next flush
+            self._restore(consumed)
+            return
+        for balance in balances:
+            self.balances[balance.id] = balance.available_tokens
+
+    def _restore(self, consumed: dict[Index, int]):
+        for quota_id, tokens in consumed.items():
+            self.consumed[quota_id] = self.consumed.get(quota_id, 0) + tokens
+
+    async def _flush_periodically(self):
+        while not self._closing.is_set():
+            try:
+                await asyncio.wait_for(self._closing.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                await self.flush()
+
+    async def close(self):
+        self._closing.set()
+        if self._flush_task is not None:
+            # lets the flush in progress finish instead of losing its batch
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+
+
+_accountants: WeakKeyDictionary[AbstractEventLoop, QuotaAccountant] = (
+    WeakKeyDictionary()
+)
+
+
+def get_quota_accountant() -> QuotaAccountant:
+    """Return the quota accountant of the running event loop
+
+    :return: shared quota accountant
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _accountants:
+        _accountants[loop] = QuotaAccountant()
+    return _accountants[loop]
+
+
+async def close_quota_accountant():
+    """Send the pending consumption and stop flushing, call it on shutdown"""
+    accountant = _accountants.pop(asyncio.get_running_loop(), None)
+    if accountant is not None:
+        await accountant.close()
@@ -1,7 +1,7 @@
-import logging
 from datetime import datetime
 
-import aiohttp
+from aiohttp import ClientResponse
+
 from elu.twin.data.schemas.actions import ActionMessageRequest
 from elu.twin.data.schemas.common import Index
 from elu.twin.data.schemas.transaction import (
@@ -12,8 +12,13 @@ from elu.twin.data.schemas.transaction import (
 )
 from elu.twin.data.schemas.vehicle import UpdateVehicle, OutputVehicle
 from elu.twin.data.schemas.connector import UpdateConnector
+from elu.twin.data.schemas.twin_state import TwinStateDelta, OutputTwinStateDelta
+from elu.twin.data.schemas.meter_value import MeterValueBatch, OutputMeterValueBatch
+from elu.twin.data.schemas.quota import OutputQuotaBalance, QuotaConsumption
 
 from elu.twin.charge_point.env import BACKEND_PRIVATE_URL
+from elu.twin.charge_point.http_client import get_session
+from elu.twin.charge_point.log import sampled
 from elu.twin.data.enums import (
     EvseStatus,
     PowerType,
@@ -22,7 +27,12 @@ from elu.twin.data.enums import (
 )
 
 from ocpp.v16.enums import ChargePointStatus
-from elu.twin.data.schemas.charge_point import OutputChargePoint, UpdateChargePoint
+from elu.twin.data.schemas.charge_point import (
+    OutputChargePoint,
+    UpdateChargePoint,
+    HydrateChargePoints,
+    HydratedChargePoint,
+)
 from elu.twin.data.schemas.ocpp_configuration import (
     OutputOcppConfigurationV16,
     OcppConfigurationV16Update,
@@ -42,6 +52,15 @@ API_OPERATIONS_PREFIX = f"{BACKEND_PRIVATE_URL}/operations/{CHARGER_PREFIX}/tran
 headers = {"Content-Type": "application/json"}
 
 
+def _log_response(response: ClientResponse):
+    """Warn about the failed requests only, the others are on every tick, and
+    only about a sample of them when the backend fails for all the twins"""
+    if response.status >= 400 and sampled("backend_request_failed"):
+        logger.warning(
+            "{} {} failed: {}", response.method, response.url.path, response.status
+        )
+
+
 async def get_charge_point(cid: Index) -> OutputChargePoint:
     """
 
@@ -49,14 +68,35 @@ async def get_charge_point(cid: Index) -> OutputChargePoint:
     :return:
     """
     url = f"{API_CHARGER_PREFIX}/{cid}"
-    logging.info("Connecting to %s", url)
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status == 200:
-                data = await response.json()
-                data = OutputChargePoint.model_validate(data)
-                return data
-            logging.warning(response.status)
+    logger.debug("connecting to {}", url)
+    session = get_session()
+    async with session.get(url) as response:
+        if response.status == 200:
+            data = await response.json()
+            data = OutputChargePoint.model_validate(data)
+            return data
+        _log_response(response)
+
+
+async def hydrate_charge_points(
+    charge_point_ids: list[Index],
+) -> list[HydratedChargePoint] | None:
+    """Everything the twins of the charge points need to start, in one request
+
+    :param charge_point_ids:
+    :return: charge points found, None if the request failed
+    """
+    url = f"{API_CHARGER_PREFIX}/hydrate"
+    session = get_session()
+    request = HydrateChargePoints(charge_point_ids=charge_point_ids)
+    async with session.post(
+        url, headers=headers, data=request.model_dump_json()
+    ) as response:
+        if response.status == 200:
+            data = await response.json()
+            return [HydratedChargePoint.model_validate(x) for x in data]
+        _log_response(response)
+        return None
 
 
 async def get_charge_point_configuration(
@@ -67,14 +107,14 @@ async def get_charge_point_configuration(
     :return:
     """
     url = f"{API_CHARGER_PREFIX}/configuration/{configuration_id}"
-    logging.info("Connecting to %s", url)
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status == 200:
-                data = await response.json()
-                data = OutputOcppConfigurationV16.model_validate(data)
-                return data
-            logging.warning(response.status)
+    logger.debug("connecting to {}", url)
+    session = get_session()
+    async with session.get(url) as response:
+        if response.status == 200:
+            data = await response.json()
+            data = OutputOcppConfigurationV16.model_validate(data)
+            return data
+        _log_response(response)
 
 
 async def start_transaction(
@@ -86,17 +126,16 @@ async def start_transaction(
     :return:
     """
     url = f"{API_CHARGER_PREFIX}/action/start-transaction/{user_id}"
-    logging.info("")
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            url, headers=headers, data=transaction.model_dump_json()
-        ) as response:
-            logging.warning(response.status)
-            if response.status == 200:
-                data = await response.json()
-                data = OutputTransaction.model_validate(data)
-                return data
-            return None
+    session = get_session()
+    async with session.post(
+        url, headers=headers, data=transaction.model_dump_json()
+    ) as response:
+        _log_response(response)
+        if response.status == 200:
+            data = await response.json()
+            data = OutputTransaction.model_validate(data)
+            return data
+        return None
 
 
 async def stop_transaction(
@@ -108,16 +147,16 @@ async def stop_transaction(
     :param user_id:
     """
     url = f"{API_CHARGER_PREFIX}/action/stop-transaction/{user_id}"
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            url, headers=headers, data=transaction.model_dump_json()
-        ) as response:
-            logging.warning(response.status)
-            if response.status == 200:
-                data = await response.json()
-                data = ActionMessageRequest.model_validate(data)
-                return data
-            return None
+    session = get_session()
+    async with session.post(
+        url, headers=headers, data=transaction.model_dump_json()
+    ) as response:
+        _log_response(response)
+        if response.status == 200:
+            data = await response.json()
+            data = ActionMessageRequest.model_validate(data)
+            return data
+        return None
 
 
 async def update_chager_point_configuration(
@@ -129,45 +168,44 @@ async def update_chager_point_configuration(
     :return:
     """
     url = f"{API_CHARGER_PREFIX}/configuration/{configuration_id}"
-    logging.warning(f"updating configuration: configuration_id: {configuration}")
-    logging.info("Connecting to %s", url)
-    async with aiohttp.ClientSession() as session:
-        async with session.put(
-            url, headers=headers, data=configuration.model_dump_json()
-        ) as response:
-            logging.warning(response.status)
-            logging.warning(response.text)
+    logger.debug("updating configuration {}: {}", configuration_id, configuration)
+    logger.debug("connecting to {}", url)
+    session = get_session()
+    async with session.put(
+        url, headers=headers, data=configuration.model_dump_json()
+    ) as response:
+        _log_response(response)
 
 
 async def update_vehicle_soc(vid: Index, soc: float):
     update_vehicle = UpdateVehicle(soc=soc)
     url = f"{BACKEND_PRIVATE_URL}/{API_VEHICLE_PREFIX}/soc/{vid}"
-    async with aiohttp.ClientSession() as session:
-        async with session.put(
-            url, headers=headers, data=update_vehicle.model_dump_json()
-        ) as response:
-            logging.warning(response.status)
+    session = get_session()
+    async with session.put(
+        url, headers=headers, data=update_vehicle.model_dump_json()
+    ) as response:
+        _log_response(response)
 
 
 async def get_vehicle_battery(vid: Index):
     url = f"{BACKEND_PRIVATE_URL}/{API_VEHICLE_PREFIX}/vehicle/{vid}"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status == 200:
-                data = await response.json()
-                return data.get("battery_capacity")
-            logging.warning(f"response: {response.status}")
+    session = get_session()
+    async with session.get(url) as response:
+        if response.status == 200:
+            data = await response.json()
+            return data.get("battery_capacity")
+        _log_response(response)
 
 
 async def get_vehicle(vid: Index) -> OutputVehicle:
     url = f"{BACKEND_PRIVATE_URL}/{API_VEHICLE_PREFIX}/{vid}"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status == 200:
-                data = await response.json()
-                data = OutputVehicle.model_validate(data)
-                return data
-            logging.warning(f"response: {response.status}")
+    session = get_session()
+    async with session.get(url) as response:
+        if response.status == 200:
+            data = await response.json()
+            data = OutputVehicle.model_validate(data)
+            return data
+        _log_response(response)
 
 
 async def update_charger_status(cid: Index, status: ChargePointStatus):
@@ -177,9 +215,9 @@ async def update_charger_status(cid: Index, status: ChargePointStatus):
     :param status:
     """
     url = f"{API_CHARGER_PREFIX}/status/{cid}/{status.value}"
-    async with aiohttp.ClientSession() as session:
-        async with session.put(url) as response:
-            logging.warning(response.status)
+    session = get_session()
+    async with session.put(url) as response:
+        _log_response(response)
 
 
 async def update_evse_status(
@@ -191,12 +229,12 @@ async def update_evse_status(
     :param status:
     :param active_connector:
     """
-    logger.debug(f"active connector: {active_connector}")
+    logger.debug("active connector: {}", active_connector)
     url = f"{API_CHARGER_PREFIX}/evse/status/{evse_id}/{status}"
     params = {} if active_connector is None else {"active_connector": active_connector}
-    async with aiohttp.ClientSession() as session:
-        async with session.put(url, params=params) as response:
-            logging.warning(response.status)
+    session = get_session()
+    async with session.put(url, params=params) as response:
+        _log_response(response)
 
 
 async def update_connector_status(connector_id: Index, status: ConnectorStatus):
@@ -206,9 +244,9 @@ async def update_connector_status(connector_id: Index, status: ConnectorStatus):
     :param status:
     """
     url = f"{API_CHARGER_PREFIX}/connector/status/{connector_id}/{status.value}"
-    async with aiohttp.ClientSession() as session:
-        async with session.put(url) as response:
-            logging.warning(response.status)
+    session = get_session()
+    async with session.put(url) as response:
+        _log_response(response)
 
 
 async def update_connector_values(
@@ -222,11 +260,49 @@ async def update_connector_values(
 
     url = f"{API_CHARGER_PREFIX}/connector/{connector_id}"
     headers = {"Content-Type": "application/json"}
-    async with aiohttp.ClientSession() as session:
-        async with session.put(
-            url, headers=headers, data=connector_update.model_dump_json()
-        ) as response:
-            logging.warning(response.status)
+    session = get_session()
+    async with session.put(
+        url, headers=headers, data=connector_update.model_dump_json()
+    ) as response:
+        _log_response(response)
+
+
+async def update_twin_state(
+    twin_state: TwinStateDelta,
+) -> OutputTwinStateDelta | None:
+    """
+
+    :param twin_state:
+    :return:
+    """
+    url = f"{API_CHARGER_PREFIX}/state"
+    session = get_session()
+    async with session.put(
+        url, headers=headers, data=twin_state.model_dump_json(exclude_unset=True)
+    ) as response:
+        if response.status == 200:
+            data = await response.json()
+            return OutputTwinStateDelta.model_validate(data)
+        _log_response(response)
+        return None
+
+
+async def add_meter_values(batch: MeterValueBatch) -> OutputMeterValueBatch | None:
+    """
+
+    :param batch: meter values of many twins
+    :return: None if the request failed
+    """
+    url = f"{API_CHARGER_PREFIX}/meter_values"
+    session = get_session()
+    async with session.post(
+        url, headers=headers, data=batch.model_dump_json()
+    ) as response:
+        if response.status == 200:
+            data = await response.json()
+            return OutputMeterValueBatch.model_validate(data)
+        _log_response(response)
+        return None
 
 
 async def get_transaction(transaction_id: Index) -> OutputTransaction:
@@ -236,13 +312,13 @@ async def get_transaction(transaction_id: Index) -> OutputTransaction:
     :return:
     """
     url = f"{API_OPERATIONS_PREFIX}/{transaction_id}"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status == 200:
-                data = await response.json()
-                data = OutputTransaction.model_validate(data)
-                return data
-            logging.warning(response.status)
+    session = get_session()
+    async with session.get(url) as response:
+        if response.status == 200:
+            data = await response.json()
+            data = OutputTransaction.model_validate(data)
+            return data
+        _log_response(response)
 
 
 # async def get_transaction(transactionid: int) -> OutputTransaction:
@@ -271,11 +347,11 @@ async def update_transaction(
     """
     url = f"{API_OPERATIONS_PREFIX}/{transaction_id}"
     headers = {"Content-Type": "application/json"}
-    async with aiohttp.ClientSession() as session:
-        async with session.patch(
-            url, headers=headers, data=transaction_update.model_dump_json()
-        ) as response:
-            logging.warning(response.status)
+    session = get_session()
+    async with session.patch(
+        url, headers=headers, data=transaction_update.model_dump_json()
+    ) as response:
+        _log_response(response)
 
 
 async def get_charging_rate(
@@ -288,12 +364,12 @@ async def get_charging_rate(
     :param power_type:
     """
     url = f"{BACKEND_PRIVATE_URL}/{API_PREFIX}/vehicle/charging-rate/{vid}/{power_type}/{soc}"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status == 200:
-                data = await response.json()
-                return data.get("power")
-            logging.warning(response.status)
+    session = get_session()
+    async with session.get(url) as response:
+        if response.status == 200:
+            data = await response.json()
+            return data.get("power")
+        _log_response(response)
 
 
 async def update_heartbeat(cid: Index, heartbeat: datetime):
@@ -304,11 +380,11 @@ async def update_heartbeat(cid: Index, heartbeat: datetime):
     headers = {"Content-Type": "application/json"}
     update = UpdateChargePoint(last_heartbeat=heartbeat)
     url = f"{API_CHARGER_PREFIX}/{cid}"
-    async with aiohttp.ClientSession() as session:
-        async with session.patch(
-            url, headers=headers, data=update.model_dump_json()
-        ) as response:
-            logging.warning(response.status)
+    session = get_session()
+    async with session.patch(
+        url, headers=headers, data=update.model_dump_json()
+    ) as response:
+        _log_response(response)
 
 
 async def consume_quota(quota_id: Index, cost: int):
@@ -318,11 +394,33 @@ async def consume_quota(quota_id: Index, cost: int):
     :param cost:
     """
     url = f"{BACKEND_PRIVATE_URL}/{API_QUOTA_PREFIX}/{quota_id}/{cost}"
-    async with aiohttp.ClientSession() as session:
-        async with session.patch(url) as response:
-            if response.status == 200:
-                _ = await response.json()
-            logging.warning(response.status)
+    session = get_session()
+    async with session.patch(url) as response:
+        if response.status == 200:
+            _ = await response.json()
+        _log_response(response)
+
+
+async def consume_quotas(
+    consumed: dict[Index, int],
+) -> list[OutputQuotaBalance] | None:
+    """Subtract the tokens consumed from many quotas
+
+    :param consumed: tokens consumed per quota
+    :return: tokens left in the quotas, None if the request failed
+    """
+    url = f"{BACKEND_PRIVATE_URL}/{API_QUOTA_PREFIX}/consume"
+    body = [
+        QuotaConsumption(id=quota_id, consumed=tokens).model_dump()
+        for quota_id, tokens in consumed.items()
+    ]
+    session = get_session()
+    async with session.post(url, json=body) as response:
+        if response.status == 200:
+            data = await response.json()
+            return [OutputQuotaBalance.model_validate(item) for item in data]
+        _log_response(response)
+        return None
 
 
 async def update_vehicle_status(vid: Index, status: VehicleStatus):
@@ -332,9 +430,9 @@ async def update_vehicle_status(vid: Index, status: VehicleStatus):
     :param status:
     """
     url = f"{BACKEND_PRIVATE_URL}/{API_VEHICLE_PREFIX}/status/{vid}/{status}"
-    async with aiohttp.ClientSession() as session:
-        async with session.put(url) as response:
-            logging.warning(response.status)
+    session = get_session()
+    async with session.put(url) as response:
+        _log_response(response)
 
 
 # async def clear_cache(user_id: str, cid: str):
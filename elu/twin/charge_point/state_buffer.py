@@ -0,0 +1,129 @@
+"""Coalescing buffer for twin state updates
+
+Twins write charge point, connector, EVSE, transaction and vehicle updates to
+the buffer of their event loop. Updates of the same object are merged, the
+latest value of each field wins, and the buffer sends everything to the private
+backend in a single request every ``TWIN_STATE_FLUSH_INTERVAL`` seconds.
+
+All the state of the twins goes through the buffer, so that updates reach the
+backend in the order they were made. Twins flush it at once when the backend
+must see a change before the next request of a user, e.g. a transaction
+accepted, and when they stop.
+"""
+
+import asyncio
+from asyncio import AbstractEventLoop, Task
+from weakref import WeakKeyDictionary
+
+from loguru import logger
+
+from elu.twin.charge_point import requests
+from elu.twin.charge_point.env import TWIN_STATE_FLUSH_INTERVAL
+from elu.twin.data.schemas.common import Index
+from elu.twin.data.schemas.twin_state import TwinStateDelta
+
+DELTA_KINDS = ("charge_points", "connectors", "evses", "transactions", "vehicles")
+
+
+class StateBuffer:
+    def __init__(self, flush_interval: float = TWIN_STATE_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.deltas: dict[str, dict[Index, dict]] = {kind: {} for kind in DELTA_KINDS}
+        self._flush_task: Task | None = None
+        # one request at a time, a later flush must not overtake an earlier one
+        self._flush_lock = asyncio.Lock()
+
+    def _update(self, kind: str, index: Index, values: dict):
+        self.deltas[kind].setdefault(index, {}).update(values)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_periodically())
+
+    def update_charge_point(self, charge_point_id: Index, **values):
+        self._update("charge_points", charge_point_id, values)
+
+    def update_connector(self, connector_id: Index, **values):
+        self._update("connectors", connector_id, values)
+
+    def update_evse(self, evse_id: Index, **values):
+        self._update("evses", evse_id, values)
+
+    def update_transaction(self, transaction_id: Index, **values):
+        self._update("transactions", transaction_id, values)
+
+    def update_vehicle(self, vehicle_id: Index, **values):
+        self._update("vehicles", vehicle_id, values)
+
+    def is_empty(self) -> bool:
+        return not any(self.deltas.values())
+
+    def pop_delta(self) -> TwinStateDelta | None:
+        """Take the pending updates out of the buffer
+
+        :return: pending updates, None if there are not updates
+        """
+        if self.is_empty():
+            return None
+        deltas, self.deltas = self.deltas, {kind: {} for kind in DELTA_KINDS}
+        return TwinStateDelta(
+            **{
+                kind: [{"id": index, **values} for index, values in items.items()]
+                for kind, items in deltas.items()
+            }
+        )
+
+    def _restore(self, delta: TwinStateDelta):
+        """Put back updates that could not be sent, under any newer update"""
+        for kind in DELTA_KINDS:
+            for item in getattr(delta, kind):
+                values = item.model_dump(exclude_unset=True, exclude={"id"})
+                values.update(self.deltas[kind].get(item.id, {}))
+                self.deltas[kind][item.id] = values
+
+    async def flush(self):
+        async with self._flush_lock:
+            delta = self.pop_delta()
+            if delta is None:
+                return
+            try:
+                result = await requests.update_twin_state(delta)
+            except asyncio.CancelledError:
+                self._restore(delta)
+                raise
+            except Exception as error:
+                logger.error(f"error flushing twin state: {error}")
+                result = None
+            if result is None:
+                self._restore(delta)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+
+
+_buffers: WeakKeyDictionary[AbstractEventLoop, StateBuffer] = WeakKeyDictionary()
+
+
+def get_state_buffer() -> StateBuffer:
+    """Return the state buffer of the running event loop
+
+    :return: shared state buffer
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _buffers:
+        _buffers[loop] = StateBuffer()
+    return _buffers[loop]
+
+
+async def close_state_buffer():
+    """Send pending updates and stop flushing, call it on shutdown"""
+    buffer = _buffers.pop(asyncio.get_running_loop(), None)
+    if buffer is not None:
+        await buffer.close()
@@ -0,0 +1,144 @@
+"""Telemetry of the twins for the streams of the public API
+
+Twins write the changes of status and meter of their charge point, EVSEs,
+connectors and vehicles to the publisher of their event loop. Changes of the
+same object are merged, the latest value of each field wins, and published
+every ``TWIN_TELEMETRY_INTERVAL`` seconds in a single message per user on the
+redis channel of the user. Telemetry is best effort: the state of record is
+the one sent to the private backend, messages that cannot be published are
+dropped.
+"""
+
+import asyncio
+import json
+from asyncio import AbstractEventLoop, Task
+from weakref import WeakKeyDictionary
+
+import redis.asyncio as aioredis
+from loguru import logger
+from redis.exceptions import RedisError
+
+from elu.twin.charge_point.clock import get_now
+from elu.twin.charge_point.env import (
+    REDIS_DB_ACTIONS,
+    REDIS_HOSTNAME,
+    REDIS_PORT,
+    TOPIC_TELEMETRY_PREFIX,
+    TWIN_TELEMETRY_INTERVAL,
+)
+from elu.twin.charge_point.log import sampled
+from elu.twin.data.enums import TelemetryKind
+from elu.twin.data.schemas.common import Index
+
+
+def get_telemetry_channel(user_id: Index) -> str:
+    return f"{TOPIC_TELEMETRY_PREFIX}-{user_id}"
+
+
+class TelemetryPublisher:
+    def __init__(self, interval: float = TWIN_TELEMETRY_INTERVAL):
+        self.interval = interval
+        # user id -> (kind, id) -> event
+        self.events: dict[Index, dict[tuple[str, Index], dict]] = {}
+        self._redis: aioredis.Redis | None = None
+        self._flush_task: Task | None = None
+
+    def _get_redis(self) -> aioredis.Redis:
+        if self._redis is None:
+            self._redis = aioredis.Redis(
+                host=REDIS_HOSTNAME,
+                port=REDIS_PORT,
+                db=REDIS_DB_ACTIONS,
+                decode_responses=True,
+            )
+        return self._redis
+
+    def update(
+        self,
+        user_id: Index | None,
+        kind: TelemetryKind,
+        index: Index,
+        charge_point_id: Index,
+        **values,
+    ):
+        """Merge the changes of an object into its pending event
+
+        :param user_id: owner of the charge point, nothing is published if None
+        :param kind:
+        :param index: id of the object
+        :param charge_point_id:
+        :param values: changed fields
+        """
+        if user_id is None:
+            return
+        event = self.events.setdefault(user_id, {}).setdefault(
+            (kind, index),
+            {"kind": kind, "id": index, "charge_point_id": charge_point_id},
+        )
+        event.update(values, timestamp=get_now())
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_periodically())
+
+    def pop_messages(self) -> dict[str, str]:
+        """Take the pending events out of the publisher
+
+        :return: channel -> message with the list of events of the user
+        """
+        events, self.events = self.events, {}
+        return {
+            get_telemetry_channel(user_id): json.dumps(
+                list(user_events.values()), default=str
+            )
+            for user_id, user_events in events.items()
+        }
+
+    async def flush(self):
+        messages = self.pop_messages()
+        if not messages:
+            return
+        try:
+            async with self._get_redis().pipeline(transaction=False) as pipe:
+                for channel, message in messages.items():
+                    pipe.publish(channel, message)
+                await pipe.execute()
+        except RedisError as error:
+            if sampled("telemetry_dropped"):
+                logger.warning("telemetry not published: {}", error)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+
+_publishers: WeakKeyDictionary[AbstractEventLoop, TelemetryPublisher] = (
+    WeakKeyDictionary()
+)
+
+
+def get_telemetry_publisher() -> TelemetryPublisher:
+    """Return the telemetry publisher of the running event loop
+
+    :return: shared telemetry publisher
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _publishers:
+        _publishers[loop] = TelemetryPublisher()
+    return _publishers[loop]
+
+
+async def close_telemetry_publisher():
+    """Publish the pending events and stop publishing, call it on shutdown"""
+    publisher = _publishers.pop(asyncio.get_running_loop(), None)
+    if publisher is not None:
+        await publisher.close()
@@ -0,0 +1,290 @@
+"""Twin host: run many charge point twins in a single asyncio event loop
+
+A twin host is a long-lived process that attaches and detaches charge point
+twins at runtime. Connect requests are popped from the ``TOPIC_CONNECT_CP``
+redis list, so several hosts can share the load. They are popped in batches
+and the charge points of a batch are hydrated with a single request to the
+private backend. Ramped fleet operations schedule their connect requests in
+the ``TOPIC_CONNECT_CP_SCHEDULED`` sorted set, and the hosts move them to the
+list when they are due. Disconnect requests are published on the channel of each
+charge point, the hosts subscribe to all of them with one pattern and the host
+owning the twin handles them. The backend removes the scheduled connect requests
+of the charge points it disconnects. The host serves its prometheus metrics on
+``TWIN_METRICS_PORT``.
+
+Run it with::
+
+    python -m elu.twin.charge_point.twin_host
+"""
+
+import asyncio
+import json
+from asyncio import Task
+
+import redis.asyncio as aioredis
+from loguru import logger
+
+from elu.twin.charge_point.actions_subscriber import (
+    get_actions_subscriber,
+    close_actions_subscriber,
+)
+from elu.twin.charge_point import requests
+from elu.twin.charge_point.celery_factory import create_charger_async
+from elu.twin.charge_point.fleet import (
+    close_fleet_client,
+    get_disconnect_channel,
+    promote_scheduled_requests,
+    report_progress,
+    wait_until,
+)
+from elu.twin.charge_point.http_client import close_session
+from elu.twin.charge_point.log import configure_logging
+from elu.twin.charge_point.metrics import monitor_event_loop, start_metrics_server
+from elu.twin.charge_point.meter_history import close_meter_value_buffer
+from elu.twin.charge_point.quota import close_quota_accountant
+from elu.twin.charge_point.telemetry import close_telemetry_publisher
+from elu.twin.charge_point.state_buffer import close_state_buffer
+from elu.twin.charge_point.env import (
+    REDIS_HOSTNAME,
+    REDIS_PORT,
+    REDIS_DB_ACTIONS,
+    TOPIC_CONNECT_CP,
+    TOPIC_DISCONNECT_CP_PATTERN,
+    TOPIC_ACTIONS_PATTERN,
+    TWIN_HOST_NAME,
+    TWIN_HOST_MAX_TWINS,
+    TWIN_HOST_HYDRATE_BATCH,
+    TWIN_HOST_SCHEDULE_INTERVAL,
+)
+from elu.twin.data.enums import FleetTwinState
+from elu.twin.data.schemas.charge_point import HydratedChargePoint
+from elu.twin.data.schemas.common import Index
+
+
+class TwinHost:
+    def __init__(
+        self,
+        name: str = TWIN_HOST_NAME,
+        max_twins: int = TWIN_HOST_MAX_TWINS,
+        hydrate_batch: int = TWIN_HOST_HYDRATE_BATCH,
+    ):
+        self.name = name
+        self.max_twins = max_twins
+        self.hydrate_batch = hydrate_batch
+        self.twins: dict[Index, Task] = {}
+        self._disconnects: set[Task] = set()
+
+    def is_full(self) -> bool:
+        return len(self.twins) >= self.max_twins
+
+    def attach(
+        self,
+        charge_point_id: Index,
+        hydrated: HydratedChargePoint | None = None,
+        operation_id: str | None = None,
+    ) -> Task | None:
+        """Start a twin in the host event loop
+
+        :param charge_point_id:
+        :param hydrated: charge point and configuration, fetched by the twin if None
+        :param operation_id: fleet operation reporting the state of the twin
+        :return: task running the twin, None if the host is full
+        """
+        if charge_point_id in self.twins:
+            logger.warning(f"charge point {charge_point_id} already attached")
+            return self.twins[charge_point_id]
+        if self.is_full():
+            logger.warning(f"host {self.name} is full, {charge_point_id} rejected")
+            return None
+        task = asyncio.create_task(
+            self._run_twin(charge_point_id, hydrated, operation_id),
+            name=f"twin-{charge_point_id}",
+        )
+        self.twins[charge_point_id] = task
+        task.add_done_callback(lambda t: self._on_twin_done(charge_point_id, t))
+        logger.info(f"attached {charge_point_id} to {self.name} ({len(self.twins)})")
+        return task
+
+    async def detach(self, charge_point_id: Index) -> bool:
+        """Stop a twin and wait until it is closed
+
+        :param charge_point_id:
+        :return: true if the twin was running in this host
+        """
+        task = self.twins.pop(charge_point_id, None)
+        if task is None:
+            return False
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        logger.info(f"detached {charge_point_id} from {self.name}")
+        return True
+
+    async def detach_all(self):
+        await asyncio.gather(*[self.detach(cid) for cid in list(self.twins)])
+
+    async def _run_twin(
+        self,
+        charge_point_id: Index,
+        hydrated: HydratedChargePoint | None = None,
+        operation_id: str | None = None,
+    ):
+        try:
+            await create_charger_async(charge_point_id, hydrated, operation_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"twin {charge_point_id} failed: {e}")
+
+    def _on_twin_done(self, charge_point_id: Index, task: Task):
+        if self.twins.get(charge_point_id) is task:
+            del self.twins[charge_point_id]
+
+    @staticmethod
+    def _get_redis() -> aioredis.Redis:
+        return aioredis.Redis(
+            host=REDIS_HOSTNAME,
+            port=REDIS_PORT,
+            db=REDIS_DB_ACTIONS,
+            decode_responses=True,
+        )
+
+    async def consume_connect_requests(self):
+        """Pop connect requests while there is room for more twins"""
+        r = self._get_redis()
+        while True:
+            if self.is_full():
+                await asyncio.sleep(1)
+                continue
+            _, data = await r.blpop([TOPIC_CONNECT_CP])
+            batch = [data]
+            count = min(self.hydrate_batch, self.max_twins - len(self.twins)) - 1
+            if count > 0:
+                batch.extend(await r.lpop(TOPIC_CONNECT_CP, count) or [])
+            operations = {}
+            for data in batch:
+                try:
+                    request = json.loads(data)
+                    operations[request.get("charge_point_id")] = request.get(
+                        "operation_id"
+                    )
+                except Exception as error:
+                    logger.error(f"error parsing: {data} with error: {error}")
+            await self.attach_batch(list(operations), operations)
+
+    async def consume_scheduled_connect_requests(self):
+        """Move the scheduled connect requests to the list when they are due"""
+        while True:
+            try:
+                await promote_scheduled_requests()
+            except Exception as error:
+                logger.error(f"error promoting scheduled connect requests: {error}")
+            await asyncio.sleep(TWIN_HOST_SCHEDULE_INTERVAL)
+
+    async def attach_batch(
+        self, charge_point_ids: list[Index], operations: dict[Index, str] | None = None
+    ):
+        """Hydrate the charge points with one request and start their twins
+
+        If the hydration fails, each twin fetches its own charge point.
+
+        :param charge_point_ids:
+        :param operations: fleet operation of each charge point
+        """
+        operations = operations or {}
+        new_ids = [cid for cid in charge_point_ids if cid not in self.twins]
+        hydrated = None
+        if new_ids:
+            try:
+                hydrated = await requests.hydrate_charge_points(new_ids)
+            except Exception as error:
+                logger.error(f"error hydrating {len(new_ids)} charge points: {error}")
+        if hydrated is None:
+            for charge_point_id in charge_point_ids:
+                self.attach(charge_point_id, None, operations.get(charge_point_id))
+            return
+        found = {x.charge_point.id: x for x in hydrated}
+        for charge_point_id in charge_point_ids:
+            if charge_point_id in self.twins:
+                self.attach(charge_point_id)
+            elif charge_point_id in found:
+                self.attach(
+                    charge_point_id,
+                    found[charge_point_id],
+                    operations.get(charge_point_id),
+                )
+            else:
+                logger.warning(f"charge point {charge_point_id} not found")
+                await report_progress(
+                    operations.get(charge_point_id),
+                    charge_point_id,
+                    FleetTwinState.failed,
+                )
+
+    async def consume_disconnect_requests(self):
+        """Detach twins owned by this host on disconnect requests"""
+        r = self._get_redis()
+        p = r.pubsub(ignore_subscribe_messages=True)
+        await p.psubscribe(TOPIC_DISCONNECT_CP_PATTERN)
+        channel_prefix = get_disconnect_channel("")
+        async for message in p.listen():
+            # only the requests of the twins of this host are parsed
+            if message["channel"].removeprefix(channel_prefix) not in self.twins:
+                continue
+            try:
+                request = json.loads(message.get("data"))
+            except Exception as error:
+                logger.error(f"error parsing: {message} with error: {error}")
+                continue
+            task = asyncio.create_task(
+                self._disconnect(
+                    request.get("charge_point_id"),
+                    request.get("operation_id"),
+                    request.get("not_before"),
+                )
+            )
+            self._disconnects.add(task)
+            task.add_done_callback(self._disconnects.discard)
+
+    async def _disconnect(
+        self,
+        charge_point_id: Index,
+        operation_id: str | None = None,
+        not_before: float | None = None,
+    ):
+        await wait_until(not_before)
+        await report_progress(
+            operation_id, charge_point_id, FleetTwinState.disconnecting
+        )
+        if await self.detach(charge_point_id):
+            await report_progress(
+                operation_id, charge_point_id, FleetTwinState.disconnected
+            )
+
+    async def run(self):
+        logger.info(f"starting twin host {self.name}, max twins: {self.max_twins}")
+        # a single pattern subscription delivers the actions of all the twins
+        get_actions_subscriber(pattern=TOPIC_ACTIONS_PATTERN)
+        start_metrics_server()
+        try:
+            await asyncio.gather(
+                self.consume_connect_requests(),
+                self.consume_disconnect_requests(),
+                self.consume_scheduled_connect_requests(),
+                monitor_event_loop(),
+            )
+        finally:
+            for task in list(self._disconnects):
+                task.cancel()
+            await self.detach_all()
+            await close_fleet_client()
+            await close_actions_subscriber()
+            await close_state_buffer()
+            await close_quota_accountant()
+            await close_meter_value_buffer()
+            await close_telemetry_publisher()
+            await close_session()
+
+
+if __name__ == "__main__":
+    configure_logging()
+    asyncio.run(TwinHost().run())
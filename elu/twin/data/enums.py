@@ -124,3 +124,36 @@ class AuthorizationStatus(StrEnum):
     expired = "expired"  # Identifier has expired. Not allowed for charging.
     invalid = "invalid"  # Identifier is unknown. Not allowed for charging.
     concurrentTx = "concurrentTx"  # Identifier is already involved in another transaction and multiple transactions are not allowed. (Only relevant for a StartTransaction.req.)
+
+
+class FleetAction(StrEnum):
+    connect = "connect"
+    disconnect = "disconnect"
+
+
+class FleetTwinState(StrEnum):
+    scheduled = "scheduled"
+    connecting = "connecting"
+    connected = "connected"
+    reconnecting = "reconnecting"
+    failed = "failed"
+    disconnecting = "disconnecting"
+    disconnected = "disconnected"
+
+
+class CallOutcome(StrEnum):
+    ok = "ok"
+    error = "error"  # CallError response
+    timeout = "timeout"
+
+
+class FrameFormat(StrEnum):
+    csv = "csv"
+    json = "json"  # pandas DataFrame split in columns and data
+
+
+class TelemetryKind(StrEnum):
+    charge_point = "charge_point"
+    evse = "evse"
+    connector = "connector"
+    vehicle = "vehicle"
@@ -20,3 +20,13 @@ class RequestConnectChargePoint(SQLModel):
 
 class RequestDisconnectChargePoint(SQLModel):
     charge_point_id: Index
+
+
+class RequestTwinDebug(SQLModel):
+    charge_point_id: Index
+    enabled: bool = Field(default=True)
+
+
+class RedisRequestTwinDebug(SQLModel):
+    enabled: bool
+    name: str = "twin_debug"
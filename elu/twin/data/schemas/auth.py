@@ -4,7 +4,7 @@ from ocpp.v16.enums import AuthorizationStatus
 from sqlmodel import Field
 
 from elu.twin.data.enums import AuthMethod
-from elu.twin.data.schemas.common import TableBase, Index
+from elu.twin.data.schemas.common import TableBase, Index, Timestamp
 
 
 class BaseAuthV16(TableBase):
@@ -16,7 +16,9 @@ class BaseAuthV16(TableBase):
         default=None, description="Authorization status"
     )
     parent_id_tag: str | None = Field(default=None, description="Parent identifier tag")
-    expiry_date: datetime | None = Field(default=None, description="Expiry date")
+    expiry_date: datetime | None = Field(
+        default=None, description="Expiry date", sa_type=Timestamp
+    )
 
 
 class InputAuthV16(BaseAuthV16):
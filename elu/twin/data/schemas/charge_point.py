@@ -9,10 +9,11 @@ from ocpp.v16.datatypes import (
 )
 
 
-from elu.twin.data.schemas.common import Index, UpdateSchema
+from elu.twin.data.schemas.common import Index, UpdateSchema, Timestamp
 from elu.twin.data.enums import AuthorizationStatus, Protocol
 from elu.twin.data.schemas.evse import InputEvse, OutputEvse
 from elu.twin.data.schemas.charging_profile import AssignedChargingProfile
+from elu.twin.data.schemas.ocpp_configuration import OutputOcppConfigurationV16
 from elu.twin.data.utils import generate_cid
 
 
@@ -47,7 +48,7 @@ class ChargePointBase(SQLModel):
     )
     status: ChargePointStatus = Field(default=ChargePointStatus.unavailable)
     charge_point_task_id: str | None = Field(default=None)
-    last_heartbeat: datetime | None = Field(default=None)
+    last_heartbeat: datetime | None = Field(default=None, sa_type=Timestamp)
     token_cost_per_minute: int = Field(
         default=0, ge=0, description="Token cost per minute"
     )
@@ -76,6 +77,17 @@ class OutputChargePoint(OutputSimpleChargePoint):
     authorization_list_version: int = Field(default=0)
 
 
+class HydrateChargePoints(SQLModel):
+    charge_point_ids: list[Index] = Field(min_length=1, max_length=1000)
+
+
+class HydratedChargePoint(SQLModel):
+    """Everything a twin needs to start"""
+
+    charge_point: OutputChargePoint
+    ocpp_configuration: OutputOcppConfigurationV16 | None = Field(default=None)
+
+
 class UpdateChargePoint(UpdateSchema):
     name: Optional[str] = None
     csms_url: Optional[str] = None
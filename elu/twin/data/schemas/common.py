@@ -1,5 +1,6 @@
-from datetime import datetime
+from datetime import datetime, timezone
 
+from sqlalchemy import DateTime, TypeDecorator
 from sqlmodel import SQLModel, Field
 from uuid import UUID, uuid4
 
@@ -12,13 +13,31 @@ def get_uuid_str() -> str:
     return str(uuid4())
 
 
+class Timestamp(TypeDecorator):
+    """Timestamp column stored in UTC without time zone
+
+    Accepts the ISO strings and aware datetimes given by get_now, that the
+    asyncpg driver does not convert by itself.
+    """
+
+    impl = DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+
 class IDBase(SQLModel):
     id: Index | None = Field(default_factory=get_uuid_str, primary_key=True, index=True)
 
 
 class TimestampBase(SQLModel):
-    created_at: datetime = Field(default_factory=get_now)
-    updated_at: datetime = Field(default_factory=get_now)
+    created_at: datetime = Field(default_factory=get_now, sa_type=Timestamp)
+    updated_at: datetime = Field(default_factory=get_now, sa_type=Timestamp)
 
 
 class TableBase(IDBase, TimestampBase):
@@ -0,0 +1,44 @@
+from datetime import datetime
+
+from ocpp.v201.enums import BootReasonType
+from sqlmodel import SQLModel, Field
+
+from elu.twin.data.enums import FleetAction, FleetTwinState
+from elu.twin.data.schemas.common import Index
+
+
+class RequestFleetOperation(SQLModel):
+    charge_point_ids: list[Index] | None = Field(
+        default=None, description="Charge points, all the user charge points if None"
+    )
+    name_prefix: str | None = Field(
+        default=None,
+        description="Only the charge points whose name starts with the prefix, "
+        "e.g. VENDOR-20240101120000 for the charge points of a charge point string",
+    )
+    limit: int | None = Field(
+        default=None, ge=1, description="Maximum number of charge points"
+    )
+    rate: float = Field(default=10, gt=0, description="Charge points per second")
+
+
+class RequestFleetConnect(RequestFleetOperation):
+    boot_reason: BootReasonType | None = Field(default=None)
+
+
+class RequestFleetDisconnect(RequestFleetOperation):
+    pass
+
+
+class OutputFleetOperation(SQLModel):
+    id: str
+    action: FleetAction
+    total: int
+    rate: float
+    created_at: datetime
+    states: dict[FleetTwinState, int] = Field(
+        default_factory=dict, description="Number of twins per state"
+    )
+    charge_points: dict[Index, FleetTwinState] | None = Field(
+        default=None, description="State of each twin"
+    )
@@ -0,0 +1,65 @@
+from datetime import datetime
+
+from pydantic import model_validator
+from sqlmodel import Field, SQLModel
+
+from elu.twin.data.schemas.common import Index, Timestamp
+
+# columns sent by the twins, in the order of the rows copied to the table
+METER_VALUE_COLUMNS = (
+    "timestamp",
+    "user_id",
+    "charge_point_id",
+    "connector_id",
+    "transaction_id",
+    "power",
+    "current",
+    "voltage",
+    "energy",
+    "total_energy",
+    "soc",
+)
+
+
+class BaseMeterValue(SQLModel):
+    timestamp: datetime = Field(sa_type=Timestamp, description="Time of the sample")
+    user_id: Index | None = Field(default=None)
+    charge_point_id: Index
+    connector_id: Index
+    transaction_id: Index | None = Field(default=None)
+    power: float = Field(default=0.0, description="Power in kW")
+    current: float = Field(default=0.0, description="Current in A")
+    voltage: float = Field(default=0.0, description="Voltage in V")
+    energy: float = Field(default=0.0, description="Energy of the transaction in kWh")
+    total_energy: float = Field(default=0.0, description="Meter register in kWh")
+    soc: int | None = Field(default=None, description="State of charge in %")
+
+
+class MeterValueBatch(SQLModel):
+    """Meter values of many twins, a list per column, the timestamps in s
+    since the epoch"""
+
+    timestamp: list[float] = Field(default_factory=list)
+    user_id: list[Index | None] = Field(default_factory=list)
+    charge_point_id: list[Index] = Field(default_factory=list)
+    connector_id: list[Index] = Field(default_factory=list)
+    transaction_id: list[Index | None] = Field(default_factory=list)
+    power: list[float] = Field(default_factory=list)
+    current: list[float] = Field(default_factory=list)
+    voltage: list[float] = Field(default_factory=list)
+    energy: list[float] = Field(default_factory=list)
+    total_energy: list[float] = Field(default_factory=list)
+    soc: list[int | None] = Field(default_factory=list)
+
+    @model_validator(mode="after")
+    def check_lengths(self):
+        if len({len(getattr(self, column)) for column in METER_VALUE_COLUMNS}) > 1:
+            raise ValueError("All the columns must have the same length")
+        return self
+
+    def __len__(self) -> int:
+        return len(self.timestamp)
+
+
+class OutputMeterValueBatch(SQLModel):
+    inserted: int = Field(default=0, description="Meter values inserted")
@@ -1,5 +1,7 @@
 from sqlmodel import Field, SQLModel
 
+from elu.twin.data.schemas.common import Index
+
 
 class QuotaBase(SQLModel):
     max_number_of_charge_points: int = Field(default=20, ge=0)
@@ -13,3 +15,13 @@ class QuotaBase(SQLModel):
 
 class OutputQuota(QuotaBase):
     pass
+
+
+class QuotaConsumption(SQLModel):
+    id: Index
+    consumed: int = Field(ge=0, description="Number of tokens consumed")
+
+
+class OutputQuotaBalance(SQLModel):
+    id: Index
+    available_tokens: int
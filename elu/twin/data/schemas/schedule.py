@@ -1,4 +1,6 @@
 from __future__ import annotations
+
+import heapq
 from datetime import datetime, timedelta, timezone
 
 from ocpp.v16.datatypes import ChargingProfile, ChargingSchedule, ChargingSchedulePeriod
@@ -14,109 +16,76 @@ class Interval(SQLModel):
     value: float
     stack_level: int
 
-    def contains_overlap(self, other: Interval) -> bool:
-        return not (
-            (self.start_time >= other.end_time) or (self.end_time <= other.start_time)
-        )
 
-    def merge_interval(self, other: Interval) -> list[Interval]:
-        first = Interval(
-            start_time=self.start_time,
-            end_time=self.end_time,
-            value=self.value,
-            stack_level=self.stack_level,
-        )
-        second = other
-        if first.start_time > second.start_time:
-            first, second = second, first
-        if first.end_time <= second.start_time:
-            return [first, second]
-        if first.end_time < second.end_time:
-            if first.stack_level > second.stack_level:
-                second.start_time = first.end_time
-                return [first, second]
-            else:
-                first.end_time = second.start_time
-                return [first, second]
-        elif first.end_time == second.end_time:
-            if first.stack_level > second.stack_level:
-                return [first]
-            else:
-                first.end_time = second.start_time
-                return [first, second]
-        else:
-            if first.stack_level > second.stack_level:
-                return [first]
-            else:
-                third = Interval(
-                    start_time=second.end_time,
-                    end_time=first.end_time,
-                    value=first.value,
-                    stack_level=first.stack_level,
+def merge_intervals(
+    intervals: list[tuple[datetime, datetime, float, int]],
+) -> list[tuple[datetime, datetime, float, int]]:
+    """Resolve the overlaps of stacked intervals with a sweep line, in O(n log n)
+
+    Where intervals overlap, the one with the highest stack level wins, then
+    the one starting last, then the one given last. Empty intervals are
+    dropped.
+
+    This replaced merging the intervals one pair at a time, whose result
+    depended on the order the intervals were added: it dropped or mis-trimmed
+    some intervals, e.g. a profile at a high stack level between two lower
+    ones, kept some overlaps and gave zero length periods. The limits of
+    these schedules changed with it.
+
+    :param intervals: (start_time, end_time, value, stack_level) tuples
+    :return: non overlapping (start_time, end_time, value, stack_level) tuples,
+        sorted by start_time
+    """
+    times = sorted({time for interval in intervals for time in interval[:2]})
+    starts = sorted(range(len(intervals)), key=lambda i: intervals[i][0])
+    active: list[tuple[int, float, int]] = []
+    merged: list[list] = []
+    winner = None
+    j = 0
+    for time, next_time in zip(times, times[1:]):
+        while j < len(starts) and intervals[starts[j]][0] <= time:
+            start_time, end_time, _, stack_level = intervals[starts[j]]
+            if end_time > start_time:
+                heapq.heappush(
+                    active, (-stack_level, -start_time.timestamp(), -starts[j])
                 )
-                first.end_time = second.start_time
-                return [first, second, third]
+            j += 1
+        while active and intervals[-active[0][2]][1] <= time:
+            heapq.heappop(active)
+        if not active:
+            winner = None
+            continue
+        _, _, value, stack_level = intervals[-active[0][2]]
+        if winner == active[0][2] and merged[-1][1] == time:
+            merged[-1][1] = next_time
+        else:
+            winner = active[0][2]
+            merged.append([time, next_time, value, stack_level])
+    return [tuple(interval) for interval in merged]
 
 
 class Schedule(SQLModel):
     intervals: list[Interval] = Field(default_factory=list)
 
-    def insert_interval(self, interval: Interval):
-        if len(self.intervals) == 0:
-            self.intervals.append(interval)
-            return None
-        else:
-            if interval.end_time <= self.intervals[0].start_time:
-                self.intervals = [interval] + self.intervals
-                return None
-            elif interval.start_time >= self.intervals[-1].end_time:
-                self.intervals.append(interval)
-                return None
-            else:
-                for i in range(len(self.intervals) - 1):
-                    if (
-                        self.intervals[i].end_time >= interval.start_time
-                        and self.intervals[i + 1].start_time >= interval.end_time
-                    ):
-                        self.intervals = (
-                            self.intervals[: (i + 1)]
-                            + [interval]
-                            + self.intervals[(i + 1) :]
-                        )
-                        return None
-
     def add_interval(self, new_interval: Interval):
-        _new_interval = new_interval
-        while True:
-            interval_overlapping = next(
-                (
-                    (i, interval)
-                    for i, interval in enumerate(self.intervals)
-                    if interval.contains_overlap(_new_interval)
-                ),
-                None,
-            )
-            if interval_overlapping:
-                index, interval = interval_overlapping
-                end = interval.end_time
-                new_intervals: list[Interval] = interval.merge_interval(_new_interval)
-                del self.intervals[index]
-                stop = True
-                for new_int in new_intervals:
-                    if new_int.end_time <= end:
-                        self.insert_interval(new_int)
-                    else:
-                        stop = False
-                        _new_interval = new_int
-                if stop:
-                    break
-            else:
-                self.insert_interval(_new_interval)
-                break
+        self.add_intervals([new_interval])
 
     def add_intervals(self, intervals: list[Interval]):
-        for interval in intervals:
-            self.add_interval(interval)
+        merged = merge_intervals(
+            [
+                (i.start_time, i.end_time, i.value, i.stack_level)
+                for i in self.intervals + intervals
+            ]
+        )
+        self.intervals = [
+            Interval.model_construct(
+                start_time=start_time,
+                end_time=end_time,
+                value=value,
+                stack_level=stack_level,
+            )
+            for start_time, end_time, value, stack_level in merged
+        ]
 
     def to_periods(self) -> list[ChargingSchedulePeriod]:
         periods = []
@@ -135,8 +104,9 @@ class Schedule(SQLModel):
         profiles: list[ChargingProfile],
         duration: int,
         charging_rate_unit: ChargingRateUnitType,
+        now: datetime | None = None,
     ) -> ChargingSchedule:
-        now = get_now(as_string=False)
+        now = now or get_now(as_string=False)
         end_schedule = now + timedelta(seconds=duration)
         all_intervals = []
         min_charging_rate = 0
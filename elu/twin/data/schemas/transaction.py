@@ -6,12 +6,18 @@ from elu.twin.data.enums import TransactionStatus, TransactionName
 from elu.twin.data.helpers import get_now
 
 # from elu.twin.data.schemas.charging_profile import AssignedChargingProfile
-from elu.twin.data.schemas.common import Index, TableBase, OwnedByUser, UpdateSchema
+from elu.twin.data.schemas.common import (
+    Index,
+    TableBase,
+    OwnedByUser,
+    UpdateSchema,
+    Timestamp,
+)
 
 
 class BaseTransaction(TableBase):
-    start_time: datetime = Field(default_factory=get_now)
-    end_time: datetime | None = Field(default=None)
+    start_time: datetime = Field(default_factory=get_now, sa_type=Timestamp)
+    end_time: datetime | None = Field(default=None, sa_type=Timestamp)
     energy: int = Field(default=0, ge=0, description="Energy in kWh")
     status: TransactionStatus = Field(default=TransactionStatus.pending)
     transactionid: str | None = Field(default=None, description="Transaction ID")
@@ -0,0 +1,52 @@
+from ocpp.v16.enums import ChargePointStatus
+from sqlmodel import Field, SQLModel
+
+from elu.twin.data.enums import ConnectorStatus, EvseStatus, VehicleStatus
+from elu.twin.data.schemas.common import Index, UpdateSchema
+from elu.twin.data.schemas.connector import UpdateConnector
+from elu.twin.data.schemas.transaction import UpdateTransaction
+from elu.twin.data.schemas.vehicle import UpdateVehicle
+
+
+class ChargePointDelta(UpdateSchema):
+    id: Index
+    status: ChargePointStatus | None = None
+
+
+class ConnectorDelta(UpdateConnector):
+    id: Index
+    status: ConnectorStatus | None = None
+
+
+class EvseDelta(UpdateSchema):
+    id: Index
+    status: EvseStatus | None = None
+    active_connector_id: int | None = None
+
+
+class TransactionDelta(UpdateTransaction):
+    id: Index
+
+
+class VehicleDelta(UpdateVehicle):
+    id: Index
+    status: VehicleStatus | None = None
+
+
+class TwinStateDelta(SQLModel):
+    """Changes of the state of many twins, only the fields explicitly set in
+    each delta are applied"""
+
+    charge_points: list[ChargePointDelta] = Field(default_factory=list)
+    connectors: list[ConnectorDelta] = Field(default_factory=list)
+    evses: list[EvseDelta] = Field(default_factory=list)
+    transactions: list[TransactionDelta] = Field(default_factory=list)
+    vehicles: list[VehicleDelta] = Field(default_factory=list)
+
+
+class OutputTwinStateDelta(SQLModel):
+    charge_points: int = Field(default=0, description="Charge points updated")
+    connectors: int = Field(default=0, description="Connectors updated")
+    evses: int = Field(default=0, description="EVSEs updated")
+    transactions: int = Field(default=0, description="Transactions updated")
+    vehicles: int = Field(default=0, description="Vehicles updated")
@@ -1,5 +1,6 @@
 from typing import Optional, List
 
+from sqlalchemy import BigInteger, Column, Index as SqlIndex
 from sqlmodel import Field, Relationship
 
 from elu.twin.data.enums import (
@@ -8,6 +9,7 @@ from elu.twin.data.enums import (
 from elu.twin.data.schemas.charge_point import ChargePointBase
 from elu.twin.data.schemas.common import OwnedByUser, TableBase, Index
 from elu.twin.data.schemas.connector import BaseConnector
+from elu.twin.data.schemas.meter_value import BaseMeterValue
 from elu.twin.data.schemas.quota import QuotaBase
 from elu.twin.data.schemas.token import BaseAppToken
 from elu.twin.data.schemas.transaction import BaseTransaction
@@ -39,6 +41,12 @@ class User(BaseUser, TableBase, table=True):
 
 
 class ChargePoint(ChargePointBase, OwnedByUser, table=True):
+    # pages of the charge points of a user, and their status
+    __table_args__ = (
+        SqlIndex("ix_chargepoint_user_id_created_at", "user_id", "created_at", "id"),
+        SqlIndex("ix_chargepoint_user_id_status", "user_id", "status"),
+    )
+
     name: str = Field(
         index=True, description="Charge point name", default="TwinCharger"
     )
@@ -111,6 +119,10 @@ class Connector(BaseConnector, table=True):
 
 
 class Vehicle(VehicleBase, OwnedByUser, table=True):
+    __table_args__ = (
+        SqlIndex("ix_vehicle_user_id_created_at", "user_id", "created_at", "id"),
+    )
+
     transaction_id: Index | None = Field(default=None, foreign_key="transaction.id")
 
 
@@ -119,14 +131,41 @@ class Vehicle(VehicleBase, OwnedByUser, table=True):
 
 
 class Transaction(BaseTransaction, OwnedByUser, table=True):
+    # pages and time ranges of the transactions of a user or a charge point
+    __table_args__ = (
+        SqlIndex("ix_transaction_user_id_start_time", "user_id", "start_time", "id"),
+        SqlIndex("ix_transaction_charge_point_id", "charge_point_id", "start_time"),
+        SqlIndex("ix_transaction_user_id_status", "user_id", "status"),
+    )
+
     charge_point_id: Index | None = Field(default=None)
     evse_id: Index | None = Field(default=None)
     connector_id: Index | None = Field(default=None)
     vehicle_id: Index | None = Field(default=None)
 
 
+class MeterValue(BaseMeterValue, table=True):
+    """Append-only history of the meter values of the twins
+
+    Written in batches with COPY, the timestamps only grow so a BRIN index
+    keeps the time range queries cheap at a fraction of the size of a btree.
+    """
+
+    __table_args__ = (
+        SqlIndex("ix_metervalue_timestamp", "timestamp", postgresql_using="brin"),
+        SqlIndex("ix_metervalue_transaction_id", "transaction_id", "timestamp"),
+        SqlIndex("ix_metervalue_charge_point_id", "charge_point_id", "timestamp"),
+    )
+
+    id: int | None = Field(default=None, sa_column=Column(BigInteger, primary_key=True))
+
+
 class AppToken(BaseAppToken, OwnedByUser, table=True):
     hashed_token: str = Field(description="Hashed token")
+    # None for the tokens created before, set the first time they are used
+    fingerprint: str | None = Field(
+        default=None, index=True, unique=True, description="HMAC of the token"
+    )
 
 
 class OcppConfigurationV16(TableBase, OcppConfigurationV16Base, table=True):
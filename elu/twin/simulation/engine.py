@@ -0,0 +1,422 @@
+"""Discrete-event simulation of charging sessions
+
+The engine runs the charging physics of the charge point twins for whole
+fleets without CSMS, websockets or backend. Events (session start, meter value
+sample, session stop, new charging profile) are kept in a heap ordered by
+simulated time and handled one after the other, so a day of charging takes the
+time needed to compute it. The sessions charge in a ``FleetState``: meter
+values are sampled for all the charging connectors at once, on a grid of
+``meter_values_interval`` seconds from the start of the simulation.
+
+Example::
+
+    engine = Engine(charge_points, start=datetime(2024, 6, 1, tzinfo=UTC))
+    engine.add_session(
+        charge_point.id, evse_id=1, connector_id=1, vehicle=vehicle,
+        arrival=datetime(2024, 6, 1, 8, tzinfo=UTC),
+        departure=datetime(2024, 6, 1, 17, tzinfo=UTC),
+    )
+    result = engine.run(until=datetime(2024, 6, 2, tzinfo=UTC))
+    result.meter_values  # pandas DataFrame, one row per meter value
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from enum import IntEnum
+
+import numpy as np
+import pandas as pd
+
+from elu.twin.data.enums import TransactionStatus
+from elu.twin.data.schemas.charge_point import OutputChargePoint
+from elu.twin.data.schemas.charging_profile import AssignedChargingProfile
+from elu.twin.data.schemas.common import Index
+from elu.twin.data.schemas.vehicle import OutputVehicle
+from elu.twin.simulation import physics
+from elu.twin.simulation.fleet import ConnectorState, FleetState
+
+
+class EventType(IntEnum):
+    """Events at the same time are handled in this order"""
+
+    stop = 0
+    charging_profile = 1
+    start = 2
+    meter_value = 3
+
+
+@dataclass
+class Session:
+    transactionid: int
+    charge_point: OutputChargePoint
+    eix: int
+    cix: int
+    vehicle: OutputVehicle
+    arrival: float
+    departure: float | None
+    target_soc: float
+    initial_soc: float = 0
+    soc: float = 0
+    current_energy: float = 0
+    total_energy: float = 0
+    start_time: datetime | None = None
+    stop_time: float | None = None
+    status: TransactionStatus = TransactionStatus.pending
+    slot: int | None = None
+    profile_index: physics.ProfileIndex | None = None
+
+
+class Columns:
+    """Values recorded column by column, converted to a data frame at the end"""
+
+    def __init__(self, *names: str):
+        self.columns: dict[str, list] = {name: [] for name in names}
+
+    def append(self, *values):
+        for column, value in zip(self.columns.values(), values):
+            column.append([value])
+
+    def extend(self, *values: np.ndarray):
+        for column, value in zip(self.columns.values(), values):
+            column.append(value)
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            {
+                name: np.concatenate(chunks) if chunks else np.array([])
+                for name, chunks in self.columns.items()
+            }
+        )
+
+
+@dataclass
+class SimulationResult:
+    meter_values: pd.DataFrame
+    transactions: pd.DataFrame
+
+
+class Engine:
+    def __init__(
+        self,
+        charge_points: list[OutputChargePoint],
+        start: datetime,
+        meter_values_interval: int = 60,
+    ):
+        """
+        :param charge_points: charge points, updated as the simulation runs
+        :param start: simulated time of the start of the simulation
+        :param meter_values_interval: seconds between meter values
+        """
+        self.charge_points = {cp.id: cp for cp in charge_points}
+        self.start = start
+        self.meter_values_interval = meter_values_interval
+        self.time = 0.0
+        self.sessions: list[Session] = []
+        self.fleet = FleetState()
+        self._events: list[tuple[float, EventType, int, object]] = []
+        self._counter = itertools.count()
+        self._next_meter_value: float | None = None
+        self._occupied: dict[tuple[Index, int, int], Session] = {}
+        # charging sessions by fleet slot
+        self._slots: dict[int, Session] = {}
+        # slots of the sessions on a charge point with charging profiles
+        self._profiled_slots: set[int] = set()
+        # target soc by fleet slot, infinite for the sessions with a departure
+        self._target_soc = np.full(len(self.fleet.active), np.inf)
+        self._meter_values = Columns("time", "transactionid", "power", "energy", "soc")
+
+    def _seconds(self, time: datetime) -> float:
+        return (time - self.start).total_seconds()
+
+    def _push(self, time: float, event: EventType, payload):
+        heapq.heappush(self._events, (time, event, next(self._counter), payload))
+
+    def add_session(
+        self,
+        charge_point_id: Index,
+        evse_id: int,
+        connector_id: int,
+        vehicle: OutputVehicle,
+        arrival: datetime,
+        departure: datetime | None = None,
+        target_soc: float = 100,
+    ) -> int:
+        """Plug a vehicle in a connector
+
+        :param charge_point_id:
+        :param evse_id: evse id, starting at 1
+        :param connector_id: connector id in the evse, starting at 1
+        :param vehicle: vehicle, its soc is updated at the end of the session
+        :param arrival: start of the transaction
+        :param departure: end of the transaction, None to stop at the target soc
+        :param target_soc: soc in % to stop charging
+        :return: transaction id
+        """
+        charge_point = self.charge_points.get(charge_point_id)
+        if charge_point is None:
+            raise ValueError(f"Charge point {charge_point_id} not found")
+        if not (
+            0 < evse_id <= len(charge_point.evses)
+            and 0 < connector_id <= len(charge_point.evses[evse_id - 1].connectors)
+        ):
+            raise ValueError(f"Connector {evse_id}-{connector_id} not found")
+        session = Session(
+            transactionid=len(self.sessions) + 1,
+            charge_point=charge_point,
+            eix=evse_id - 1,
+            cix=connector_id - 1,
+            vehicle=vehicle,
+            arrival=self._seconds(arrival),
+            departure=self._seconds(departure) if departure else None,
+            target_soc=target_soc,
+        )
+        self.sessions.append(session)
+        self._push(session.arrival, EventType.start, session)
+        if session.departure is not None:
+            self._push(session.departure, EventType.stop, session)
+        return session.transactionid
+
+    def add_charging_profile(
+        self,
+        charge_point_id: Index,
+        charging_profile: AssignedChargingProfile,
+        time: datetime | None = None,
+    ):
+        """Set a charging profile on a charge point
+
+        :param charge_point_id:
+        :param charging_profile:
+        :param time: when the profile is set, start of the simulation if None
+        """
+        if charge_point_id not in self.charge_points:
+            raise ValueError(f"Charge point {charge_point_id} not found")
+        self._push(
+            self._seconds(time) if time else 0.0,
+            EventType.charging_profile,
+            (charge_point_id, charging_profile),
+        )
+
+    def _start(self, session: Session):
+        key = (session.charge_point.id, session.eix, session.cix)
+        if key in self._occupied:
+            session.status = TransactionStatus.rejected
+            session.stop_time = self.time
+            return
+        self._occupied[key] = session
+        charge_point = session.charge_point
+        connector = charge_point.evses[session.eix].connectors[session.cix]
+        connector.transactionid = session.transactionid
+        session.status = TransactionStatus.running
+        session.initial_soc = session.soc = session.vehicle.soc
+        session.start_time = self.start + timedelta(seconds=self.time)
+        session.total_energy = connector.total_energy
+        session.slot = slot = self.fleet.start(
+            self.time,
+            initial_soc=session.initial_soc,
+            battery=session.vehicle.battery_capacity,
+            total_energy=session.total_energy,
+            maximum_power=charge_point.maximum_dc_power,
+        )
+        if len(self._target_soc) < len(self.fleet.active):
+            self._target_soc = np.resize(self._target_soc, len(self.fleet.active))
+        self._target_soc[slot] = (
+            session.target_soc if session.departure is None else np.inf
+        )
+        self._slots[slot] = session
+        if charge_point.charging_profiles:
+            self._set_profile_index(session)
+        self.fleet.power[slot] = self._get_power(session)
+
+        # the meter values of the grid are sampled by _meter_value
+        if self._next_meter_value != self.time:
+            self._record(np.array([slot]))
+            if session.soc >= session.target_soc and session.departure is None:
+                self._push(self.time, EventType.stop, session)
+        if self._next_meter_value is None:
+            interval = self.meter_values_interval
+            self._next_meter_value = (self.time // interval + 1) * interval
+            self._push(self._next_meter_value, EventType.meter_value, None)
+
+    def _set_profile_index(self, session: Session):
+        charge_point = session.charge_point
+        session.profile_index = physics.ProfileIndex(
+            charge_point.charging_profiles,
+            start_time=session.start_time,
+            voltage=charge_point.voltage_dc,
+            evse_id=session.eix + 1,
+            connector_id=session.cix + 1,
+        )
+        self._profiled_slots.add(session.slot)
+
+    def _get_power(self, session: Session) -> int:
+        maximum_power = session.charge_point.maximum_dc_power
+        soc = self.fleet.soc[session.slot]
+        if session.profile_index is None:
+            return maximum_power if soc < 100 else 0
+        return session.profile_index.get_power(
+            maximum_power, soc, self.start + timedelta(seconds=self.time)
+        )
+
+    def _record(self, slots: np.ndarray):
+        fleet = self.fleet
+        self._meter_values.extend(
+            np.full(len(slots), self.time),
+            np.array([self._slots[slot].transactionid for slot in slots]),
+            fleet.power[slots],
+            fleet.total_energy[slots].astype(int),
+            fleet.soc[slots].astype(int),
+        )
+
+    def _meter_value(self, _=None):
+        """Sample a meter value of all the charging connectors"""
+        fleet = self.fleet
+        slots = np.flatnonzero(fleet.active)
+        fleet.advance(self.time)
+        power = np.where(fleet.soc[slots] < 100, fleet.maximum_power[slots], 0)
+        fleet.power[slots] = power
+        for slot in self._profiled_slots:
+            fleet.power[slot] = self._get_power(self._slots[slot])
+        self._record(slots)
+
+        done = slots[fleet.soc[slots] >= self._target_soc[slots]]
+        for slot in done:
+            self._stop(self._slots[slot])
+        if fleet.active.any():
+            self._next_meter_value = self.time + self.meter_values_interval
+            self._push(self._next_meter_value, EventType.meter_value, None)
+        else:
+            self._next_meter_value = None
+
+    def _stop(self, session: Session):
+        if session.status != TransactionStatus.running:
+            return
+        session.status = TransactionStatus.completed
+        session.stop_time = self.time
+        self._read_fleet(session, self.fleet.stop(session.slot, self.time))
+        session.vehicle.soc = session.soc
+        del self._slots[session.slot]
+        self._profiled_slots.discard(session.slot)
+        session.slot = None
+        del self._occupied[(session.charge_point.id, session.eix, session.cix)]
+        self._update_connector(session)
+        connector = session.charge_point.evses[session.eix].connectors[session.cix]
+        connector.transactionid = None
+        connector.soc = None
+
+    @staticmethod
+    def _read_fleet(session: Session, state: ConnectorState):
+        session.current_energy = state.current_energy
+        session.total_energy = state.total_energy
+        session.soc = state.soc
+
+    @staticmethod
+    def _update_connector(session: Session):
+        """Copy the meter of a session to its connector"""
+        connector = session.charge_point.evses[session.eix].connectors[session.cix]
+        connector.current_energy = session.current_energy
+        connector.total_energy = session.total_energy
+        connector.soc = int(session.soc)
+
+    def _set_charging_profile(self, payload: tuple[Index, AssignedChargingProfile]):
+        charge_point_id, charging_profile = payload
+        physics.add_charging_profile(
+            self.charge_points[charge_point_id].charging_profiles, charging_profile
+        )
+        slots = [
+            slot
+            for slot, session in self._slots.items()
+            if session.charge_point.id == charge_point_id
+        ]
+        if not slots:
+            return
+        self.fleet.advance(self.time, np.array(slots))
+        for slot in slots:
+            self._set_profile_index(self._slots[slot])
+            self.fleet.power[slot] = self._get_power(self._slots[slot])
+
+    def run(self, until: datetime | None = None) -> SimulationResult:
+        """Handle the events up to a time
+
+        :param until: end of the simulation, None to run until there are no
+            events left, i.e. all the sessions have a departure or target soc
+        :return: meter values and transactions up to now
+        """
+        end = self._seconds(until) if until else None
+        handlers = {
+            EventType.start: self._start,
+            EventType.meter_value: self._meter_value,
+            EventType.stop: self._stop,
+            EventType.charging_profile: self._set_charging_profile,
+        }
+        while self._events:
+            if end is not None and self._events[0][0] > end:
+                break
+            self.time, event, _, payload = heapq.heappop(self._events)
+            handlers[event](payload)
+        if end is not None:
+            self.time = max(self.time, end)
+        if self._slots:
+            self.fleet.advance(self.time, np.array(list(self._slots)))
+        for slot, session in self._slots.items():
+            self._read_fleet(session, self.fleet.read(slot))
+            self._update_connector(session)
+        return SimulationResult(
+            meter_values=self._to_datetime(self._get_meter_values(), "time"),
+            transactions=self._get_transactions(),
+        )
+
+    def _get_meter_values(self) -> pd.DataFrame:
+        df = self._meter_values.to_frame()
+        sessions = np.asarray(df["transactionid"], dtype=int) - 1
+        charge_point_ids = np.array(
+            [session.charge_point.id for session in self.sessions], dtype=object
+        )
+        eix = np.array([session.eix for session in self.sessions], dtype=int)
+        cix = np.array([session.cix for session in self.sessions], dtype=int)
+        df.insert(1, "charge_point_id", charge_point_ids[sessions])
+        df.insert(2, "evse_id", eix[sessions] + 1)
+        df.insert(3, "connector_id", cix[sessions] + 1)
+        return df
+
+    def _to_datetime(self, df: pd.DataFrame, *columns: str) -> pd.DataFrame:
+        for column in columns:
+            df[column] = pd.Timestamp(self.start) + pd.to_timedelta(
+                df[column], unit="s"
+            )
+        return df
+
+    def _get_transactions(self) -> pd.DataFrame:
+        transactions = Columns(
+            "transactionid",
+            "charge_point_id",
+            "evse_id",
+            "connector_id",
+            "vehicle_id",
+            "start_time",
+            "stop_time",
+            "energy",
+            "initial_soc",
+            "soc",
+            "status",
+        )
+        for session in self.sessions:
+            if session.status == TransactionStatus.pending:
+                continue
+            transactions.append(
+                session.transactionid,
+                session.charge_point.id,
+                session.eix + 1,
+                session.cix + 1,
+                session.vehicle.id,
+                session.arrival,
+                np.nan if session.stop_time is None else session.stop_time,
+                session.current_energy,
+                session.initial_soc,
+                session.soc,
+                str(session.status),
+            )
+        return self._to_datetime(transactions.to_frame(), "start_time", "stop_time")
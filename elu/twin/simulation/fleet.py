@@ -0,0 +1,180 @@
+"""Charging state of a fleet of connectors in numpy arrays
+
+Each charging connector gets a slot in the arrays of a ``FleetState``. The
+energy and soc of all the charging connectors are integrated in one vectorised
+step, so the cost of a step grows with the array size instead of the number of
+python objects. Twins and the simulation engine only read the values of a slot
+when they send a meter value and write its power when it changes.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from asyncio import AbstractEventLoop
+from typing import NamedTuple
+from weakref import WeakKeyDictionary
+
+import numpy as np
+
+
+class ConnectorState(NamedTuple):
+    power: float
+    current_energy: float
+    total_energy: float
+    soc: float
+
+
+class FleetState:
+    def __init__(self, capacity: int = 1024, step: float = 1.0):
+        """
+        :param capacity: initial number of slots, doubled when they are used up
+        :param step: minimum seconds between two steps of ``sync``
+        """
+        self.step = step
+        self.time: float | None = None
+        self.power = np.zeros(capacity)  # kW
+        self.maximum_power = np.zeros(capacity)  # kW
+        self.current_energy = np.zeros(capacity)  # Wh of the transaction
+        self.total_energy = np.zeros(capacity)  # Wh of the connector meter
+        self.soc = np.zeros(capacity)  # %
+        self.initial_soc = np.zeros(capacity)  # %
+        self.battery = np.zeros(capacity)  # kWh
+        self.updated_at = np.zeros(capacity)  # s
+        self.active = np.zeros(capacity, dtype=bool)
+        self._free = list(range(capacity - 1, -1, -1))
+
+    def __len__(self) -> int:
+        return int(self.active.sum())
+
+    def _grow(self):
+        capacity = len(self.active)
+        for name in (
+            "power",
+            "maximum_power",
+            "current_energy",
+            "total_energy",
+            "soc",
+            "initial_soc",
+            "battery",
+            "updated_at",
+            "active",
+        ):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate([array, np.zeros_like(array)]))
+        self._free.extend(range(2 * capacity - 1, capacity - 1, -1))
+
+    def start(
+        self,
+        now: float,
+        initial_soc: float,
+        battery: float,
+        total_energy: float = 0,
+        maximum_power: float = 0,
+    ) -> int:
+        """Start charging a vehicle, at zero power
+
+        :param now: time in s
+        :param initial_soc: soc of the vehicle in %
+        :param battery: battery capacity in kWh
+        :param total_energy: meter of the connector in Wh
+        :param maximum_power: maximum power of the connector in kW
+        :return: slot of the connector
+        """
+        if not self._free:
+            self._grow()
+        slot = self._free.pop()
+        self.power[slot] = 0
+        self.maximum_power[slot] = maximum_power
+        self.current_energy[slot] = 0
+        self.total_energy[slot] = total_energy
+        self.soc[slot] = initial_soc
+        self.initial_soc[slot] = initial_soc
+        self.battery[slot] = battery
+        self.updated_at[slot] = now
+        self.active[slot] = True
+        return slot
+
+    def stop(self, slot: int, now: float) -> ConnectorState:
+        """Stop charging and free the slot
+
+        :param slot:
+        :param now: time in s
+        :return: final state of the connector
+        """
+        self.advance(now, np.array([slot]))
+        state = self.read(slot)
+        self.active[slot] = False
+        self.power[slot] = 0
+        self._free.append(slot)
+        return state
+
+    def advance(self, now: float, slots: np.ndarray | None = None):
+        """Integrate the energy and soc up to now at the current power
+
+        The energy of a connector stops growing once the battery is full.
+
+        :param now: time in s
+        :param slots: slots to advance, all the charging connectors if None
+        """
+        if slots is None:
+            slots = np.flatnonzero(self.active)
+            self.time = now
+        elapsed = np.maximum(now - self.updated_at[slots], 0)
+        battery = self.battery[slots]
+        initial_soc = self.initial_soc[slots]
+        current_energy = self.current_energy[slots]
+        full_energy = (100 - initial_soc) * battery * 10
+        energy = np.maximum(
+            np.minimum(current_energy + self.power[slots] * elapsed / 3.6, full_energy),
+            current_energy,
+        )
+        self.total_energy[slots] += energy - current_energy
+        self.current_energy[slots] = energy
+        with np.errstate(divide="ignore", invalid="ignore"):
+            soc = np.where(
+                battery > 0, initial_soc + energy / (battery * 10), initial_soc
+            )
+        self.soc[slots] = np.minimum(soc, 100)
+        self.updated_at[slots] = now
+
+    def sync(self, now: float):
+        """Advance all the charging connectors, at most once per step
+
+        :param now: time in s
+        """
+        if self.time is None or now - self.time >= self.step:
+            self.advance(now)
+
+    def set_power(self, slot: int, power: float, now: float):
+        """Change the power of a connector, after integrating the previous one
+
+        :param slot:
+        :param power: power in kW
+        :param now: time in s
+        """
+        if self.power[slot] == power:
+            return
+        self.advance(now, np.array([slot]))
+        self.power[slot] = power
+
+    def read(self, slot: int) -> ConnectorState:
+        return ConnectorState(
+            power=float(self.power[slot]),
+            current_energy=float(self.current_energy[slot]),
+            total_energy=float(self.total_energy[slot]),
+            soc=float(self.soc[slot]),
+        )
+
+
+_fleets: WeakKeyDictionary[AbstractEventLoop, FleetState] = WeakKeyDictionary()
+
+
+def get_fleet_state() -> FleetState:
+    """Return the fleet state shared by the twins of the running event loop
+
+    :return: fleet state
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _fleets:
+        _fleets[loop] = FleetState()
+    return _fleets[loop]
@@ -0,0 +1,142 @@
+"""Charging physics shared by the charge point twins and the simulation engine"""
+
+from __future__ import annotations
+
+import bisect
+import math
+from datetime import datetime, UTC
+
+from ocpp.v16.enums import ChargingRateUnitType
+
+from elu.twin.data.schemas.charging_profile import AssignedChargingProfile
+
+
+def _as_datetime(value: datetime | str) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return value
+
+
+def add_charging_profile(
+    charging_profiles: list[AssignedChargingProfile],
+    charging_profile: AssignedChargingProfile,
+):
+    """Add a charging profile to the profiles of a charge point
+
+    If a charging profile with the same chargingProfileId, or the same
+    stackLevel, exists on the charge point, the new charging profile replaces it.
+
+    :param charging_profiles: profiles of the charge point, updated in place
+    :param charging_profile: new profile
+    """
+    for i, profile in enumerate(charging_profiles):
+        if (
+            profile.stack_level == charging_profile.stack_level
+            or profile.chargingprofileid == charging_profile.chargingprofileid
+        ):
+            charging_profiles[i] = charging_profile
+            return
+    charging_profiles.append(charging_profile)
+
+
+def applies_to(
+    charging_profile: AssignedChargingProfile, evse_id: int, connector_id: int
+) -> bool:
+    """Whether a charging profile applies to a connector
+
+    :param charging_profile:
+    :param evse_id: evse id, starting at 1
+    :param connector_id: connector id in the evse, starting at 1
+    """
+    return charging_profile.connector_0 or (
+        charging_profile.evse_id == evse_id
+        and charging_profile.connector_id == connector_id
+    )
+
+
+class ProfileIndex:
+    """Limits of the active charging profile of a connector, sorted by time
+
+    Built when the profiles of the charge point change. The limit at a time is
+    found by bisection and kept until the next period of the profile starts,
+    so the charging loops only pay for a lookup when the limit changes.
+    """
+
+    def __init__(
+        self,
+        charging_profiles: list[AssignedChargingProfile],
+        start_time: datetime,
+        voltage: int,
+        evse_id: int | None = None,
+        connector_id: int | None = None,
+    ):
+        """
+        :param charging_profiles: charging profiles of the charge point
+        :param start_time: start of the profile if it has no valid_from, usually
+            the start of the transaction
+        :param voltage: voltage in V, to convert limits in A
+        :param evse_id: evse id starting at 1, all the profiles apply if None
+        :param connector_id: connector id in the evse, starting at 1
+        """
+        self.start_time = start_time
+        if evse_id is not None:
+            charging_profiles = [
+                profile
+                for profile in charging_profiles
+                if applies_to(profile, evse_id, connector_id)
+            ]
+        self.valid_from = 0.0
+        self.starts: list[float] = []
+        self.limits: list[float] = []
+        self._since = self._until = 0.0
+        self._limit: float | None = None
+        if not charging_profiles:
+            return
+        profile = max(charging_profiles, key=lambda x: x.stack_level)
+        self.valid_from = _as_datetime(profile.valid_from or start_time).timestamp()
+        scale = (
+            1 if profile.charging_rate_unit == ChargingRateUnitType.watts else voltage
+        )
+        for period in sorted(
+            profile.charging_schedule_period, key=lambda x: x.start_period
+        ):
+            # the first period wins when several start at the same time
+            if self.starts and self.starts[-1] == period.start_period:
+                continue
+            self.starts.append(period.start_period)
+            self.limits.append(period.limit * scale / 1000)
+
+    def get_limit(self, now: datetime) -> float | None:
+        """Power limit in kW
+
+        :param now:
+        :return: power limit, None if no period of the profile is active
+        """
+        time = _as_datetime(now).timestamp()
+        if self._since <= time < self._until:
+            return self._limit
+        elapsed = time - self.valid_from
+        i = bisect.bisect_right(self.starts, elapsed) - 1
+        self._limit = self.limits[i] if i >= 0 else None
+        self._since = self.valid_from + self.starts[i] if i >= 0 else -math.inf
+        self._until = (
+            self.valid_from + self.starts[i + 1]
+            if i + 1 < len(self.starts)
+            else math.inf
+        )
+        return self._limit
+
+    def get_power(self, maximum_power: int, soc: float, now: datetime) -> int:
+        """Power delivered to the vehicle in kW
+
+        :param maximum_power: maximum power of the connector in kW
+        :param soc: state of charge in %
+        :param now:
+        :return: power
+        """
+        limit = self.get_limit(now)
+        if limit is not None:
+            return int(limit)
+        return maximum_power if soc < 100 else 0
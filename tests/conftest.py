@@ -0,0 +1,43 @@
+import copy
+import inspect
+
+import pytest
+
+from elu.twin.charge_point import requests
+
+
+@pytest.fixture
+def anyio_backend():
+    # async tests run with the anyio plugin, on the loop of the twins
+    return "asyncio"
+
+
+class FakePrivateApi:
+    """Requests of the twins to the private API, answered by a test"""
+
+    def __init__(self, monkeypatch: pytest.MonkeyPatch):
+        self.monkeypatch = monkeypatch
+        # payloads sent, copied when sent
+        self.calls: list = []
+
+    def reply(self, name: str, reply):
+        """Answer the calls to requests.<name>
+
+        :param name: request sending a single payload, e.g. consume_quotas
+        :param reply: called with the payload, its result is awaited if it
+            is awaitable and returned as the response
+        """
+
+        async def request(payload):
+            self.calls.append(copy.deepcopy(payload))
+            response = reply(payload)
+            if inspect.isawaitable(response):
+                response = await response
+            return response
+
+        self.monkeypatch.setattr(requests, name, request)
+
+
+@pytest.fixture
+def private_api(monkeypatch) -> FakePrivateApi:
+    return FakePrivateApi(monkeypatch)
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from elu.twin.charge_point.charge_point import charge_point_consumer
+from elu.twin.charge_point.load_test import LoadTestChargePoint
+from elu.twin.data.schemas.transaction import RedisRequestStartTransaction
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeSubscriber:
+    def __init__(self):
+        self.acks = []
+
+    def ack(self, ack_id):
+        self.acks.append(ack_id)
+
+
+@pytest.fixture
+def subscriber(monkeypatch):
+    subscriber = FakeSubscriber()
+    monkeypatch.setattr(
+        charge_point_consumer, "get_actions_subscriber", lambda: subscriber
+    )
+    return subscriber
+
+
+async def run_actions(cp: LoadTestChargePoint, *actions):
+    for action in actions:
+        cp.actions_queue.put_nowait(action)
+    task = asyncio.create_task(cp.process_actions())
+    try:
+        await asyncio.wait_for(cp.actions_queue.join(), 1)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+async def test_unknown_actions_are_done(subscriber):
+    cp = LoadTestChargePoint("LOADTEST-0", None)
+    await run_actions(cp, ("unknown", "1-0"))
+    assert subscriber.acks == ["1-0"]
+
+
+async def test_transactions_are_acknowledged_when_accepted(subscriber):
+    cp = LoadTestChargePoint("LOADTEST-0", None)
+    session = asyncio.Event()
+
+    async def start_transaction(**kwargs):
+        await session.wait()
+
+    cp.start_transaction = start_transaction
+    start = RedisRequestStartTransaction(transaction_id="t1")
+    await run_actions(cp, (start, "2-0"))
+    # acknowledged while the charging session goes on
+    assert subscriber.acks == ["2-0"]
+    session.set()
+    await asyncio.gather(*cp.actions_set)
+    assert subscriber.acks == ["2-0"]
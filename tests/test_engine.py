@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta, UTC
+
+import pytest
+from ocpp.v16.enums import (
+    ChargingProfileKindType,
+    ChargingProfilePurposeType,
+    ChargingRateUnitType,
+)
+
+from elu.twin.data.schemas.charge_point import OutputChargePoint
+from elu.twin.data.schemas.charging_profile import (
+    AssignedChargingProfile,
+    ChargingSchedulePeriod,
+)
+from elu.twin.data.schemas.connector import OutputConnector
+from elu.twin.data.schemas.evse import OutputEvse
+from elu.twin.data.schemas.vehicle import OutputVehicle
+from elu.twin.simulation.engine import Engine
+
+start = datetime(2024, 6, 1, tzinfo=UTC)
+
+
+def minutes(value: int) -> datetime:
+    return start + timedelta(minutes=value)
+
+
+def charge_point(index: str = "cp1") -> OutputChargePoint:
+    return OutputChargePoint(
+        id=index,
+        maximum_dc_power=60,
+        evses=[OutputEvse(evseid=1, connectors=[OutputConnector(connectorid=1)])],
+    )
+
+
+def vehicle(index: str, soc: float) -> OutputVehicle:
+    return OutputVehicle(id=index, name=index, battery_capacity=60, soc=soc)
+
+
+def test_session_charges_until_the_target_soc():
+    cp = charge_point()
+    v1, v2 = vehicle("v1", 50), vehicle("v2", 10)
+    engine = Engine([cp], start, meter_values_interval=600)
+    engine.add_session("cp1", 1, 1, v1, arrival=minutes(0), target_soc=80)
+    # the connector is occupied
+    engine.add_session("cp1", 1, 1, v2, arrival=minutes(5))
+    result = engine.run()
+
+    assert result.meter_values[["time", "power", "energy", "soc"]].values.tolist() == [
+        [minutes(0), 60, 0, 50],
+        [minutes(10), 60, 10000, 66],
+        [minutes(20), 60, 20000, 83],
+    ]
+    transactions = result.transactions.set_index("transactionid")
+    assert transactions["status"].tolist() == ["Completed", "Rejected"]
+    assert transactions.loc[1, "stop_time"] == minutes(20)
+    assert transactions.loc[2, "stop_time"] == minutes(5)
+    assert v1.soc == pytest.approx(250 / 3)
+    assert v2.soc == 10
+    connector = cp.evses[0].connectors[0]
+    assert connector.total_energy == 20000
+    assert connector.transactionid is None
+
+
+def test_charging_profile_limits_the_power_from_when_it_is_set():
+    cp = charge_point()
+    engine = Engine([cp], start, meter_values_interval=600)
+    engine.add_session(
+        "cp1", 1, 1, vehicle("v1", 10), arrival=minutes(0), departure=minutes(30)
+    )
+    engine.add_charging_profile(
+        "cp1",
+        AssignedChargingProfile(
+            chargingprofileid=1,
+            stack_level=0,
+            charging_profile_purpose=ChargingProfilePurposeType.tx_default_profile,
+            charging_profile_kind=ChargingProfileKindType.absolute,
+            charging_rate_unit=ChargingRateUnitType.watts,
+            valid_from=minutes(0).isoformat(),
+            charging_schedule_period=[
+                ChargingSchedulePeriod(start_period=0, limit=36000)
+            ],
+        ),
+        time=minutes(10),
+    )
+    result = engine.run()
+
+    assert result.meter_values["power"].tolist() == [60, 36, 36]
+    # 10 min at 60 kW and 20 min at 36 kW
+    assert result.transactions["energy"].tolist() == [10000 + 12000]
+    assert cp.charging_profiles[0].chargingprofileid == 1
+
+
+def test_run_until_reads_the_running_sessions():
+    cp = charge_point()
+    engine = Engine([cp], start, meter_values_interval=600)
+    engine.add_session(
+        "cp1", 1, 1, vehicle("v1", 10), arrival=minutes(0), departure=minutes(60)
+    )
+    result = engine.run(until=minutes(15))
+    assert result.transactions["status"].tolist() == ["Charging"]
+    assert result.transactions["energy"].tolist() == [15000]
+    assert cp.evses[0].connectors[0].current_energy == 15000
+    assert len(result.meter_values) == 2
+
+    result = engine.run()
+    assert result.transactions["status"].tolist() == ["Completed"]
+    # full before the departure, 54 kWh from 10%
+    assert result.transactions["energy"].tolist() == [54000]
+    assert result.transactions["soc"].tolist() == [100]
+    with pytest.raises(ValueError):
+        engine.add_session("cp1", 2, 1, vehicle("v2", 10), arrival=minutes(0))
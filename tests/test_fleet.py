@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from elu.twin.simulation.fleet import ConnectorState, FleetState
+
+
+def test_energy_and_soc_are_integrated_until_the_battery_is_full():
+    fleet = FleetState(capacity=4)
+    slot = fleet.start(0, initial_soc=50, battery=60, total_energy=1000)
+    fleet.set_power(slot, 60, 0)
+    fleet.advance(600)
+    assert fleet.read(slot) == ConnectorState(
+        power=60, current_energy=10000, total_energy=11000, soc=pytest.approx(200 / 3)
+    )
+    # 30 kWh to charge from 50%, reached after 1800 s
+    fleet.advance(3600)
+    assert fleet.read(slot) == ConnectorState(
+        power=60, current_energy=30000, total_energy=31000, soc=100
+    )
+
+
+def test_power_change_integrates_the_previous_power():
+    fleet = FleetState(capacity=4, step=10)
+    slot = fleet.start(0, initial_soc=0, battery=100)
+    fleet.set_power(slot, 36, 0)
+    fleet.set_power(slot, 72, 100)
+    assert fleet.current_energy[slot] == 1000
+    # at most one step every 10 s
+    fleet.sync(105)
+    fleet.sync(110)
+    assert fleet.current_energy[slot] == 1000 + 72 * 5 / 3.6
+    fleet.sync(115)
+    assert fleet.current_energy[slot] == 1000 + 72 * 15 / 3.6
+
+
+def test_slots_are_reused_and_grow():
+    fleet = FleetState(capacity=2)
+    slots = [fleet.start(0, initial_soc=10, battery=50) for _ in range(3)]
+    assert slots == [0, 1, 2]
+    assert len(fleet.active) == 4
+    assert len(fleet) == 3
+    fleet.set_power(1, 50, 0)
+    state = fleet.stop(1, 360)
+    assert state.current_energy == 5000
+    assert fleet.power[1] == 0
+    assert len(fleet) == 2
+    assert fleet.start(360, initial_soc=20, battery=50) == 1
+    assert fleet.read(1) == ConnectorState(0, 0, 0, 20)
+    assert np.array_equal(np.flatnonzero(fleet.active), [0, 1, 2])
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from elu.twin.charge_point.latency import LatencyRecorder
+from elu.twin.data.enums import CallOutcome
+
+
+def test_summary_percentiles_and_outcomes():
+    recorder = LatencyRecorder()
+    for latency in range(1, 101):
+        recorder.record("Heartbeat", latency / 1000, CallOutcome.ok)
+    recorder.record("Heartbeat", 0.5, CallOutcome.error)
+    recorder.record("MeterValues", 30, CallOutcome.timeout)
+    recorder.stop()
+
+    summary = recorder.summary()
+    heartbeat = summary.loc["Heartbeat"]
+    assert (heartbeat["count"], heartbeat["ok"], heartbeat["errors"]) == (101, 100, 1)
+    assert heartbeat["p50_ms"] == pytest.approx(51)
+    assert heartbeat["max_ms"] == pytest.approx(500)
+    # timeouts are counted without latency
+    assert summary.loc["MeterValues", "timeouts"] == 1
+    assert summary.loc["total", "count"] == 102
+    assert sum(recorder.histogram()) == 101
+
+
+def test_measure_records_suppressed_call_error():
+    recorder = LatencyRecorder()
+
+    async def response(value):
+        return value
+
+    async def timeout():
+        raise asyncio.TimeoutError
+
+    async def main():
+        assert await recorder.measure("Authorize", response("accepted")) == "accepted"
+        assert await recorder.measure("Authorize", response(None)) is None
+        with pytest.raises(asyncio.TimeoutError):
+            await recorder.measure("Authorize", timeout())
+
+    asyncio.run(main())
+    assert recorder.outcomes == {
+        ("Authorize", CallOutcome.ok): 1,
+        ("Authorize", CallOutcome.error): 1,
+        ("Authorize", CallOutcome.timeout): 1,
+    }
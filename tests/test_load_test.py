@@ -0,0 +1,77 @@
+import asyncio
+import json
+
+import pytest
+
+from elu.twin.charge_point.latency import LatencyRecorder
+from elu.twin.charge_point.load_test import LoadTestChargePoint
+from elu.twin.data.enums import CallOutcome
+
+pytestmark = pytest.mark.anyio
+
+NOW = "2024-06-01T00:00:00+00:00"
+ID_TAG_INFO = {"idTagInfo": {"status": "Accepted"}}
+RESPONSES = {
+    "BootNotification": {"currentTime": NOW, "interval": 60, "status": "Accepted"},
+    "Heartbeat": {"currentTime": NOW},
+    "Authorize": ID_TAG_INFO,
+    "StartTransaction": {"transactionId": 7, **ID_TAG_INFO},
+    "StopTransaction": {},
+    "MeterValues": {},
+}
+
+
+class FakeCsms:
+    """Websocket of a twin answering its calls as a CSMS"""
+
+    def __init__(self):
+        self.actions: list[str] = []
+        self.received: asyncio.Queue = asyncio.Queue()
+
+    async def send(self, message: str):
+        _, unique_id, action, _ = json.loads(message)
+        self.actions.append(action)
+        await self.received.put(json.dumps([3, unique_id, RESPONSES[action]]))
+
+    async def recv(self) -> str:
+        return await self.received.get()
+
+
+def test_load_test_twin_can_be_created():
+    cp = LoadTestChargePoint("LOADTEST-0", None)
+    assert cp.get_connection_processes() == cp.get_session_processes() == []
+
+
+async def test_send_follows_the_transaction_of_the_twin():
+    csms = FakeCsms()
+    cp = LoadTestChargePoint("LOADTEST-0", csms, response_timeout=1)
+    cp.latency_recorder = LatencyRecorder()
+    reader = asyncio.create_task(cp.start())
+    try:
+        for action in (
+            "boot_notification",
+            "stop_transaction",
+            "meter_values",
+            "start_transaction",
+            "heartbeat",
+            "authorize",
+        ):
+            await cp.send(action)
+    finally:
+        reader.cancel()
+
+    # a stop without transaction is sent as a start, and the other way round
+    assert csms.actions == [
+        "BootNotification",
+        "StartTransaction",
+        "MeterValues",
+        "StopTransaction",
+        "Heartbeat",
+        "Authorize",
+    ]
+    assert cp.transaction_id is None
+    assert cp.meter == 100
+    assert sum(cp.latency_recorder.outcomes.values()) == 6
+    assert set(outcome for _, outcome in cp.latency_recorder.outcomes) == {
+        CallOutcome.ok
+    }
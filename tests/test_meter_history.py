@@ -0,0 +1,33 @@
+import pytest
+
+from elu.twin.charge_point.meter_history import MeterValueBuffer
+from elu.twin.data.schemas.meter_value import OutputMeterValueBatch
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_meter_values_are_kept_until_sent(private_api):
+    private_api.reply(
+        "add_meter_values",
+        lambda batch: (
+            None
+            if len(private_api.calls) <= 2
+            else OutputMeterValueBatch(inserted=len(batch))
+        ),
+    )
+    buffer = MeterValueBuffer(flush_interval=3600, batch_size=100, max_pending=3)
+    for timestamp in range(2):
+        buffer.append(timestamp, "cp", "c1", transaction_id="t1", power=11.0)
+    # put back after a failed request
+    await buffer.flush()
+    assert len(buffer) == 2
+    for timestamp in range(2, 4):
+        buffer.append(timestamp, "cp", "c1", transaction_id="t1", power=11.0)
+    await buffer.flush()
+    assert len(buffer) == 3
+    await buffer.close()
+
+    assert not len(buffer)
+    # the oldest meter value was dropped beyond max_pending
+    assert private_api.calls[-1].timestamp == [1, 2, 3]
+    assert private_api.calls[-1].power == [11.0] * 3
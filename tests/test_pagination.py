@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, create_engine, select
+
+from elu.twin.backend.crud.pagination import (
+    DEFAULT_LIMIT,
+    decode_cursor,
+    encode_cursor,
+    get_fields,
+    paginate,
+)
+from elu.twin.data.schemas.charge_point import OutputChargePoint
+from elu.twin.data.tables import Quota
+
+
+def test_cursor_round_trip():
+    key = (datetime(2024, 6, 1, 12, 30, 5, 123456), "8f3a")
+    assert decode_cursor(encode_cursor(*key)) == key
+    with pytest.raises(HTTPException) as error:
+        decode_cursor("not a cursor")
+    assert error.value.status_code == 400
+
+
+def test_fields():
+    assert get_fields(OutputChargePoint, None) is None
+    assert get_fields(OutputChargePoint, ["name,status", "evses"]) == {
+        "id",
+        "name",
+        "status",
+        "evses",
+    }
+    with pytest.raises(HTTPException) as error:
+        get_fields(OutputChargePoint, ["name", "password_hash"])
+    assert error.value.detail == "Unknown fields: password_hash"
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Quota.metadata.create_all(engine, tables=[Quota.__table__])
+    with Session(engine) as session:
+        start = datetime(2024, 6, 1)
+        session.add_all(
+            Quota(id=f"q{i:03}", created_at=start + timedelta(minutes=i))
+            for i in range(DEFAULT_LIMIT + 5)
+        )
+        session.commit()
+        yield session
+
+
+def test_paginate(session):
+    key = (Quota.created_at, Quota.id)
+    rows, cursor = paginate(session, select(Quota), key, None, None)
+    assert len(rows) == DEFAULT_LIMIT + 5
+    assert cursor is None
+    rows, cursor = paginate(session, select(Quota), key, None, 2)
+    assert [row.id for row in rows] == ["q000", "q001"]
+    rows, cursor = paginate(session, select(Quota), key, cursor, None)
+    assert len(rows) == DEFAULT_LIMIT
+    assert rows[0].id == "q002"
+    rows, cursor = paginate(session, select(Quota), key, cursor, None)
+    assert [row.id for row in rows] == ["q102", "q103", "q104"]
+    assert cursor is None
@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta, UTC
+
+from ocpp.v16.enums import (
+    ChargingProfileKindType,
+    ChargingProfilePurposeType,
+    ChargingRateUnitType,
+)
+
+from elu.twin.data.schemas.charging_profile import (
+    AssignedChargingProfile,
+    ChargingSchedulePeriod,
+)
+from elu.twin.simulation.physics import ProfileIndex, add_charging_profile
+
+start = datetime(2024, 6, 1, tzinfo=UTC)
+
+
+def profile(
+    chargingprofileid: int,
+    stack_level: int,
+    periods: list[tuple[int, float]],
+    unit: ChargingRateUnitType = ChargingRateUnitType.watts,
+    **kwargs,
+) -> AssignedChargingProfile:
+    return AssignedChargingProfile(
+        chargingprofileid=chargingprofileid,
+        stack_level=stack_level,
+        charging_profile_purpose=ChargingProfilePurposeType.tx_default_profile,
+        charging_profile_kind=ChargingProfileKindType.absolute,
+        charging_rate_unit=unit,
+        charging_schedule_period=[
+            ChargingSchedulePeriod(start_period=start_period, limit=limit)
+            for start_period, limit in periods
+        ],
+        **kwargs,
+    )
+
+
+def seconds(value: int) -> datetime:
+    return start + timedelta(seconds=value)
+
+
+def test_limit_of_each_period():
+    index = ProfileIndex(
+        [profile(1, 0, [(600, 7000), (0, 11000), (600, 3000), (1800, 22000)])],
+        start_time=start,
+        voltage=400,
+    )
+    assert index.get_limit(seconds(-1)) is None
+    assert index.get_limit(seconds(0)) == 11
+    assert index.get_limit(seconds(599)) == 11
+    # the first period wins when several start at the same time
+    assert index.get_limit(seconds(600)) == 7
+    assert index.get_limit(seconds(1200)) == 7
+    assert index.get_limit(seconds(1800)) == 22
+    assert index.get_limit(seconds(86400)) == 22
+    # back in time, the cached period is not used
+    assert index.get_limit(seconds(10)) == 11
+
+
+def test_profile_of_the_connector_with_the_highest_stack_level():
+    profiles = [
+        profile(1, 0, [(0, 11000)]),
+        profile(2, 1, [(0, 16)], unit=ChargingRateUnitType.amps),
+        profile(3, 2, [(0, 2000)], connector_0=False, evse_id=1, connector_id=2),
+    ]
+    index = ProfileIndex(
+        profiles, start_time=start, voltage=400, evse_id=1, connector_id=1
+    )
+    assert index.get_limit(start) == 6.4
+    index = ProfileIndex(
+        profiles, start_time=start, voltage=400, evse_id=1, connector_id=2
+    )
+    assert index.get_limit(start) == 2
+    assert index.get_power(60, 50, start) == 2
+
+
+def test_valid_from_and_power_without_limit():
+    index = ProfileIndex(
+        [profile(1, 0, [(0, 11000)], valid_from="2024-06-01T01:00:00Z")],
+        start_time=start,
+        voltage=400,
+    )
+    assert index.get_power(60, 50, seconds(0)) == 60
+    assert index.get_power(60, 100, seconds(0)) == 0
+    assert index.get_power(60, 50, seconds(3600)) == 11
+    assert ProfileIndex([], start_time=start, voltage=400).get_limit(start) is None
+
+
+def test_add_charging_profile_replaces_same_id_or_stack_level():
+    profiles = [profile(1, 0, [(0, 11000)]), profile(2, 1, [(0, 7000)])]
+    add_charging_profile(profiles, profile(1, 5, [(0, 3000)]))
+    add_charging_profile(profiles, profile(3, 1, [(0, 2000)]))
+    add_charging_profile(profiles, profile(4, 2, [(0, 1000)]))
+    assert [(p.chargingprofileid, p.stack_level) for p in profiles] == [
+        (1, 5),
+        (3, 1),
+        (4, 2),
+    ]
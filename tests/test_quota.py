@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from elu.twin.backend.routes.v1.private.quota import consume_quotas
+from elu.twin.charge_point.quota import QuotaAccountant
+from elu.twin.data.schemas.quota import OutputQuotaBalance, QuotaConsumption
+from elu.twin.data.tables import Quota
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_consumption_is_flushed_in_bulk(private_api):
+    balances = {"q1": 100, "q2": 10}
+    private_api.reply(
+        "consume_quotas",
+        lambda consumed: (
+            None
+            if len(private_api.calls) == 1
+            else [
+                OutputQuotaBalance(id=index, available_tokens=balances[index] - tokens)
+                for index, tokens in consumed.items()
+            ]
+        ),
+    )
+    accountant = QuotaAccountant(flush_interval=3600)
+    for _ in range(3):
+        accountant.consume("q1", 5)
+        accountant.consume("q2", 5)
+    accountant.consume(None, 5)
+    assert accountant.get_available_tokens("q1") is None
+    # kept after a failed request
+    await accountant.flush()
+    assert accountant.consumed == {"q1": 15, "q2": 15}
+    await accountant.close()
+
+    assert private_api.calls == [{"q1": 15, "q2": 15}] * 2
+    assert accountant.get_available_tokens("q1") == 85
+    assert not accountant.is_exhausted("q1")
+    assert accountant.is_exhausted("q2")
+
+
+async def test_cancelled_flush_keeps_its_batch(private_api):
+    private_api.reply("consume_quotas", lambda consumed: asyncio.sleep(3600))
+    accountant = QuotaAccountant(flush_interval=3600)
+    accountant.consume("q1", 5)
+    flush = asyncio.create_task(accountant.flush())
+    await asyncio.sleep(0)
+    accountant.consume("q1", 1)
+    flush.cancel()
+    await asyncio.gather(flush, return_exceptions=True)
+    assert accountant.consumed == {"q1": 6}
+
+
+@pytest.fixture
+async def sqlite_session():
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as connection:
+        await connection.run_sync(Quota.metadata.create_all, tables=[Quota.__table__])
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        yield session
+    await engine.dispose()
+
+
+async def test_consume_quotas_route(sqlite_session):
+    sqlite_session.add_all(
+        [Quota(id="q1", available_tokens=100), Quota(id="q2", available_tokens=10)]
+    )
+    await sqlite_session.commit()
+    balances = await consume_quotas(
+        session=sqlite_session,
+        consumptions=[
+            QuotaConsumption(id="q2", consumed=15),
+            QuotaConsumption(id="q1", consumed=5),
+            QuotaConsumption(id="q1", consumed=10),
+            QuotaConsumption(id="missing", consumed=1),
+        ],
+    )
+    assert balances == [
+        OutputQuotaBalance(id="q1", available_tokens=85),
+        OutputQuotaBalance(id="q2", available_tokens=-5),
+    ]
+    assert (await sqlite_session.get(Quota, "q1")).available_tokens == 85
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta, UTC
+
+from elu.twin.data.schemas.schedule import Interval, Schedule, merge_intervals
+
+
+start = datetime(2024, 1, 1, tzinfo=UTC)
+
+
+def minutes(value: int) -> datetime:
+    return start + timedelta(minutes=value)
+
+
+def interval(begin: int, end: int, value: float, stack_level: int):
+    return minutes(begin), minutes(end), value, stack_level
+
+
+def test_merge_intervals_highest_stack_level_wins():
+    merged = merge_intervals(
+        [
+            interval(0, 60, 11000, 0),
+            interval(10, 20, 3000, 1),
+            interval(40, 90, 7000, 2),
+        ]
+    )
+    assert merged == [
+        interval(0, 10, 11000, 0),
+        interval(10, 20, 3000, 1),
+        interval(20, 40, 11000, 0),
+        interval(40, 90, 7000, 2),
+    ]
+
+
+def test_merge_intervals_equal_stack_level_latest_start_wins():
+    merged = merge_intervals([interval(10, 30, 2000, 0), interval(0, 20, 1000, 0)])
+    assert merged == [
+        interval(0, 10, 1000, 0),
+        interval(10, 30, 2000, 0),
+    ]
+
+
+def test_merge_intervals_keeps_gaps_and_drops_empty_intervals():
+    merged = merge_intervals(
+        [interval(0, 10, 1000, 0), interval(5, 5, 9000, 3), interval(20, 30, 2000, 0)]
+    )
+    assert merged == [interval(0, 10, 1000, 0), interval(20, 30, 2000, 0)]
+
+
+def test_schedule_add_interval():
+    schedule = Schedule()
+    schedule.add_interval(
+        Interval(start_time=minutes(0), end_time=minutes(60), value=10, stack_level=0)
+    )
+    schedule.add_interval(
+        Interval(start_time=minutes(30), end_time=minutes(90), value=5, stack_level=1)
+    )
+    assert [(p.start_period, p.limit) for p in schedule.to_periods()] == [
+        (0, 10),
+        (1800, 5),
+    ]
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+from ocpp.v16.enums import ChargePointStatus
+
+from elu.twin.charge_point.state_buffer import StateBuffer
+from elu.twin.data.enums import ConnectorStatus, TransactionStatus
+from elu.twin.data.schemas.twin_state import OutputTwinStateDelta
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_flushes_are_sent_in_order(private_api):
+    applied = []
+
+    async def update_twin_state(delta):
+        # the first request is slower than the second one
+        await asyncio.sleep(0.01 if len(private_api.calls) == 1 else 0)
+        applied.append(delta)
+        return OutputTwinStateDelta()
+
+    private_api.reply("update_twin_state", update_twin_state)
+    buffer = StateBuffer(flush_interval=3600)
+    buffer.update_charge_point("cp1", status=ChargePointStatus.available)
+    buffer.update_connector("c1", status=ConnectorStatus.charging)
+    first = asyncio.create_task(buffer.flush())
+    await asyncio.sleep(0)
+    buffer.update_connector("c1", status=ConnectorStatus.unavailable)
+    await asyncio.gather(first, buffer.flush())
+    await buffer.close()
+
+    assert [
+        [(item.id, item.status) for item in delta.charge_points + delta.connectors]
+        for delta in applied
+    ] == [
+        [("cp1", ChargePointStatus.available), ("c1", ConnectorStatus.charging)],
+        [("c1", ConnectorStatus.unavailable)],
+    ]
+
+
+async def test_cancelled_flush_keeps_its_updates(private_api):
+    private_api.reply("update_twin_state", lambda delta: asyncio.sleep(3600))
+    buffer = StateBuffer(flush_interval=3600)
+    buffer.update_transaction("t1", status=TransactionStatus.accepted, energy=1)
+    flush = asyncio.create_task(buffer.flush())
+    await asyncio.sleep(0)
+    buffer.update_transaction("t1", energy=2)
+    flush.cancel()
+    await asyncio.gather(flush, return_exceptions=True)
+    assert buffer.deltas["transactions"] == {
+        "t1": {"status": TransactionStatus.accepted, "energy": 2}
+    }
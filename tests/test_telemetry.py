@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from elu.twin.backend.telemetry import TelemetrySubscription
+from elu.twin.charge_point.telemetry import TelemetryPublisher
+
+
+@pytest.mark.anyio
+async def test_events_are_coalesced_per_object():
+    publisher = TelemetryPublisher(interval=3600)
+    for power in range(3):
+        publisher.update("u1", "connector", "c1", "cp1", power=power)
+    publisher.update("u1", "connector", "c1", "cp1", status="Charging")
+    publisher.update("u1", "vehicle", "v1", "cp2", soc=40)
+    publisher.update(None, "connector", "c2", "cp2", power=1)
+    messages = publisher.pop_messages()
+    await publisher.close()
+
+    assert list(messages) == ["telemetry-u1"]
+    events = json.loads(messages["telemetry-u1"])
+    for event in events:
+        del event["timestamp"]
+    assert events == [
+        {
+            "kind": "connector",
+            "id": "c1",
+            "charge_point_id": "cp1",
+            "power": 2,
+            "status": "Charging",
+        },
+        {"kind": "vehicle", "id": "v1", "charge_point_id": "cp2", "soc": 40},
+    ]
+
+
+@pytest.mark.anyio
+async def test_subscription_filters_and_merges():
+    publisher = TelemetryPublisher()
+    publisher.events = {
+        "u1": {
+            ("connector", "c1"): {
+                "kind": "connector",
+                "id": "c1",
+                "charge_point_id": "cp1",
+                "power": 2,
+            }
+        }
+    }
+    events = json.loads(publisher.pop_messages()["telemetry-u1"])
+    subscription = TelemetrySubscription(vehicle_ids=["v1"], kinds=["vehicle"])
+    subscription.push(events)
+    assert not subscription.pending
+    subscription = TelemetrySubscription(charge_point_ids=["cp1"], vehicle_ids=["v1"])
+    subscription.push(events)
+    subscription.push(
+        [
+            {"kind": "connector", "id": "c1", "charge_point_id": "cp1", "soc": 50},
+            {"kind": "vehicle", "id": "v1", "charge_point_id": "cp2", "soc": 50},
+            {"kind": "vehicle", "id": "v2", "charge_point_id": "cp2", "soc": 10},
+        ]
+    )
+    batch = await subscription.get(interval=0, timeout=1)
+    assert batch == [
+        {
+            "kind": "connector",
+            "id": "c1",
+            "charge_point_id": "cp1",
+            "power": 2,
+            "soc": 50,
+        },
+        {"kind": "vehicle", "id": "v1", "charge_point_id": "cp2", "soc": 50},
+    ]
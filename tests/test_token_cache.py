@@ -0,0 +1,27 @@
+import time
+
+from elu.twin.backend.security.token_cache import TokenCache
+from elu.twin.data.tables import User
+
+
+def test_token_cache_expiry_size_and_invalidation():
+    alice = User(id="alice", username="alice@elu.com", hashed_password="")
+    bob = User(id="bob", username="bob@elu.com", hashed_password="")
+    cache = TokenCache(maxsize=3, ttl=60)
+    cache.put("a1", alice)
+    cache.put("a2", alice, app_token_id="t2")
+    cache.put("b1", bob, app_token_id="t3")
+    assert cache.get("a1") is alice
+
+    # expires with the token
+    cache.put("b2", bob, expires_at=time.time() - 1)
+    assert cache.get("b2") is None
+    # a2 was the least recently used
+    assert cache.get("a2") is None
+    assert cache.get("b1") is bob
+
+    assert cache.invalidate(app_token_id="t3") == 1
+    assert cache.get("b1") is None
+    cache.put("a2", alice, app_token_id="t2")
+    assert cache.invalidate(user_id="alice") == 2
+    assert len(cache) == 0